@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Bounded storage for anonymous (not logged in) sessions in app.py.
+Each visitor's progress is held in a small __slots__ record with integer
+timestamps and card lists packed into integer arrays. The store evicts
+sessions idle longer than the TTL and, past its memory budget, the least
+recently used ones, so crawlers and busy landing pages can't grow it
+without limit.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+DECK_FILE = Path(__file__).parent / 'flashcards.json'
+
+# Approximate memory anonymous sessions may use before the least recently used are evicted
+ANON_SESSION_MEMORY_MB = float(os.environ.get('ANON_SESSION_MEMORY_MB', 64))
+
+# Anonymous sessions unused for this long expire
+ANON_SESSION_TTL_DAYS = float(os.environ.get('ANON_SESSION_TTL_DAYS', 7))
+
+# Card IDs are stored as their position in the deck (unsigned 16-bit), so decks are limited to this size
+CARD_TYPECODE = 'H'
+MAX_CARD_IDS = 1 << 16
+
+DEFAULT_PREFERENCES = {
+    "theme": "dark",
+    "auto_play_audio": True,
+    "show_pronunciation": True,
+    "cards_per_session": 20,
+    "last_card_index": 0
+}
+
+COUNTERS = ("total_sessions", "total_cards_learned", "streak_days")
+
+
+class AnonymousSession:
+    """One anonymous visitor's progress. Times are Unix seconds, dates are ordinals."""
+
+    __slots__ = ("last_seen", "known", "learning", "total_sessions", "total_cards_learned",
+                 "streak_days", "last_session_day", "preferences")
+
+    def __init__(self, now: int):
+        self.last_seen = now
+        self.known = array(CARD_TYPECODE)
+        self.learning = array(CARD_TYPECODE)
+        self.total_sessions = 1
+        self.total_cards_learned = 0
+        self.streak_days = 1
+        self.last_session_day = date.fromtimestamp(now).toordinal()
+        self.preferences = None  # Only set once they differ from DEFAULT_PREFERENCES
+
+
+# Memory for a fresh session: the record, its arrays and ints, its token and its slot in the store
+ENTRY_BYTES = (sys.getsizeof(AnonymousSession(int(time.time())))
+               + 2 * sys.getsizeof(array(CARD_TYPECODE))
+               + 2 * sys.getsizeof(int(time.time()))
+               + sys.getsizeof('')
+               + 100)
+PREFERENCES_BYTES = sys.getsizeof(dict(DEFAULT_PREFERENCES))
+
+
+def load_deck_ids(deck_file: Path = DECK_FILE) -> List[str]:
+    """Card IDs in deck order."""
+    with open(deck_file, 'r', encoding='utf-8') as f:
+        return [card['id'] for card in json.load(f)]
+
+
+class AnonymousSessionStore:
+    """Anonymous sessions by token in least recently used order, within a memory budget.
+
+    Progress may only name cards from the deck (read once, at startup), so
+    the card table is fixed and visitors can't grow it.
+    """
+
+    def __init__(self, memory_budget: int = int(ANON_SESSION_MEMORY_MB * 1024 * 1024),
+                 ttl: int = int(ANON_SESSION_TTL_DAYS * 86400), card_ids: Optional[Iterable[str]] = None):
+        self.memory_budget = memory_budget
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # Token -> AnonymousSession, least recently used first
+        self._bytes = 0
+        self._card_ids = list(dict.fromkeys(load_deck_ids() if card_ids is None else card_ids))  # Number -> card ID
+        if len(self._card_ids) > MAX_CARD_IDS:
+            raise ValueError(f"Anonymous sessions support decks of up to {MAX_CARD_IDS} cards")
+        self._card_numbers = {card_id: number for number, card_id in enumerate(self._card_ids)}  # Card ID -> number
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _cost(token: str, session: AnonymousSession) -> int:
+        """Approximate bytes held for one session."""
+        cost = ENTRY_BYTES + len(token) + session.known.itemsize * (len(session.known) + len(session.learning))
+        if session.preferences is not None:
+            cost += PREFERENCES_BYTES
+        return cost
+
+    def _discard(self, token: str) -> Optional[AnonymousSession]:
+        session = self._sessions.pop(token, None)
+        if session is not None:
+            self._bytes -= self._cost(token, session)
+        return session
+
+    def _evict(self, now: int):
+        """Drop expired sessions, then least recently used ones until within the memory budget.
+
+        Use refreshes a session's expiry and moves it to the end, so the
+        oldest entries are always the first to expire.
+        """
+        while self._sessions:
+            token, session = next(iter(self._sessions.items()))
+            if session.last_seen + self.ttl <= now:
+                self.expirations += 1
+            elif self._bytes > self.memory_budget:
+                self.evictions += 1
+            else:
+                return
+            self._discard(token)
+
+    def _touch(self, token: str, now: int) -> Optional[AnonymousSession]:
+        """A live session, marked as just used; expired sessions are removed."""
+        session = self._sessions.get(token)
+        if session is None:
+            return None
+        if session.last_seen + self.ttl <= now:
+            self._discard(token)
+            self.expirations += 1
+            return None
+        session.last_seen = now
+        self._sessions.move_to_end(token)
+        return session
+
+    def _numbers(self, card_ids: Iterable) -> array:
+        """Card IDs as an array of deck numbers, without repeats.
+
+        Raises ValueError for anything that isn't a card in the deck.
+        """
+        numbers = array(CARD_TYPECODE)
+        seen = set()
+        for card_id in card_ids:
+            number = self._card_numbers.get(card_id) if isinstance(card_id, str) else None
+            if number is None:
+                raise ValueError(f"Unknown card ID: {str(card_id)[:40]}")
+            if number not in seen:
+                seen.add(number)
+                numbers.append(number)
+        return numbers
+
+    def _progress(self, session: AnonymousSession) -> Dict:
+        """A session's progress in the same shape as a user's."""
+        return {
+            "known_cards": [self._card_ids[number] for number in session.known],
+            "learning_cards": [self._card_ids[number] for number in session.learning],
+            "total_sessions": session.total_sessions,
+            "total_cards_learned": session.total_cards_learned,
+            "streak_days": session.streak_days,
+            "last_session_date": date.fromordinal(session.last_session_day).isoformat(),
+            "preferences": dict(session.preferences or DEFAULT_PREFERENCES)
+        }
+
+    def create(self, token: str, now: Optional[int] = None) -> Dict:
+        """Start a session with default progress, evicting others if needed; returns its progress."""
+        now = now or int(time.time())
+        session = AnonymousSession(now)
+        with self._lock:
+            self._discard(token)
+            self._sessions[token] = session
+            self._bytes += self._cost(token, session)
+            self._evict(now)
+            return self._progress(session)
+
+    def exists(self, token: str, now: Optional[int] = None) -> bool:
+        with self._lock:
+            return self._touch(token, now or int(time.time())) is not None
+
+    def progress(self, token: str, now: Optional[int] = None) -> Optional[Dict]:
+        """A live session's progress, or None."""
+        with self._lock:
+            session = self._touch(token, now or int(time.time()))
+            return self._progress(session) if session is not None else None
+
+    def update(self, token: str, progress_data: Dict, now: Optional[int] = None) -> bool:
+        """Merge saved progress into a live session; False if there is no such session.
+
+        Only the fields of the default progress are kept; preferences are
+        merged over the defaults. Raises ValueError, changing nothing, if
+        the card lists name cards that aren't in the deck.
+        """
+        now = now or int(time.time())
+        with self._lock:
+            session = self._touch(token, now)
+            if session is None:
+                return False
+            known, learning = (
+                self._numbers(progress_data[key]) if isinstance(progress_data.get(key), list) else None
+                for key in ("known_cards", "learning_cards")
+            )
+            self._bytes -= self._cost(token, session)
+            if known is not None:
+                session.known = known
+            if learning is not None:
+                session.learning = learning
+            for key, value in progress_data.items():
+                if key in COUNTERS and isinstance(value, int):
+                    setattr(session, key, value)
+                elif key == "last_session_date" and isinstance(value, str):
+                    try:
+                        session.last_session_day = date.fromisoformat(value).toordinal()
+                    except ValueError:
+                        pass
+                elif key == "preferences" and isinstance(value, dict):
+                    preferences = dict(DEFAULT_PREFERENCES)
+                    preferences.update((name, value[name]) for name in DEFAULT_PREFERENCES if name in value)
+                    session.preferences = preferences if preferences != DEFAULT_PREFERENCES else None
+            self._bytes += self._cost(token, session)
+            self._evict(now)
+            return True
+
+    def pop(self, token: str) -> Optional[Dict]:
+        """Remove a session, returning its progress if it existed."""
+        with self._lock:
+            session = self._discard(token)
+            return self._progress(session) if session is not None else None
+
+    def sweep(self, now: Optional[int] = None) -> int:
+        """Remove expired sessions (and any over the budget); returns how many were removed."""
+        with self._lock:
+            before = len(self._sessions)
+            self._evict(now or int(time.time()))
+            return before - len(self._sessions)
+
+    def stats(self) -> Dict:
+        """Session count, approximate bytes used and eviction counters."""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self._bytes,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+    def __len__(self):
+        return len(self._sessions)
@@ -7,21 +7,121 @@ Includes user management API endpoints.
 import json
 import os
 import sys
+import threading
 import webbrowser
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import urlparse, parse_qs, unquote
 import http.server
-import socketserver
 from user_manager import user_manager
+from static_assets import StaticAssets, etag_matches
+from media_files import MEDIA_CACHE_CONTROL, MediaFiles, RangeNotSatisfiable, if_range_matches, parse_range
+from serialization import JSON_CONTENT_TYPE, encode_body
+from metrics import PROMETHEUS_CONTENT_TYPE, MetricsRegistry, metrics_access
+from profiling import RequestProfiler
+from user_catalog import parse_list_params
 
 # Configuration
 PORT = 8000
 DIRECTORY = Path(__file__).parent
 
+# Requests handled at once (1 serves one connection at a time, as before)
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', 16))
+
+# Seconds a connection may sit idle mid-request before it is dropped (0 waits forever)
+REQUEST_TIMEOUT = float(os.environ.get('REQUEST_TIMEOUT', 30))
+
+# Usernames allowed to use the admin API, comma-separated
+ADMIN_USERNAMES = {name.strip() for name in os.environ.get('ADMIN_USERNAMES', '').split(',') if name.strip()}
+
+# Fingerprinted, precompressed front-end files (see static_assets.py)
+static_assets = StaticAssets()
+
+# Audio and image files, with a cached stat table
+media_files = MediaFiles()
+
+# Per-route request metrics for this process, served at /metrics
+metrics = MetricsRegistry()
+
+# Slow-request log and sampled cProfile dumps (see profiling.py)
+profiler = RequestProfiler()
+
+# Count user file reads and writes as 'io' in Server-Timing
+user_manager.io_timer = lambda: metrics.phase('io')
+
+def user_cache_samples():
+    """UserManager document cache counters for /metrics."""
+    stats = user_manager.cache_stats()
+    return [
+        ('user_cache_hits_total', 'counter', 'User documents served from the cache.', stats['hits']),
+        ('user_cache_misses_total', 'counter', 'User documents loaded from disk.', stats['misses']),
+        ('user_cache_evictions_total', 'counter', 'User documents evicted from the cache.', stats['evictions']),
+        ('user_cache_flushes_total', 'counter', 'Write-behind flushes of cached changes to user journals.', stats['flushes']),
+        ('user_cache_entries', 'gauge', 'User documents currently cached.', stats['entries']),
+        ('user_cache_dirty_entries', 'gauge', 'Cached user documents with unflushed changes.', stats['dirty']),
+    ]
+
+def anonymous_session_samples():
+    """Anonymous session store size and evictions for /metrics."""
+    stats = user_manager.anonymous_store.stats()
+    return [
+        ('anonymous_sessions', 'gauge', 'Anonymous sessions held in memory.', stats['sessions']),
+        ('anonymous_session_bytes', 'gauge', 'Approximate memory used by anonymous sessions.', stats['bytes']),
+        ('anonymous_session_evictions_total', 'counter', 'Anonymous sessions evicted to stay within the memory budget.', stats['evictions']),
+        ('anonymous_session_expirations_total', 'counter', 'Anonymous sessions removed after going unused.', stats['expirations']),
+    ]
+
+metrics.add_collector(user_cache_samples)
+metrics.add_collector(anonymous_session_samples)
+
+# Known API paths; anything else is grouped so unknown URLs can't add metric series
+API_ROUTES = {
+    '/api/register', '/api/login', '/api/logout', '/api/progress',
+    '/api/user/stats', '/api/validate', '/api/admin/users'
+}
+
+def route_label(path):
+    """Metric label for a request path, shaped like the Flask server's URL rules."""
+    path = urlparse(path).path
+    if path in API_ROUTES or path == '/metrics':
+        return path
+    if path.startswith('/api/'):
+        return 'unmatched'
+    if media_files.is_media_path(path):
+        return '/' + path.lstrip('/').split('/', 1)[0] + '/<path:filename>'
+    return '/' if path == '/' else '/<path:filename>'
+
 class FlashCardHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+    # Stop a stalled client from holding a worker indefinitely
+    timeout = REQUEST_TIMEOUT or None
+    
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory=str(DIRECTORY), **kwargs)
     
+    def handle_one_request(self):
+        """Handle one request, recording its route, status, latency and size."""
+        metrics.begin_request()
+        profile = profiler.start()
+        self.response_status = None
+        self.response_size = 0
+        super().handle_one_request()
+        if self.response_status is not None:
+            route = route_label(self.path)
+            elapsed = metrics.end_request(route, self.command, self.response_status, self.response_size)
+            profiler.finish(profile, self.command, self.path, route, self.response_status, elapsed,
+                            metrics.request_phases(), metrics.request_statements())
+        elif profile is not None:
+            profile.disable()
+    
+    def send_response(self, code, message=None):
+        self.response_status = code
+        super().send_response(code, message)
+    
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'content-length':
+            self.response_size = int(value)
+        super().send_header(keyword, value)
+    
     def end_headers(self):
         # Add security headers
         self.send_header('X-Content-Type-Options', 'nosniff')
@@ -54,76 +154,179 @@ class FlashCardHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         
         if parsed_path.path.startswith('/api/'):
             self.handle_api_request('GET', parsed_path)
+            return
+        
+        if parsed_path.path == '/metrics':
+            self.send_metrics()
+            return
+        
+        if media_files.is_media_path(parsed_path.path):
+            self.send_media(unquote(parsed_path.path))
+            return
+        
+        # Prefer the built assets, fall back to the plain files
+        asset = static_assets.resolve(parsed_path.path, self.headers.get('Accept-Encoding', ''))
+        if asset:
+            self.send_static_asset(asset)
         else:
             # Default behavior for static files
             super().do_GET()
     
+    def do_HEAD(self):
+        """Handle HEAD requests, with media metadata answered from the stat cache."""
+        parsed_path = urlparse(self.path)
+        
+        if media_files.is_media_path(parsed_path.path):
+            self.send_media(unquote(parsed_path.path), include_body=False)
+        else:
+            super().do_HEAD()
+    
+    def send_metrics(self):
+        """Send the request metrics in the Prometheus text format."""
+        status = metrics_access(self.headers.get('Authorization', ''))
+        if status == 404:
+            self.send_error_response(404, "Not found")
+            return
+        if status == 401:
+            self.send_error_response(401, "Metrics token required")
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def send_media(self, path, include_body=True):
+        """Send an audio or image file, honouring Range and If-Range for seeking."""
+        entry = media_files.lookup(path)
+        if not entry:
+            self.send_error(404, "File not found")
+            return
+        
+        if etag_matches(self.headers.get('If-None-Match', ''), entry.etag):
+            self.send_response(304)
+            self.send_media_headers(entry)
+            self.end_headers()
+            return
+        
+        byte_range = None
+        if if_range_matches(self.headers.get('If-Range', ''), entry):
+            try:
+                byte_range = parse_range(self.headers.get('Range', ''), entry.size)
+            except RangeNotSatisfiable:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{entry.size}')
+                self.send_header('Content-Length', '0')
+                self.send_media_headers(entry)
+                self.end_headers()
+                return
+        
+        if byte_range:
+            start, end = byte_range
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{entry.size}')
+        else:
+            start, end = 0, entry.size - 1
+            self.send_response(200)
+        
+        length = end - start + 1
+        self.send_header('Content-Type', entry.content_type)
+        self.send_header('Content-Length', str(length))
+        self.send_media_headers(entry)
+        self.end_headers()
+        
+        if include_body and length > 0:
+            with open(entry.path, 'rb') as f:
+                # socket.sendfile uses os.sendfile (zero-copy) where available
+                self.connection.sendfile(f, offset=start, count=length)
+    
+    def send_media_headers(self, entry):
+        """Send the validators and caching headers for a media response."""
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', entry.etag)
+        self.send_header('Last-Modified', entry.last_modified)
+        self.send_header('Cache-Control', MEDIA_CACHE_CONTROL)
+    
+    def send_static_asset(self, asset):
+        """Send a built asset with its caching headers, or 304 if the client already has it."""
+        if etag_matches(self.headers.get('If-None-Match', ''), asset.etag):
+            self.send_response(304)
+            self.send_asset_headers(asset)
+            self.end_headers()
+            return
+        
+        with open(asset.path, 'rb') as f:
+            self.send_response(200)
+            self.send_header('Content-Type', asset.content_type)
+            self.send_header('Content-Length', str(asset.size))
+            if asset.encoding:
+                self.send_header('Content-Encoding', asset.encoding)
+            self.send_asset_headers(asset)
+            self.end_headers()
+            self.copyfile(f, self.wfile)
+    
+    def send_asset_headers(self, asset):
+        """Send the caching headers shared by 200 and 304 asset responses."""
+        self.send_header('ETag', asset.etag)
+        self.send_header('Cache-Control', asset.cache_control)
+        self.send_header('Vary', 'Accept-Encoding')
+    
     def handle_api_request(self, method, parsed_path):
         """Handle API requests."""
-        print(f"🔍 [SERVER DEBUG] API request: {method} {parsed_path.path}")
-        
         try:
             content_length = int(self.headers.get('Content-Length', 0))
-            print(f"🔍 [SERVER DEBUG] Content length: {content_length}")
             
             request_data = {}
             
             if content_length > 0:
                 post_data = self.rfile.read(content_length)
-                print(f"🔍 [SERVER DEBUG] Raw POST data: {post_data[:200]}...")  # First 200 chars
                 try:
                     request_data = json.loads(post_data.decode('utf-8'))
-                    print(f"🔍 [SERVER DEBUG] Parsed JSON keys: {list(request_data.keys())}")
-                except json.JSONDecodeError as e:
-                    print(f"❌ [SERVER DEBUG] JSON decode error: {e}")
+                except json.JSONDecodeError:
                     self.send_error_response(400, "Invalid JSON")
                     return
             
             # Route API requests
-            print(f"🔍 [SERVER DEBUG] Routing to appropriate handler...")
             if parsed_path.path == '/api/register' and method == 'POST':
-                print(f"🔍 [SERVER DEBUG] -> handle_register")
                 self.handle_register(request_data)
             elif parsed_path.path == '/api/login' and method == 'POST':
-                print(f"🔍 [SERVER DEBUG] -> handle_login")
                 self.handle_login(request_data)
             elif parsed_path.path == '/api/logout' and method == 'POST':
-                print(f"🔍 [SERVER DEBUG] -> handle_logout")
                 self.handle_logout(request_data)
             elif parsed_path.path == '/api/progress' and method == 'GET':
-                print(f"🔍 [SERVER DEBUG] -> handle_get_progress")
                 self.handle_get_progress(request_data)
             elif parsed_path.path == '/api/progress' and method == 'POST':
-                print(f"🔍 [SERVER DEBUG] -> handle_save_progress")
                 self.handle_save_progress(request_data)
             elif parsed_path.path == '/api/user/stats' and method == 'GET':
-                print(f"🔍 [SERVER DEBUG] -> handle_get_stats")
                 self.handle_get_stats(request_data)
             elif parsed_path.path == '/api/validate' and method == 'POST':
-                print(f"🔍 [SERVER DEBUG] -> handle_validate_session")
                 self.handle_validate_session(request_data)
+            elif parsed_path.path == '/api/admin/users' and method == 'GET':
+                self.handle_list_users(request_data, parse_qs(parsed_path.query))
             else:
-                print(f"❌ [SERVER DEBUG] Unknown endpoint: {method} {parsed_path.path}")
                 self.send_error_response(404, "API endpoint not found")
                 
         except Exception as e:
             print(f"❌ API error: {e}")
-            print(f"❌ [SERVER DEBUG] Exception type: {type(e).__name__}")
-            print(f"❌ [SERVER DEBUG] Exception details: {str(e)}")
             import traceback
-            print(f"❌ [SERVER DEBUG] Full traceback:")
             traceback.print_exc()
             self.send_error_response(500, f"Internal server error: {str(e)}")
     
     def send_json_response(self, data, status_code=200):
-        """Send a JSON response."""
-        response_data = json.dumps(data, ensure_ascii=False, indent=2)
+        """Send a compact JSON response, gzipped when large and accepted."""
+        with metrics.phase('serialize'):
+            body, encoding = encode_body(data, self.headers.get('Accept-Encoding', ''))
         
         self.send_response(status_code)
-        self.send_header('Content-Type', 'application/json; charset=utf-8')
-        self.send_header('Content-Length', str(len(response_data.encode('utf-8'))))
+        self.send_header('Content-Type', JSON_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Server-Timing', metrics.server_timing())
         self.end_headers()
-        self.wfile.write(response_data.encode('utf-8'))
+        self.wfile.write(body)
     
     def send_error_response(self, status_code, message):
         """Send an error response."""
@@ -141,31 +344,20 @@ class FlashCardHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     
     def handle_register(self, request_data):
         """Handle user registration."""
-        print(f"🔍 [API DEBUG] Registration request received")
-        print(f"🔍 [API DEBUG] Request data keys: {list(request_data.keys())}")
-        
         username = request_data.get('username', '').strip()
         password = request_data.get('password', '')
         email = request_data.get('email', '').strip()
         
-        print(f"🔍 [API DEBUG] Username: '{username}' (length: {len(username)})")
-        print(f"🔍 [API DEBUG] Password provided: {'Yes' if password else 'No'} (length: {len(password) if password else 0})")
-        print(f"🔍 [API DEBUG] Email: '{email}'")
-        
         if not username or not password:
-            print(f"❌ [API DEBUG] Missing required fields")
             self.send_error_response(400, "Username and password are required")
             return
         
-        print(f"🔍 [API DEBUG] Calling user_manager.register_user...")
-        result = user_manager.register_user(username, password, email)
-        print(f"🔍 [API DEBUG] Registration result: {result}")
+        with metrics.phase('auth'):
+            result = user_manager.register_user(username, password, email)
         
         if result["success"]:
-            print(f"✅ [API DEBUG] Registration successful, sending 201 response")
             self.send_json_response(result, 201)
         else:
-            print(f"❌ [API DEBUG] Registration failed, sending 400 response: {result['error']}")
             self.send_error_response(400, result["error"])
     
     def handle_login(self, request_data):
@@ -178,7 +370,8 @@ class FlashCardHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             self.send_error_response(400, "Username and password are required")
             return
         
-        result = user_manager.login_user(username, password)
+        with metrics.phase('auth'):
+            result = user_manager.login_user(username, password)
         
         if result["success"]:
             # If an anonymous token was provided, try to transfer progress
@@ -191,3 +384,220 @@ class FlashCardHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                     result["user"]["progress"] = user_manager.get_user_progress(username)
                 else:
                     print("⚠️ [API DEBUG] Failed to transfer anonymous progress")
+            
+            self.send_json_response(result)
+        else:
+            self.send_error_response(401, result["error"])
+    
+    def handle_logout(self, request_data):
+        """Handle user logout."""
+        token = self.get_auth_token(request_data)
+        result = user_manager.logout_user(token)
+        
+        if result["success"]:
+            self.send_json_response(result)
+        else:
+            self.send_error_response(400, result["error"])
+    
+    def authenticate(self, request_data):
+        """Return the username for the request's session token, or None."""
+        token = self.get_auth_token(request_data)
+        if not token:
+            return None
+        with metrics.phase('auth'):
+            return user_manager.validate_session(token)
+    
+    def handle_get_progress(self, request_data):
+        """Handle getting the user's progress."""
+        token = self.get_auth_token(request_data)
+        if token.startswith("anon_"):
+            progress = user_manager.get_anonymous_progress(token)
+            if progress is None:
+                self.send_error_response(401, "Invalid or expired session")
+                return
+            self.send_json_response({"success": True, "progress": progress})
+            return
+        
+        username = self.authenticate(request_data)
+        if not username:
+            self.send_error_response(401, "Invalid or expired session")
+            return
+        
+        progress = user_manager.get_user_progress(username)
+        if progress is None:
+            self.send_error_response(404, "User progress not found")
+            return
+        
+        self.send_json_response({"success": True, "progress": progress})
+    
+    def handle_save_progress(self, request_data):
+        """Handle saving the user's progress."""
+        progress_data = request_data.get('progress')
+        if not isinstance(progress_data, dict):
+            self.send_error_response(400, "Progress data is required")
+            return
+        
+        token = self.get_auth_token(request_data)
+        if token.startswith("anon_"):
+            try:
+                saved = user_manager.save_anonymous_progress(token, progress_data)
+            except ValueError as e:
+                self.send_error_response(400, str(e))
+                return
+            if not saved:
+                self.send_error_response(401, "Invalid or expired session")
+                return
+            self.send_json_response({"success": True, "message": "Progress saved for this session"})
+            return
+        
+        username = self.authenticate(request_data)
+        if not username:
+            self.send_error_response(401, "Invalid or expired session")
+            return
+        
+        if user_manager.save_user_progress(username, progress_data):
+            self.send_json_response({"success": True, "message": "Progress saved successfully"})
+        else:
+            self.send_error_response(500, "Failed to save progress")
+    
+    def handle_get_stats(self, request_data):
+        """Handle getting the user's statistics."""
+        username = self.authenticate(request_data)
+        if not username:
+            self.send_error_response(401, "Invalid or expired session")
+            return
+        
+        stats = user_manager.get_user_statistics(username)
+        if stats is None:
+            self.send_error_response(404, "User statistics not found")
+            return
+        
+        self.send_json_response({"success": True, "statistics": stats})
+    
+    def handle_list_users(self, request_data, query):
+        """Handle the admin user listing, one keyset-paginated page at a time."""
+        username = self.authenticate(request_data)
+        if not username:
+            self.send_error_response(401, "Invalid or expired session")
+            return
+        if username not in ADMIN_USERNAMES:
+            self.send_error_response(403, "Admin access required")
+            return
+        
+        try:
+            params = parse_list_params(lambda name: query.get(name, [None])[0])
+            page = user_manager.list_users(**params)
+        except ValueError as e:
+            self.send_error_response(400, str(e))
+            return
+        
+        self.send_json_response({"success": True, **page})
+    
+    def handle_validate_session(self, request_data):
+        """Handle session validation."""
+        token = self.get_auth_token(request_data)
+        
+        if token.startswith("anon_"):
+            progress = user_manager.get_anonymous_progress(token)
+            if progress is None:
+                self.send_json_response({"valid": False})
+            else:
+                self.send_json_response({"valid": True, "anonymous": True, "progress": progress})
+            return
+        
+        username = self.authenticate(request_data)
+        if not username:
+            self.send_json_response({"valid": False})
+            return
+        
+        self.send_json_response({
+            "valid": True,
+            "anonymous": False,
+            "username": username,
+            "progress": user_manager.get_user_progress(username)
+        })
+
+
+class FlashCardServer(http.server.HTTPServer):
+    """Single-threaded HTTP server: handles one connection at a time."""
+    
+    allow_reuse_address = True
+    # Let bursts of clients queue up rather than be refused
+    request_queue_size = 128
+
+
+class PooledHTTPServer(FlashCardServer):
+    """HTTP server that handles connections on a fixed pool of worker threads.
+    
+    A slow client only ties up its own worker. Once every worker is busy,
+    new connections wait in the listen backlog instead of starting more threads.
+    """
+    
+    def __init__(self, server_address, handler_class, workers: int = SERVER_WORKERS):
+        self.workers = max(1, workers)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='http-worker')
+        self._slots = threading.BoundedSemaphore(self.workers)
+        super().__init__(server_address, handler_class)
+    
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        try:
+            self._pool.submit(self._process_request, request, client_address)
+        except RuntimeError:
+            # The pool has been shut down
+            self._slots.release()
+            self.shutdown_request(request)
+    
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+    
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=True)
+
+
+def create_server(address, workers: int = SERVER_WORKERS, handler_class=FlashCardHTTPRequestHandler):
+    """A pooled server with `workers` threads, or the single-threaded server for workers <= 1."""
+    if workers > 1:
+        return PooledHTTPServer(address, handler_class, workers)
+    return FlashCardServer(address, handler_class)
+
+
+def main():
+    """Start the development server."""
+    port = int(os.environ.get('PORT', PORT))
+    server_url = f"http://localhost:{port}"
+    
+    try:
+        with create_server(("", port)) as httpd:
+            print(f"🚀 Language Flash Cards Server (user files)")
+            print(f"🧵 Workers: {SERVER_WORKERS if SERVER_WORKERS > 1 else 'single-threaded'}")
+            print(f"📍 Serving from: {DIRECTORY}")
+            print(f"🌐 Server running at: {server_url}")
+            print(f"⏹️  Press Ctrl+C to stop the server")
+            print("-" * 60)
+            
+            if not os.environ.get('NO_BROWSER'):
+                try:
+                    webbrowser.open(server_url)
+                except Exception as e:
+                    print(f"⚠️  Could not open browser automatically: {e}")
+            
+            httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Server stopped by user")
+        user_manager.close()
+        sys.exit(0)
+    except OSError as e:
+        print(f"❌ Could not start server on port {port}: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
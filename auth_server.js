@@ -126,9 +126,12 @@ class AuthManager {    constructor() {
                 }
             });
 
+            if (this.currentUser) {
+                localStorage.removeItem(this.getProgressCacheKey());
+            }
             this.currentUser = null;
             this.showLoginScreen();
-            
+
             // Clear any local storage
             localStorage.removeItem('flashcard-session');
             
@@ -143,18 +146,22 @@ class AuthManager {    constructor() {
         if (!this.currentUser) return;
 
         try {
-            // Save individual progress items
-            for (const [cardId, action] of Object.entries(progressData.actions || {})) {
-                await fetch(`${this.apiBase}/progress`, {
+            // Save all progress items in a single batch request
+            const now = Date.now();
+            const events = Object.entries(progressData.actions || {}).map(([cardId, action]) => ({
+                card_id: cardId,
+                action: action,
+                ts: now
+            }));
+
+            if (events.length > 0) {
+                await fetch(`${this.apiBase}/progress/batch`, {
                     method: 'POST',
                     credentials: 'include',
                     headers: {
                         'Content-Type': 'application/json'
                     },
-                    body: JSON.stringify({
-                        card_id: cardId,
-                        action: action
-                    })
+                    body: JSON.stringify({ events })
                 });
             }
 
@@ -178,10 +185,59 @@ class AuthManager {    constructor() {
         }
     }
 
+    getProgressCacheKey() {
+        return `flashcard-progress-cache-${this.currentUser.id}`;
+    }
+
+    loadProgressCache() {
+        try {
+            const cached = JSON.parse(localStorage.getItem(this.getProgressCacheKey()));
+            if (cached && typeof cached.version === 'number') {
+                return cached;
+            }
+        } catch (error) {
+            console.warn('Ignoring unreadable progress cache:', error);
+        }
+        return null;
+    }
+
+    saveProgressCache(cache) {
+        try {
+            localStorage.setItem(this.getProgressCacheKey(), JSON.stringify(cache));
+        } catch (error) {
+            console.warn('Could not store progress cache:', error);
+        }
+    }
+
     async getUserProgress() {
         if (!this.currentUser) return null;
 
         try {
+            const cached = this.loadProgressCache();
+
+            if (cached) {
+                // Only fetch what changed since the cached version
+                const response = await fetch(`${this.apiBase}/progress?since=${cached.version}`, {
+                    credentials: 'include',
+                    headers: { 'Content-Type': 'application/json' }
+                });
+                const delta = await response.json();
+
+                if (response.ok && !delta.full) {
+                    const favorites = new Set(cached.favorites);
+                    delta.favorites.added.forEach(cardId => favorites.add(cardId));
+                    delta.favorites.removed.forEach(cardId => favorites.delete(cardId));
+
+                    const cache = {
+                        version: delta.version,
+                        progress: { ...cached.progress, ...delta.progress },
+                        favorites: [...favorites]
+                    };
+                    this.saveProgressCache(cache);
+                    return this.buildProgressResult(cache);
+                }
+            }
+
             const [progressResponse, favoritesResponse] = await Promise.all([
                 fetch(`${this.apiBase}/progress`, {
                     credentials: 'include',
@@ -196,19 +252,29 @@ class AuthManager {    constructor() {
             const progressData = await progressResponse.json();
             const favoritesData = await favoritesResponse.json();
 
-            return {
+            const cache = {
+                version: progressData.version || 0,
                 progress: progressData.progress || {},
-                favorites: favoritesData.favorites || [],
-                knownIds: [],
-                learningIds: [],
-                totalSessionTime: 0
+                favorites: favoritesData.favorites || []
             };
+            this.saveProgressCache(cache);
+            return this.buildProgressResult(cache);
         } catch (error) {
             console.error('Failed to load progress:', error);
             return null;
         }
     }
 
+    buildProgressResult(cache) {
+        return {
+            progress: cache.progress,
+            favorites: cache.favorites,
+            knownIds: [],
+            learningIds: [],
+            totalSessionTime: 0
+        };
+    }
+
     async getUserStats() {
         if (!this.currentUser) return null;
 
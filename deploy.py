@@ -14,11 +14,22 @@ def setup_production():
     
     try:
         # Import after setting up path
-        from server import init_db, app
+        from server import init_db, app, load_cards, print_database_settings
         
         print("📚 Initializing database...")
         init_db()
         print("✅ Database initialized successfully!")
+        print_database_settings()
+        
+        print("🃏 Loading flashcard deck...")
+        with app.app_context():
+            card_count = load_cards()
+        print(f"✅ Loaded {card_count} cards into the database")
+        
+        print("📦 Building static assets...")
+        from static_assets import build_assets
+        manifest = build_assets()
+        print(f"✅ Built {len(manifest['files'])} fingerprinted files into dist/")
         
         print("🔧 Checking configuration...")
         
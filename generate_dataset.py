@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Synthetic dataset generator for scale testing the Language Flash Cards servers.
+Bulk-loads users, progress, favorites and study sessions with power-law
+activity into a scratch database (never the app's own unless asked), and
+can write the same users as users/*.json files for app.py.
+
+    python generate_dataset.py --users 100000 --database sqlite:///scale.db
+    python generate_dataset.py --users 1000 --no-database --json-dir users_scale
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import DateTime
+
+BASE_DIR = Path(__file__).parent
+DECK_FILE = BASE_DIR / 'flashcards.json'
+
+DEFAULT_USERS = 1000
+DEFAULT_DATABASE = f"sqlite:///{BASE_DIR / 'flashcards_synthetic.db'}"
+DEFAULT_PASSWORD = 'password123'
+USERNAME_PREFIX = 'synthetic'
+
+# Rows buffered per table before one executemany insert
+CHUNK_ROWS = 50000
+
+# Cards studied per user follow a Pareto distribution: most users study a
+# handful, a few work through most of the deck
+ACTIVITY_ALPHA = 1.2  # Smaller = heavier tail
+MIN_CARDS = 5
+
+# Learners mostly work through the deck in order, skipping some cards, so
+# early cards are studied far more often than late ones
+DECK_SPREAD = 1.5
+
+FAVORITE_RATE = 0.05  # Share of studied cards marked as favorite
+CARDS_PER_SESSION = 20
+HISTORY_DAYS = 365  # How far back the oldest activity goes
+
+# SM-2 constants, kept in step with server.py
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+LAPSE_EASE_PENALTY = 0.32
+RELEARN_DELAY_SECONDS = 600
+
+EPOCH = datetime(1970, 1, 1)
+
+SyntheticUser = namedtuple('SyntheticUser', 'user progress favorites sessions stats')
+
+
+def load_card_ids(deck_file: Path = DECK_FILE) -> List[str]:
+    """Card IDs in deck order."""
+    with open(deck_file, 'r', encoding='utf-8') as f:
+        return [card['id'] for card in json.load(f)]
+
+
+def _utc(timestamp: Optional[float]) -> Optional[datetime]:
+    """Naive UTC datetime for a Unix timestamp, as server.py stores them."""
+    return EPOCH + timedelta(seconds=timestamp) if timestamp is not None else None
+
+
+def _simulate_card(rng: random.Random, user_id: int, card_id: str, skill: float,
+                   first_seen: float, now: float) -> Dict:
+    """Replay a few study answers for one card through the SM-2 rules of build_progress_upsert().
+
+    Times are Unix timestamps until the row is built.
+    """
+    attempts = 1 + int(rng.expovariate(0.6))
+    step = max(now - first_seen, 1.0) / attempts
+
+    known_count = learning_count = streak = 0
+    difficulty, ease, interval, due_at = 0.5, DEFAULT_EASE, 0.0, None
+    seen = first_seen
+    last_known = last_learning = None
+    for attempt in range(attempts):
+        if attempt:
+            seen = min(seen + rng.random() * step, now)
+
+        if rng.random() < skill:
+            interval = 1.0 if streak == 0 else 6.0 if streak == 1 else interval * ease
+            known_count += 1
+            streak += 1
+            last_known = seen
+            difficulty = max(0.0, difficulty - 0.1)
+            due_at = int(seen) + int(interval * 86400)
+        else:
+            learning_count += 1
+            streak = 0
+            last_learning = seen
+            difficulty = min(1.0, difficulty + 0.1)
+            ease = max(MIN_EASE, ease - LAPSE_EASE_PENALTY)
+            interval = 0.0
+            due_at = int(seen) + RELEARN_DELAY_SECONDS
+
+    return {
+        'user_id': user_id, 'card_id': card_id,
+        'known_count': known_count, 'learning_count': learning_count,
+        'total_attempts': attempts, 'correct_attempts': known_count,
+        'first_seen': _utc(first_seen), 'last_seen': _utc(seen),
+        'last_known': _utc(last_known), 'last_learning': _utc(last_learning),
+        'study_streak': streak, 'difficulty_rating': difficulty, 'version': 1,
+        'ease': ease, 'interval_days': interval, 'due_at': due_at,
+    }
+
+
+def generate_users(count: int, card_ids: List[str], seed: int = 0, start_id: int = 1,
+                   password_hash: str = '', now: Optional[datetime] = None,
+                   alpha: float = ACTIVITY_ALPHA, min_cards: int = MIN_CARDS) -> Iterator[SyntheticUser]:
+    """Yield synthetic users with their progress, favorites, sessions and stats rollup."""
+    now = (now or datetime.utcnow()).replace(microsecond=0)
+    now_ts = (now - EPOCH).total_seconds()
+    deck_size = len(card_ids)
+
+    for offset in range(count):
+        rng = random.Random(seed * 1000003 + offset)
+        user_id = start_id + offset
+        username = f'{USERNAME_PREFIX}{user_id}'
+
+        studied = min(deck_size, int(min_cards * rng.paretovariate(alpha)))
+        reach = min(deck_size, max(studied, int(studied * DECK_SPREAD)))
+        positions = sorted(rng.sample(range(reach), studied))
+
+        created_at = now - timedelta(days=rng.uniform(1, HISTORY_DAYS))
+        history = (now - created_at).total_seconds()
+        skill = rng.betavariate(4, 2)  # Share of answers that are "known"
+
+        # Deck order roughly follows time: later cards are first seen later
+        created_ts = (created_at - EPOCH).total_seconds()
+        spacing = history / (studied + 1)
+        progress = [
+            _simulate_card(rng, user_id, card_ids[position], skill,
+                           created_ts + spacing * (index + rng.random()), now_ts)
+            for index, position in enumerate(positions)
+        ]
+
+        favorites = [
+            {'user_id': user_id, 'card_id': row['card_id'], 'created_at': row['first_seen'], 'version': 1}
+            for row in progress if rng.random() < FAVORITE_RATE
+        ]
+
+        sessions = []
+        for index in range(max(1, math.ceil(studied / CARDS_PER_SESSION))):
+            start = created_at + timedelta(seconds=rng.uniform(0, history))
+            duration = int(rng.uniform(60, 1200))
+            cards = min(CARDS_PER_SESSION, max(studied - index * CARDS_PER_SESSION, 0))
+            known = sum(1 for _ in range(cards) if rng.random() < skill)
+            sessions.append({
+                'user_id': user_id,
+                'session_start': start,
+                'session_end': start + timedelta(seconds=duration),
+                'cards_studied': cards,
+                'cards_known': known,
+                'cards_learning': cards - known,
+                'total_time_seconds': duration,
+            })
+
+        stats = {
+            'user_id': user_id,
+            'total_cards_studied': len(progress),
+            'known_cards': sum(1 for row in progress if row['known_count'] > 0),
+            'learning_cards': sum(1 for row in progress if row['learning_count'] > 0),
+            'accuracy_sum': sum(row['correct_attempts'] / row['total_attempts'] for row in progress),
+            'study_streak': max((row['study_streak'] for row in progress), default=0),
+            'total_sessions': len(sessions),
+            'total_study_time_seconds': sum(s['total_time_seconds'] for s in sessions),
+            'updated_at': now,
+        }
+
+        user = {
+            'id': user_id,
+            'username': username,
+            'email': f'{username}@example.com',
+            'password_hash': password_hash,
+            'created_at': created_at,
+            'last_login': max((row['last_seen'] for row in progress), default=created_at),
+            'auth_epoch': 0,
+            'change_version': 1,
+        }
+        yield SyntheticUser(user, progress, favorites, sessions, stats)
+
+
+def user_file_data(synthetic: SyntheticUser, password_hash: str, salt: str) -> Dict:
+    """The users/<name>.json document app.py's UserManager would hold for this user."""
+    user = synthetic.user
+    known = [row['card_id'] for row in synthetic.progress if row['study_streak'] > 0]
+    learning = [row['card_id'] for row in synthetic.progress if row['study_streak'] == 0]
+
+    sessions_by_date = {}
+    for session in sorted(synthetic.sessions, key=lambda s: s['session_start']):
+        day = session['session_start'].date().isoformat()
+        entry = sessions_by_date.setdefault(day, {'sessions': 0, 'new_cards_learned': 0, 'cards_reviewed': 0})
+        entry['sessions'] += 1
+        entry['new_cards_learned'] += session['cards_known']
+        entry['cards_reviewed'] += session['cards_studied']
+
+    last_session = max((s['session_start'] for s in synthetic.sessions), default=None)
+    return {
+        'username': user['username'],
+        'email': user['email'],
+        'created_at': user['created_at'].isoformat(),
+        'last_login': user['last_login'].isoformat(),
+        'progress': {
+            'known_cards': known,
+            'learning_cards': learning,
+            'total_sessions': len(synthetic.sessions),
+            'total_cards_learned': len(known),
+            'streak_days': synthetic.stats['study_streak'],
+            'last_session_date': last_session.date().isoformat() if last_session else None,
+            'preferences': {
+                'theme': 'dark',
+                'auto_play_audio': True,
+                'show_pronunciation': True,
+                'cards_per_session': CARDS_PER_SESSION
+            }
+        },
+        'statistics': {
+            'sessions_by_date': sessions_by_date,
+            'learning_progress': [],
+            'difficulty_ratings': {
+                row['card_id']: 1 + round(row['difficulty_rating'] * 4) for row in synthetic.progress
+            }
+        },
+        'password_hash': password_hash,
+        'salt': salt
+    }
+
+
+class BulkLoader:
+    """Buffers generated rows and writes them with one executemany per table and chunk.
+
+    Rows go straight to the DB-API cursor: SQLAlchemy's per-row parameter
+    processing would cost several times more than the inserts themselves.
+    """
+
+    def __init__(self, engine, tables: Dict, chunk_rows: int = CHUNK_ROWS):
+        self.engine = engine
+        self.tables = tables  # Name -> Table, in foreign-key order
+        self.chunk_rows = chunk_rows
+        self.buffers = {name: [] for name in tables}
+        self.counts = {name: 0 for name in tables}
+        # SQLite stores DateTime columns as text; other drivers take datetimes as-is
+        self.datetimes_as_text = engine.dialect.name == 'sqlite'
+
+    def _insert_sql(self, table, columns: List[str]) -> str:
+        """INSERT statement for the columns, in the driver's own parameter style."""
+        preparer = self.engine.dialect.identifier_preparer
+        placeholder = '?' if self.engine.dialect.paramstyle == 'qmark' else '%s'
+        return 'INSERT INTO {} ({}) VALUES ({})'.format(
+            preparer.format_table(table),
+            ', '.join(preparer.quote(column) for column in columns),
+            ', '.join([placeholder] * len(columns))
+        )
+
+    def _parameters(self, table, columns: List[str], rows: List[Dict]) -> List[tuple]:
+        """Row dicts as parameter tuples, with DateTime values rendered for the driver."""
+        if not self.datetimes_as_text:
+            return [tuple(row[column] for column in columns) for row in rows]
+
+        datetime_indexes = [
+            index for index, column in enumerate(columns)
+            if isinstance(table.c[column].type, DateTime)
+        ]
+        parameters = []
+        for row in rows:
+            values = [row[column] for column in columns]
+            for index in datetime_indexes:
+                if values[index] is not None:
+                    values[index] = values[index].isoformat(' ', 'microseconds')
+            parameters.append(tuple(values))
+        return parameters
+
+    def add(self, synthetic: SyntheticUser):
+        self.buffers['user'].append(synthetic.user)
+        self.buffers['user_progress'].extend(synthetic.progress)
+        self.buffers['user_favorite'].extend(synthetic.favorites)
+        self.buffers['user_session'].extend(synthetic.sessions)
+        self.buffers['user_stats'].append(synthetic.stats)
+        if max(len(rows) for rows in self.buffers.values()) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        """Write everything buffered in a single transaction."""
+        with self.engine.begin() as connection:
+            for name, table in self.tables.items():
+                rows = self.buffers[name]
+                if rows:
+                    columns = list(rows[0])
+                    connection.exec_driver_sql(
+                        self._insert_sql(table, columns), self._parameters(table, columns, rows)
+                    )
+                    self.counts[name] += len(rows)
+                    self.buffers[name] = []
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a large synthetic dataset for scale testing.')
+    parser.add_argument('--users', type=int, default=DEFAULT_USERS, help='number of users to generate')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--alpha', type=float, default=ACTIVITY_ALPHA,
+                        help='Pareto shape for cards studied per user (smaller = heavier tail)')
+    parser.add_argument('--min-cards', type=int, default=MIN_CARDS, help='cards studied by the least active users')
+    parser.add_argument('--database', default=DEFAULT_DATABASE,
+                        help='database URL to load into (default: flashcards_synthetic.db, not the app database)')
+    parser.add_argument('--no-database', action='store_true', help="don't load into the database")
+    parser.add_argument('--json-dir', help='also write users/*.json files for app.py into this directory')
+    parser.add_argument('--password', default=DEFAULT_PASSWORD, help='password shared by every generated user')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help='rows per bulk insert')
+    return parser.parse_args(argv)
+
+
+def generate_dataset(options) -> Dict[str, int]:
+    """Generate the dataset described by the options; returns row counts per table."""
+    from user_manager import UserManager
+    from werkzeug.security import generate_password_hash
+
+    card_ids = load_card_ids()
+    loader = None
+    start_id = 1
+
+    if not options.no_database:
+        if 'server' in sys.modules:
+            if sys.modules['server'].app.config['SQLALCHEMY_DATABASE_URI'] != options.database:
+                raise RuntimeError('server.py is already imported with a different database than --database')
+        else:
+            os.environ['DATABASE_URL'] = options.database
+        import server
+        from sqlalchemy import func
+
+        server.init_db()
+        with server.app.app_context():
+            start_id = (server.db.session.query(func.max(server.User.id)).scalar() or 0) + 1
+            tables = {
+                'user': server.User.__table__,
+                'user_progress': server.UserProgress.__table__,
+                'user_favorite': server.UserFavorite.__table__,
+                'user_session': server.UserSession.__table__,
+                'user_stats': server.UserStats.__table__,
+            }
+            loader = BulkLoader(server.db.engine, tables, options.chunk_rows)
+
+    # Hashing is deliberately slow, so every generated user shares one hash
+    password_hash = generate_password_hash(options.password)
+
+    json_dir = Path(options.json_dir) if options.json_dir else None
+    if json_dir:
+        file_hash, file_salt = UserManager(str(json_dir))._hash_password(options.password)
+
+    files = 0
+    for synthetic in generate_users(options.users, card_ids, options.seed, start_id, password_hash,
+                                    alpha=options.alpha, min_cards=options.min_cards):
+        if loader:
+            loader.add(synthetic)
+        if json_dir:
+            path = json_dir / f"{synthetic.user['username']}.json"
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(user_file_data(synthetic, file_hash, file_salt), f, ensure_ascii=False)
+            files += 1
+
+    counts = {}
+    if loader:
+        loader.flush()
+        counts.update(loader.counts)
+    if json_dir:
+        counts['json_files'] = files
+    return counts
+
+
+def main(argv=None):
+    """Generate the dataset and report how long it took."""
+    options = parse_args(argv)
+    print(f"🧪 Generating {options.users} synthetic users...")
+    start = time.perf_counter()
+    counts = generate_dataset(options)
+    elapsed = time.perf_counter() - start
+
+    rows = sum(count for name, count in counts.items() if name != 'json_files')
+    for name, count in counts.items():
+        print(f"   {name}: {count:,}")
+    print(f"✅ Done in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+"""
+In-process load test for the Language Flash Cards servers.
+Drives simulated learners through the study loop against server.py (Flask)
+or app.py (http.server) on a throwaway database and reports throughput and
+per-endpoint latency percentiles as JSON.
+
+    python load_test.py --target flask --users 20 --output before.json
+    python load_test.py --target flask --users 20 --baseline before.json
+    python load_test.py --target app --scaling 1,4,16 --slow-clients 2
+"""
+
+import argparse
+import contextlib
+import copy
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import quote
+
+BASE_DIR = Path(__file__).parent
+DECK_FILE = BASE_DIR / 'flashcards.json'
+
+DEFAULT_USERS = 20
+DEFAULT_ROUNDS = 2  # Study sessions per learner
+DEFAULT_MARKS = 10  # Cards marked per session
+DEFAULT_FAVORITES = 2  # Favorite toggles per session
+DEFAULT_MAX_REGRESSION = 0.2  # Allowed p95 slowdown against a baseline
+
+# Slow clients send their request a few bytes at a time, like a poor mobile connection
+SLOW_CHUNK_BYTES = 4
+SLOW_CHUNK_DELAY = 0.02
+
+PERCENTILES = (50, 95, 99)
+PASSWORD = 'load-test-password'
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class LatencyRecorder:
+    """Collects request latencies per endpoint from many threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, List[float]] = {}
+        self._errors: Dict[str, int] = {}
+
+    def record(self, endpoint: str, seconds: float, ok: bool):
+        with self._lock:
+            self._samples.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self._errors[endpoint] = self._errors.get(endpoint, 0) + 1
+
+    def report(self, wall_seconds: float) -> Dict:
+        """Summarise everything recorded so far."""
+        with self._lock:
+            samples = {endpoint: sorted(values) for endpoint, values in self._samples.items()}
+            errors = dict(self._errors)
+
+        endpoints = {}
+        for endpoint, values in sorted(samples.items()):
+            summary = {
+                'count': len(values),
+                'errors': errors.get(endpoint, 0),
+                'rps': round(len(values) / wall_seconds, 2) if wall_seconds else 0.0,
+                'mean_ms': round(sum(values) / len(values) * 1000, 3),
+            }
+            for pct in PERCENTILES:
+                summary[f'p{pct}_ms'] = round(percentile(values, pct) * 1000, 3)
+            summary['max_ms'] = round(values[-1] * 1000, 3)
+            endpoints[endpoint] = summary
+
+        total = sum(len(values) for values in samples.values())
+        overall = sorted(value for values in samples.values() for value in values)
+        report = {
+            'wall_seconds': round(wall_seconds, 3),
+            'requests': total,
+            'errors': sum(errors.values()),
+            'throughput_rps': round(total / wall_seconds, 2) if wall_seconds else 0.0,
+        }
+        for pct in PERCENTILES:
+            report[f'p{pct}_ms'] = round(percentile(overall, pct) * 1000, 3)
+        report['endpoints'] = endpoints
+        return report
+
+
+class FlaskLearner:
+    """A simulated learner talking to the Flask app through its test client."""
+
+    def __init__(self, app, recorder: LatencyRecorder):
+        self.client = app.test_client()
+        self.recorder = recorder
+
+    def request(self, method: str, path: str, body: Optional[Dict] = None, endpoint: str = None):
+        start = time.perf_counter()
+        response = self.client.open(path, method=method, json=body)
+        elapsed = time.perf_counter() - start
+        self.recorder.record(endpoint or f'{method} {path}', elapsed, response.status_code < 400)
+        return response.status_code, response.get_json(silent=True) or {}
+
+
+class HTTPLearner:
+    """A simulated learner talking to a running http.server over a socket."""
+
+    def __init__(self, host: str, port: int, recorder: LatencyRecorder):
+        self.connection = http.client.HTTPConnection(host, port, timeout=30)
+        self.recorder = recorder
+        self.token = ''
+
+    def request(self, method: str, path: str, body: Optional[Dict] = None, endpoint: str = None):
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        payload = json.dumps(body).encode('utf-8') if body is not None else None
+
+        start = time.perf_counter()
+        self.connection.request(method, path, body=payload, headers=headers)
+        response = self.connection.getresponse()
+        data = response.read()
+        elapsed = time.perf_counter() - start
+
+        self.recorder.record(endpoint or f'{method} {path}', elapsed, response.status < 400)
+        try:
+            return response.status, json.loads(data) if data else {}
+        except ValueError:
+            return response.status, {}
+
+    def close(self):
+        self.connection.close()
+
+
+def flask_learner(learner: FlaskLearner, index: int, card_ids: List[str], options) -> None:
+    """One learner's visit to server.py: register, then study sessions."""
+    rng = random.Random(options.seed + index)
+    username = f'learner{options.run_id}_{index}'
+    learner.request('POST', '/api/register', {
+        'username': username, 'email': f'{username}@example.com', 'password': PASSWORD
+    })
+    learner.request('GET', '/api/progress')
+    learner.request('GET', '/api/favorites')
+
+    for _ in range(options.rounds):
+        _, data = learner.request('POST', '/api/session/start')
+        session_id = data.get('session_id')
+
+        for card_id in rng.sample(card_ids, options.marks):
+            learner.request('POST', '/api/progress', {
+                'card_id': card_id, 'action': rng.choice(('known', 'learning'))
+            })
+        for card_id in rng.sample(card_ids, options.favorites):
+            learner.request('POST', '/api/favorites', {'card_id': card_id})
+
+        learner.request('GET', '/api/stats')
+        learner.request('POST', '/api/session/end', {
+            'session_id': session_id,
+            'cards_studied': options.marks,
+            'total_time_seconds': 60
+        })
+
+
+def app_learner(learner: HTTPLearner, index: int, card_ids: List[str], options) -> None:
+    """One learner's visit to app.py: register, log in, then study sessions.
+
+    app.py has no session or favorite endpoints, so each mark saves the
+    learner's known/learning lists as the JSON-file client does.
+    """
+    rng = random.Random(options.seed + index)
+    username = f'learner{options.run_id}_{index}'
+    learner.request('POST', '/api/register', {
+        'username': username, 'email': f'{username}@example.com', 'password': PASSWORD
+    })
+    _, data = learner.request('POST', '/api/login', {'username': username, 'password': PASSWORD})
+    learner.token = data.get('token', '')
+    learner.request('POST', '/api/validate', {'token': learner.token})
+    learner.request('GET', '/api/progress')
+
+    known, learning = set(), set()
+    for _ in range(options.rounds):
+        for card_id in rng.sample(card_ids, options.marks):
+            if rng.random() < 0.5:
+                known.add(card_id)
+                learning.discard(card_id)
+            else:
+                learning.add(card_id)
+                known.discard(card_id)
+            learner.request('POST', '/api/progress', {
+                'progress': {'known_cards': sorted(known), 'learning_cards': sorted(learning)}
+            })
+        learner.request('GET', '/api/user/stats')
+
+    learner.request('POST', '/api/logout', {'token': learner.token})
+    learner.close()
+
+
+def slow_download(host: str, port: int, path: str, stop: threading.Event) -> int:
+    """Fetch `path` again and again over a slow link until stop is set; returns downloads finished.
+
+    The request and the response both trickle through in small, delayed
+    pieces, as they would for a phone on a poor connection.
+    """
+    downloads = 0
+    while not stop.is_set():
+        request = f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n'.encode('ascii')
+        with socket.create_connection((host, port), timeout=30) as sock:
+            for offset in range(0, len(request), SLOW_CHUNK_BYTES):
+                sock.sendall(request[offset:offset + SLOW_CHUNK_BYTES])
+                time.sleep(SLOW_CHUNK_DELAY)
+            # Finish the response even once stopped, so the server never sees a reset
+            while sock.recv(4096):
+                if not stop.is_set():
+                    time.sleep(SLOW_CHUNK_DELAY)
+        downloads += 1
+    return downloads
+
+
+def media_sample_path(directory: Path = BASE_DIR / 'word_audio') -> Optional[str]:
+    """URL of the largest audio file, for slow clients to download."""
+    files = [path for path in directory.glob('*') if path.is_file()]
+    if not files:
+        return None
+    largest = max(files, key=lambda path: path.stat().st_size)
+    return f'/{directory.name}/{quote(largest.name)}'
+
+
+def _drive(options, make_learner, scenario, card_ids: List[str], recorder: LatencyRecorder) -> float:
+    """Run every learner concurrently; returns the wall-clock time taken."""
+    def run(index):
+        scenario(make_learner(), index, card_ids, options)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=options.users) as pool:
+        for future in [pool.submit(run, index) for index in range(options.users)]:
+            future.result()
+    return time.perf_counter() - start
+
+
+def run_flask(options, recorder: LatencyRecorder, app=None) -> float:
+    """Load-test server.py. Without an app, one is built on --database or a temporary database."""
+    if app is None:
+        if 'server' in sys.modules:
+            raise RuntimeError('server.py is already imported; pass its app explicitly')
+        os.environ['DATABASE_URL'] = options.database or f"sqlite:///{os.path.join(options.workdir, 'load_test.db')}"
+        import server
+        server.init_db()
+        app = server.app
+
+    card_ids = load_card_ids()
+    return _drive(options, lambda: FlaskLearner(app, recorder), flask_learner, card_ids, recorder)
+
+
+def run_app(options, recorder: LatencyRecorder, server_class=None) -> float:
+    """Load-test app.py over a real socket, with user files in a temporary directory.
+
+    The server runs with --workers threads unless a server_class is given;
+    --slow-clients keep downloading audio slowly for the whole run.
+    """
+    import app as app_module
+    from user_manager import UserManager
+
+    class QuietHandler(app_module.FlashCardHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    original_manager = app_module.user_manager
+    app_module.user_manager = UserManager(os.path.join(options.workdir, 'users'))
+    app_module.user_manager.io_timer = original_manager.io_timer
+
+    if server_class is None:
+        httpd = app_module.create_server(('127.0.0.1', 0), options.workers, QuietHandler)
+    else:
+        httpd = server_class(('127.0.0.1', 0), QuietHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    stop = threading.Event()
+    slow_clients = []
+    try:
+        host, port = httpd.server_address[:2]
+        media_path = media_sample_path()
+        if media_path:
+            for _ in range(options.slow_clients):
+                client = threading.Thread(target=slow_download, args=(host, port, media_path, stop), daemon=True)
+                client.start()
+                slow_clients.append(client)
+        card_ids = load_card_ids()
+        return _drive(options, lambda: HTTPLearner(host, port, recorder), app_learner, card_ids, recorder)
+    finally:
+        stop.set()
+        for client in slow_clients:
+            client.join()
+        httpd.shutdown()
+        httpd.server_close()
+        app_module.user_manager.close()
+        app_module.user_manager = original_manager
+
+
+def load_card_ids(deck_file: Path = DECK_FILE) -> List[str]:
+    """Card IDs from the deck, for learners to pick from."""
+    with open(deck_file, 'r', encoding='utf-8') as f:
+        return [card['id'] for card in json.load(f)]
+
+
+def current_commit() -> Optional[str]:
+    """Short hash of the checked-out commit, if this is a git checkout."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_load_test(options, app=None) -> Dict:
+    """Run the configured load test and return the JSON report."""
+    recorder = LatencyRecorder()
+    # Learners register fresh accounts, so runs against the same database don't collide
+    options.run_id = secrets.token_hex(3)
+    with tempfile.TemporaryDirectory(prefix='flashcards-load-') as workdir:
+        options.workdir = workdir
+        # The servers print on every request; keep the report readable
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            if options.target == 'flask':
+                wall_seconds = run_flask(options, recorder, app)
+            else:
+                wall_seconds = run_app(options, recorder)
+
+    report = {
+        'target': options.target,
+        'users': options.users,
+        'workers': options.workers if options.target == 'app' else None,
+        'slow_clients': options.slow_clients if options.target == 'app' else 0,
+        'rounds': options.rounds,
+        'marks': options.marks,
+        'favorites': options.favorites,
+        'seed': options.seed,
+        'commit': current_commit(),
+        'python': platform.python_version(),
+    }
+    report.update(recorder.report(wall_seconds))
+    return report
+
+
+def run_scaling(options) -> Dict:
+    """Throughput of app.py at each --scaling client count, single-threaded and with --workers threads."""
+    runs = []
+    for clients in options.scaling:
+        for workers in sorted({1, options.workers}):
+            run_options = copy.copy(options)
+            run_options.users = clients
+            run_options.workers = workers
+            report = run_load_test(run_options)
+            runs.append({
+                'clients': clients,
+                'workers': workers,
+                'throughput_rps': report['throughput_rps'],
+                'p50_ms': report['p50_ms'],
+                'p95_ms': report['p95_ms'],
+                'errors': report['errors'],
+            })
+            print(f"   {clients:>4} clients  {workers:>3} workers  {report['throughput_rps']:>9.1f} req/s  "
+                  f"p95 {report['p95_ms']:>9.1f} ms", file=sys.stderr)
+    return {
+        'target': 'app',
+        'slow_clients': options.slow_clients,
+        'rounds': options.rounds,
+        'marks': options.marks,
+        'commit': current_commit(),
+        'python': platform.python_version(),
+        'errors': sum(run['errors'] for run in runs),
+        'scaling': runs
+    }
+
+
+def compare_to_baseline(report: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    """Endpoints whose p95 got slower than the baseline by more than max_regression."""
+    regressions = []
+    for endpoint, summary in report['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(endpoint)
+        if not previous or not previous.get('p95_ms'):
+            continue
+        ratio = summary['p95_ms'] / previous['p95_ms']
+        if ratio > 1 + max_regression:
+            regressions.append(
+                f"{endpoint}: p95 {previous['p95_ms']}ms -> {summary['p95_ms']}ms (+{(ratio - 1) * 100:.0f}%)"
+            )
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test the flash cards servers with simulated learners.')
+    parser.add_argument('--target', choices=('flask', 'app'), default='flask',
+                        help='flask = server.py, app = app.py (default: flask)')
+    parser.add_argument('--users', type=int, default=DEFAULT_USERS, help='concurrent learners')
+    parser.add_argument('--rounds', type=int, default=DEFAULT_ROUNDS, help='study sessions per learner')
+    parser.add_argument('--marks', type=int, default=DEFAULT_MARKS, help='cards marked per session')
+    parser.add_argument('--favorites', type=int, default=DEFAULT_FAVORITES, help='favorite toggles per session')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for card choices')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='app.py server threads, 1 = single-threaded (default: SERVER_WORKERS, 16)')
+    parser.add_argument('--slow-clients', type=int, default=0,
+                        help='app target: clients slowly downloading audio throughout the run')
+    parser.add_argument('--scaling', type=lambda value: [int(part) for part in value.split(',')],
+                        help='app target: comma-separated client counts to measure throughput at, '
+                             'single-threaded and with --workers threads, e.g. 1,4,16')
+    parser.add_argument('--database', help='database URL for the flask target, e.g. one filled by '
+                                           'generate_dataset.py (default: a throwaway SQLite file)')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    parser.add_argument('--baseline', help='JSON report from an earlier run to compare p95 latencies with')
+    parser.add_argument('--max-regression', type=float, default=DEFAULT_MAX_REGRESSION,
+                        help='allowed p95 slowdown against the baseline, as a fraction (default: 0.2)')
+    options = parser.parse_args(argv)
+    if (options.scaling or options.slow_clients) and options.target != 'app':
+        parser.error('--scaling and --slow-clients need --target app')
+    if options.scaling and options.baseline:
+        parser.error('--baseline compares single runs, not --scaling reports')
+    if options.workers is None:
+        options.workers = int(os.environ.get('SERVER_WORKERS', 16))
+    return options
+
+
+def main(argv=None):
+    """Run the load test and print the report."""
+    options = parse_args(argv)
+    if options.scaling:
+        print(f"🏋️  Measuring app throughput at {', '.join(map(str, options.scaling))} clients...", file=sys.stderr)
+        report = run_scaling(options)
+    else:
+        print(f"🏋️  Load-testing {options.target} with {options.users} learners...", file=sys.stderr)
+        report = run_load_test(options)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+
+    status = 0
+    if report['errors']:
+        print(f"❌ {report['errors']} requests failed", file=sys.stderr)
+        status = 1
+
+    if options.baseline:
+        with open(options.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_to_baseline(report, json.load(f), options.max_regression)
+        for line in regressions:
+            print(f"🐢 {line}", file=sys.stderr)
+        if regressions:
+            status = 2
+        else:
+            print("✅ No p95 regressions against the baseline", file=sys.stderr)
+
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Media file lookup for the Language Flash Cards application.
+Serves word_audio/ and word_images/ with cached stats, strong ETags
+and byte-range support.
+"""
+
+import mimetypes
+import os
+import threading
+import time
+from collections import namedtuple
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional, Tuple
+
+BASE_DIR = Path(__file__).parent
+MEDIA_DIRS = ('word_audio', 'word_images')
+
+# How long a cached stat result is trusted before the file is checked again
+STAT_CACHE_SECONDS = 60
+
+# Upper bound on cached entries (hits and misses)
+MAX_STAT_CACHE_ENTRIES = 20000
+
+# Media files are not fingerprinted, so they get a shorter lifetime than built assets
+MEDIA_CACHE_CONTROL = 'public, max-age=86400'
+
+MediaEntry = namedtuple('MediaEntry', 'path size mtime etag content_type last_modified')
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when a Range header asks for bytes outside the file."""
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range "bytes=" header into an inclusive (start, end).
+
+    Returns None when the header is absent, malformed or asks for several
+    ranges; the caller then sends the whole file.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+
+    start_text, sep, end_text = header[6:].strip().partition('-')
+    if not sep:
+        return None
+
+    try:
+        if start_text == '':
+            # Suffix range: the last N bytes
+            length = int(end_text)
+            if length <= 0:
+                raise RangeNotSatisfiable(header)
+            return max(size - length, 0), size - 1
+
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+
+def if_range_matches(if_range: str, entry: MediaEntry) -> bool:
+    """Check an If-Range header; a mismatch means the whole file must be sent."""
+    if not if_range:
+        return True
+
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # Only strong validators may be used with If-Range
+        return if_range == entry.etag
+
+    try:
+        return int(parsedate_to_datetime(if_range).timestamp()) == int(entry.mtime)
+    except (TypeError, ValueError):
+        return False
+
+
+class MediaFiles:
+    """Resolves media paths through a small stat cache."""
+
+    def __init__(self, base_dir: Path = BASE_DIR, directories=MEDIA_DIRS,
+                 cache_seconds: float = STAT_CACHE_SECONDS):
+        self.base_dir = Path(base_dir).resolve()
+        self.directories = tuple(directories)
+        self.cache_seconds = cache_seconds
+        self._cache = {}  # Relative path -> (checked_at, MediaEntry or None)
+        self._lock = threading.Lock()
+
+    def is_media_path(self, path: str) -> bool:
+        """Check whether a URL path points into one of the media directories."""
+        return path.lstrip('/').split('/', 1)[0] in self.directories
+
+    def lookup(self, path: str) -> Optional[MediaEntry]:
+        """Return the cached entry for a media URL path, or None if it doesn't exist."""
+        relative = path.lstrip('/')
+        now = time.monotonic()
+
+        cached = self._cache.get(relative)
+        if cached and now - cached[0] < self.cache_seconds:
+            return cached[1]
+
+        entry = self._stat(relative)
+        with self._lock:
+            if len(self._cache) >= MAX_STAT_CACHE_ENTRIES:
+                self._cache.clear()
+            self._cache[relative] = (now, entry)
+        return entry
+
+    def _stat(self, relative: str) -> Optional[MediaEntry]:
+        """Stat a media file, refusing anything outside the media directories."""
+        if not self.is_media_path(relative):
+            return None
+
+        file_path = (self.base_dir / relative).resolve()
+        media_root = self.base_dir / relative.split('/', 1)[0]
+        if media_root not in file_path.parents:
+            return None
+
+        try:
+            stat = file_path.stat()
+        except OSError:
+            return None
+        if not os.path.isfile(file_path):
+            return None
+
+        return MediaEntry(
+            path=file_path,
+            size=stat.st_size,
+            mtime=stat.st_mtime,
+            etag=f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"',
+            content_type=mimetypes.guess_type(file_path.name)[0] or 'application/octet-stream',
+            last_modified=formatdate(stat.st_mtime, usegmt=True)
+        )
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Request and query metrics for the Language Flash Cards servers.
+Keeps per-route counters and histograms in memory and renders them in
+the Prometheus text exposition format for a /metrics endpoint, and
+breaks single requests down into phases for Server-Timing headers.
+The endpoint is off unless METRICS_TOKEN is set, and then needs that
+token as a bearer token.
+"""
+
+import hmac
+import os
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Bearer token scrapers must send to read /metrics; unset keeps the endpoint disabled
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '').strip()
+
+# Upper bounds in seconds for request and query latencies
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Upper bounds in bytes for response bodies
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Phases reported in Server-Timing, in header order; 'db' comes from the SQL events
+TIMING_PHASES = ('auth', 'db', 'serialize', 'io')
+
+# Statements kept per request for the slow-request log
+MAX_REQUEST_STATEMENTS = 200
+
+
+def metrics_access(authorization: str) -> int:
+    """Status for a /metrics request with this Authorization header: 200, 401 or 404 while disabled."""
+    if not METRICS_TOKEN:
+        return 404
+    scheme, _, token = (authorization or '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(token.strip().encode(), METRICS_TOKEN.encode()):
+        return 401
+    return 200
+
+
+class Histogram:
+    """Cumulative-bucket histogram; callers hold the registry lock."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(names: Iterable[str], values: Iterable) -> str:
+    """Format a label set, escaping values as the exposition format requires."""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return ','.join(pairs)
+
+
+class MetricsRegistry:
+    """Per-route request, response size and SQL metrics for one process."""
+
+    def __init__(self, prefix: str = 'flashcards'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._requests: Dict[Tuple[str, str, int], int] = {}
+        self._latency: Dict[Tuple[str, str], Histogram] = {}
+        self._sizes: Dict[Tuple[str, str], Histogram] = {}
+        self._sql_queries: Dict[Tuple[str, str], int] = {}
+        self._sql_seconds: Dict[Tuple[str, str], float] = {}
+        self._sql_latency = Histogram(LATENCY_BUCKETS)
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, float]]]] = []
+        self._started = time.time()
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, float]]]):
+        """Add a callable returning (name, type, help, value) samples, read on every render.
+
+        Names are prefixed like the built-in series; type is 'counter' or 'gauge'.
+        """
+        self._collectors.append(collector)
+
+    # Request lifecycle
+
+    def begin_request(self, capture_stacks: bool = False):
+        """Start timing a request and reset its SQL counters and phases (per thread).
+
+        With capture_stacks, the call stack of each statement is kept for request_stacks().
+        """
+        local = self._local
+        local.start = time.perf_counter()
+        local.queries = 0
+        local.query_seconds = 0.0
+        local.statements = []
+        local.stacks = [] if capture_stacks else None
+        local.phases = {}
+
+    def request_elapsed(self) -> float:
+        """Seconds since the current thread's request started."""
+        start = getattr(self._local, 'start', None)
+        return time.perf_counter() - start if start is not None else 0.0
+
+    @contextmanager
+    def phase(self, name: str):
+        """Add the time spent in the block to a named phase of the current request."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phases = getattr(self._local, 'phases', None)
+            if phases is not None:
+                phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+    def request_phases(self) -> Dict[str, float]:
+        """Seconds per phase so far in the current request, including 'db'."""
+        phases = dict(getattr(self._local, 'phases', None) or {})
+        queries, query_seconds = self.request_sql()
+        if queries:
+            phases['db'] = query_seconds
+        return phases
+
+    def request_statements(self) -> List[Tuple[str, float]]:
+        """(statement, seconds) for the SQL run so far in the current request."""
+        return list(getattr(self._local, 'statements', None) or [])
+
+    def request_stacks(self) -> List[traceback.StackSummary]:
+        """Call stacks matching request_statements(), if the request captures them."""
+        return list(getattr(self._local, 'stacks', None) or [])
+
+    def server_timing(self) -> str:
+        """Server-Timing header value for the current request, durations in ms."""
+        phases = self.request_phases()
+        parts = [f'{name};dur={phases[name] * 1000:.2f}' for name in TIMING_PHASES if name in phases]
+        parts.append(f'total;dur={self.request_elapsed() * 1000:.2f}')
+        return ', '.join(parts)
+
+    def request_sql(self) -> Tuple[int, float]:
+        """SQL query count and seconds so far in the current thread's request."""
+        local = self._local
+        return getattr(local, 'queries', 0), getattr(local, 'query_seconds', 0.0)
+
+    def end_request(self, route: str, method: str, status: int, size: int = 0) -> float:
+        """Record a finished request; returns its duration in seconds."""
+        local = self._local
+        elapsed = time.perf_counter() - getattr(local, 'start', time.perf_counter())
+        queries, query_seconds = self.request_sql()
+        local.start = None
+
+        key = (route, method)
+        with self._lock:
+            status_key = (route, method, status)
+            self._requests[status_key] = self._requests.get(status_key, 0) + 1
+
+            latency = self._latency.get(key)
+            if latency is None:
+                latency = self._latency[key] = Histogram(LATENCY_BUCKETS)
+            latency.observe(elapsed)
+
+            sizes = self._sizes.get(key)
+            if sizes is None:
+                sizes = self._sizes[key] = Histogram(SIZE_BUCKETS)
+            sizes.observe(size)
+
+            if queries:
+                self._sql_queries[key] = self._sql_queries.get(key, 0) + queries
+                self._sql_seconds[key] = self._sql_seconds.get(key, 0.0) + query_seconds
+        return elapsed
+
+    def observe_query(self, seconds: float, statement: str = None):
+        """Record one SQL statement, attributing it to the current request if any."""
+        local = self._local
+        if getattr(local, 'start', None) is not None:
+            local.queries += 1
+            local.query_seconds += seconds
+            if statement is not None and len(local.statements) < MAX_REQUEST_STATEMENTS:
+                local.statements.append((statement, seconds))
+                if local.stacks is not None:
+                    local.stacks.append(traceback.extract_stack())
+        with self._lock:
+            self._sql_latency.observe(seconds)
+
+    def instrument_engine(self, engine):
+        """Time every statement run on a SQLAlchemy engine."""
+        from sqlalchemy import event
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def _start_query(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def _end_query(conn, cursor, statement, parameters, context, executemany):
+            self.observe_query(time.perf_counter() - conn.info['query_start'].pop(), statement)
+
+    # Exposition
+
+    def _histogram_lines(self, name: str, label_names: Tuple[str, ...], label_values: Tuple, histogram: Histogram):
+        labels = _labels(label_names, label_values)
+        separator = ',' if labels else ''
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels}{separator}le="{bound:g}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels}{separator}le="+Inf"}} {histogram.count}'
+        suffix = f'{{{labels}}}' if labels else ''
+        yield f'{name}_sum{suffix} {histogram.sum:.6f}'
+        yield f'{name}_count{suffix} {histogram.count}'
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text format."""
+        p = self.prefix
+        lines = [
+            f'# HELP {p}_process_start_time_seconds Start time of the process since the Unix epoch.',
+            f'# TYPE {p}_process_start_time_seconds gauge',
+            f'{p}_process_start_time_seconds {self._started:.3f}',
+        ]
+
+        with self._lock:
+            lines += [
+                f'# HELP {p}_http_requests_total HTTP requests by route, method and status.',
+                f'# TYPE {p}_http_requests_total counter',
+            ]
+            for (route, method, status), count in sorted(self._requests.items()):
+                lines.append(f'{p}_http_requests_total{{{_labels(("route", "method", "status"), (route, method, status))}}} {count}')
+
+            lines += [
+                f'# HELP {p}_http_request_duration_seconds Request latency by route and method.',
+                f'# TYPE {p}_http_request_duration_seconds histogram',
+            ]
+            for key, histogram in sorted(self._latency.items()):
+                lines.extend(self._histogram_lines(f'{p}_http_request_duration_seconds', ('route', 'method'), key, histogram))
+
+            lines += [
+                f'# HELP {p}_http_response_size_bytes Response body size by route and method.',
+                f'# TYPE {p}_http_response_size_bytes histogram',
+            ]
+            for key, histogram in sorted(self._sizes.items()):
+                lines.extend(self._histogram_lines(f'{p}_http_response_size_bytes', ('route', 'method'), key, histogram))
+
+            lines += [
+                f'# HELP {p}_db_queries_total SQL statements run while serving each route.',
+                f'# TYPE {p}_db_queries_total counter',
+            ]
+            for key, count in sorted(self._sql_queries.items()):
+                lines.append(f'{p}_db_queries_total{{{_labels(("route", "method"), key)}}} {count}')
+
+            lines += [
+                f'# HELP {p}_db_query_seconds_total Time spent in SQL while serving each route.',
+                f'# TYPE {p}_db_query_seconds_total counter',
+            ]
+            for key, seconds in sorted(self._sql_seconds.items()):
+                lines.append(f'{p}_db_query_seconds_total{{{_labels(("route", "method"), key)}}} {seconds:.6f}')
+
+            lines += [
+                f'# HELP {p}_db_query_duration_seconds Latency of individual SQL statements.',
+                f'# TYPE {p}_db_query_duration_seconds histogram',
+            ]
+            lines.extend(self._histogram_lines(f'{p}_db_query_duration_seconds', (), (), self._sql_latency))
+
+        for collector in self._collectors:
+            for name, kind, help_text, value in collector():
+                lines += [
+                    f'# HELP {p}_{name} {help_text}',
+                    f'# TYPE {p}_{name} {kind}',
+                    f'{p}_{name} {value:g}',
+                ]
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,14 @@
+"""
+Indexes for the hottest queries:
+- recent activity in /api/stats orders a user's progress by last_seen
+- session aggregates filter UserSession by user_id
+- login matches the lowercased email next to the username
+"""
+
+from migrations import create_index
+
+
+def upgrade(connection):
+    create_index(connection, 'ix_user_progress_user_last_seen', 'user_progress', 'user_id, last_seen')
+    create_index(connection, 'ix_user_session_user_start', 'user_session', 'user_id, session_start')
+    create_index(connection, 'ix_user_email_lower', 'user', 'lower(email)')
@@ -0,0 +1,25 @@
+"""
+Columns added to existing tables since the first release:
+- UserProgress.due_at / interval_days / ease for the spaced-repetition queue
+- User.auth_epoch for revoking identity claims
+Existing progress rows become due at their last_seen time.
+"""
+
+from sqlalchemy import text
+
+from migrations import add_column_if_missing, create_index
+
+
+def upgrade(connection):
+    add_column_if_missing(connection, 'user', 'auth_epoch', 'INTEGER NOT NULL DEFAULT 0')
+    add_column_if_missing(connection, 'user_progress', 'due_at', 'INTEGER')
+    add_column_if_missing(connection, 'user_progress', 'interval_days', 'FLOAT DEFAULT 0.0')
+    add_column_if_missing(connection, 'user_progress', 'ease', 'FLOAT DEFAULT 2.5')
+
+    if connection.dialect.name == 'sqlite':
+        last_seen_epoch = "CAST(strftime('%s', last_seen) AS INTEGER)"
+    else:
+        last_seen_epoch = "CAST(EXTRACT(EPOCH FROM last_seen) AS INTEGER)"
+    connection.execute(text(f"UPDATE user_progress SET due_at = {last_seen_epoch} WHERE due_at IS NULL"))
+
+    create_index(connection, 'ix_user_progress_user_due', 'user_progress', 'user_id, due_at')
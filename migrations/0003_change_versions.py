@@ -0,0 +1,16 @@
+"""
+Per-user change versions for delta sync (GET /api/progress?since=N):
+- User.change_version is bumped on every progress and favorite write
+- UserProgress.version / UserFavorite.version record the write that touched them
+Removed favorites are kept in user_favorite_tombstone (created by db.create_all()).
+"""
+
+from migrations import add_column_if_missing, create_index
+
+
+def upgrade(connection):
+    add_column_if_missing(connection, 'user', 'change_version', 'INTEGER NOT NULL DEFAULT 0')
+    add_column_if_missing(connection, 'user_progress', 'version', 'INTEGER NOT NULL DEFAULT 0')
+    add_column_if_missing(connection, 'user_favorite', 'version', 'INTEGER NOT NULL DEFAULT 0')
+
+    create_index(connection, 'ix_user_progress_user_version', 'user_progress', 'user_id, version')
@@ -0,0 +1,11 @@
+"""
+Indexes for the keyset-paginated admin user listing (GET /api/admin/users),
+which pages through users by created_at or last_login with id as tie-breaker.
+"""
+
+from migrations import create_index
+
+
+def upgrade(connection):
+    create_index(connection, 'ix_user_created_at', 'user', 'created_at, id')
+    create_index(connection, 'ix_user_last_login', 'user', 'last_login, id')
@@ -0,0 +1,92 @@
+"""
+Schema migration runner for the Language Flash Cards Flask server.
+
+Migrations are numbered scripts in this package (0001_name.py), each with
+an upgrade(connection) function. Applied versions are recorded in the
+schema_migrations table, so every script runs once per database.
+"""
+
+import importlib.util
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import List, Tuple
+
+from sqlalchemy import inspect, text
+
+MIGRATIONS_DIR = Path(__file__).parent
+MIGRATION_FILE_PATTERN = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+
+def discover_migrations(directory: Path = MIGRATIONS_DIR) -> List[Tuple[int, str, Path]]:
+    """List (version, name, path) for every migration script, in order."""
+    migrations = []
+    for path in sorted(Path(directory).glob('*.py')):
+        match = MIGRATION_FILE_PATTERN.match(path.name)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), path))
+    return migrations
+
+
+def _load_migration(path: Path):
+    """Import a migration script by path (their names start with digits)."""
+    spec = importlib.util.spec_from_file_location(f'migrations.m{path.stem}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _ensure_migrations_table(connection):
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, "
+        "name VARCHAR(200) NOT NULL, "
+        "applied_at TIMESTAMP NOT NULL)"
+    ))
+
+
+def applied_versions(engine) -> set:
+    """Versions already recorded in schema_migrations."""
+    with engine.begin() as connection:
+        _ensure_migrations_table(connection)
+        return {row[0] for row in connection.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def run_migrations(engine, directory: Path = MIGRATIONS_DIR) -> List[str]:
+    """Apply pending migrations, each in its own transaction. Returns the names applied."""
+    done = applied_versions(engine)
+    applied = []
+
+    for version, name, path in discover_migrations(directory):
+        if version in done:
+            continue
+
+        module = _load_migration(path)
+        with engine.begin() as connection:
+            module.upgrade(connection)
+            connection.execute(
+                text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+                {'version': version, 'name': name, 'applied_at': datetime.utcnow()}
+            )
+        applied.append(f"{version:04d}_{name}")
+        print(f"✅ Applied migration {version:04d}_{name}")
+
+    return applied
+
+
+# Helpers for migration scripts
+
+def column_exists(connection, table: str, column: str) -> bool:
+    """Check whether a table already has a column."""
+    return any(info['name'] == column for info in inspect(connection).get_columns(table))
+
+
+def add_column_if_missing(connection, table: str, column: str, definition: str):
+    """Add a column unless db.create_all() already created it."""
+    if not column_exists(connection, table, column):
+        connection.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {definition}'))
+
+
+def create_index(connection, name: str, table: str, expression: str):
+    """Create an index if it doesn't exist yet."""
+    connection.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({expression})'))
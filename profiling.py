@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Slow-request log and sampled profiling for the Language Flash Cards servers.
+Requests slower than a threshold are logged with their phase timings and
+SQL; every Nth request can be run under cProfile and dumped to disk.
+"""
+
+import cProfile
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+BASE_DIR = Path(__file__).parent
+
+# Requests at least this slow are written to the slow-request log (0 disables)
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 500))
+SLOW_REQUEST_LOG = os.environ.get('SLOW_REQUEST_LOG', str(BASE_DIR / 'slow_requests.log'))
+
+# Profile 1 in N requests with cProfile (0 disables)
+PROFILE_SAMPLE_RATE = int(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', str(BASE_DIR / 'profiles'))
+
+
+class RequestProfiler:
+    """Logs slow requests and profiles a sample of them."""
+
+    def __init__(self, slow_ms: float = SLOW_REQUEST_MS, log_path: str = SLOW_REQUEST_LOG,
+                 sample_rate: int = PROFILE_SAMPLE_RATE, profile_dir: str = PROFILE_DIR):
+        self.slow_ms = slow_ms
+        self.log_path = Path(log_path)
+        self.sample_rate = sample_rate
+        self.profile_dir = Path(profile_dir)
+        self._counter = itertools.count(1)
+        self._log_lock = threading.Lock()
+
+    def start(self) -> Optional[cProfile.Profile]:
+        """Start profiling this request if it is the sampled one; pass the result to finish()."""
+        if self.sample_rate <= 0 or next(self._counter) % self.sample_rate:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already active in this thread
+            return None
+        return profile
+
+    def finish(self, profile: Optional[cProfile.Profile], method: str, path: str, route: str,
+               status: int, seconds: float, phases: Dict[str, float],
+               statements: List[Tuple[str, float]]) -> Optional[Path]:
+        """Stop a sampled profile and log the request if it was slow.
+
+        Returns the profile dump path, if one was written.
+        """
+        dump_path = None
+        if profile is not None:
+            profile.disable()
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+            slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+            dump_path = self.profile_dir / f'{time.strftime("%Y%m%d-%H%M%S")}-{method}-{slug}-{os.getpid()}.prof'
+            profile.dump_stats(str(dump_path))
+
+        if self.slow_ms > 0 and seconds * 1000 >= self.slow_ms:
+            entry = {
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'method': method,
+                'path': path,
+                'route': route,
+                'status': status,
+                'ms': round(seconds * 1000, 2),
+                'phases_ms': {name: round(value * 1000, 2) for name, value in phases.items()},
+                'queries': [{'ms': round(value * 1000, 2), 'sql': statement} for statement, value in statements],
+                'profile': str(dump_path) if dump_path else None
+            }
+            line = json.dumps(entry, ensure_ascii=False)
+            with self._log_lock:
+                self.log_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+            print(f"🐢 Slow request: {method} {path} {entry['ms']}ms ({len(statements)} queries)")
+
+        return dump_path
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+SQL query budgets for the Language Flash Cards API.
+Routes declare how many statements a request may run; going over fails
+the test suite and, in debug mode, logs the statements with the code
+that issued them.
+"""
+
+import os
+import threading
+import traceback
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+BASE_DIR = Path(__file__).parent
+
+# 'raise', 'log' or 'off'; unset means raise under tests, log in debug mode, otherwise off
+QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE', '').strip().lower()
+BUDGET_MODES = ('raise', 'log', 'off')
+
+# Innermost application frames shown per statement
+STACK_DEPTH = 6
+
+# Longer statements are cut short in budget reports
+MAX_STATEMENT_CHARS = 200
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A request or block ran more SQL statements than its budget allows."""
+
+
+def capture_stack() -> traceback.StackSummary:
+    """The current call stack, for attributing a statement to the code that issued it."""
+    return traceback.extract_stack()
+
+
+def _application_frames(stack: traceback.StackSummary) -> List[traceback.FrameSummary]:
+    """Frames from this project's code, leaving out the SQLAlchemy/Flask internals and this module."""
+    frames = []
+    for frame in stack:
+        path = Path(frame.filename)
+        if 'site-packages' in path.parts or path.name in ('query_budget.py', 'metrics.py'):
+            continue
+        if BASE_DIR in path.parents:
+            frames.append(frame)
+    return frames[-STACK_DEPTH:]
+
+
+def describe_statements(statements: Sequence[str], stacks: Optional[Sequence] = None) -> str:
+    """Numbered statements, each followed by the application frames that ran it."""
+    lines = []
+    for index, statement in enumerate(statements, 1):
+        statement = ' '.join(statement.split())
+        if len(statement) > MAX_STATEMENT_CHARS:
+            statement = statement[:MAX_STATEMENT_CHARS] + '...'
+        lines.append(f'  {index}. {statement}')
+        if stacks and index <= len(stacks):
+            for frame in reversed(_application_frames(stacks[index - 1])):
+                lines.append(f'       at {Path(frame.filename).name}:{frame.lineno} in {frame.name}')
+    return '\n'.join(lines)
+
+
+def budget_message(label: str, budget: int, count: int, statements: Sequence[str],
+                   stacks: Optional[Sequence] = None) -> str:
+    return (f'{label} ran {count} SQL statements, over its budget of {budget}:\n'
+            + describe_statements(statements, stacks))
+
+
+class QueryCounter:
+    """Records every statement run on an engine, from any thread, while active."""
+
+    def __init__(self, engine, capture_stacks: bool = True):
+        self.engine = engine
+        self.capture_stacks = capture_stacks
+        self.statements: List[str] = []
+        self.stacks: List[traceback.StackSummary] = []
+        self._lock = threading.Lock()
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        stack = capture_stack() if self.capture_stacks else None
+        with self._lock:
+            self.statements.append(statement)
+            if stack is not None:
+                self.stacks.append(stack)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        from sqlalchemy import event
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+        return False
+
+
+@contextmanager
+def assert_max_queries(engine, budget: int, label: str = 'Block'):
+    """Fail with QueryBudgetExceeded if the block runs more than `budget` statements on the engine."""
+    with QueryCounter(engine) as counter:
+        yield counter
+    if counter.count > budget:
+        raise QueryBudgetExceeded(budget_message(label, budget, counter.count, counter.statements, counter.stacks))
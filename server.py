@@ -4,16 +4,32 @@ Flask server for the Language Flash Cards web application.
 Handles user authentication, progress tracking, and API endpoints.
 """
 
-from flask import Flask, request, jsonify, session, send_from_directory, render_template_string
+from flask import Flask, abort, g, request, jsonify, session, send_file, send_from_directory, render_template_string
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import and_, case, cast, event, func, or_, select, text, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
 import os
 import sys
+import hashlib
 import json
+import re
+import time
 import webbrowser
 from pathlib import Path
+from static_assets import StaticAssets, etag_matches
+from migrations import run_migrations
+from media_files import MEDIA_CACHE_CONTROL, MediaFiles
+from serialization import encode_body
+from metrics import PROMETHEUS_CONTENT_TYPE, MetricsRegistry, metrics_access
+from profiling import RequestProfiler
+from user_catalog import DEFAULT_USERS_PAGE, encode_cursor, parse_list_params
+from query_budget import BUDGET_MODES, QUERY_BUDGET_MODE, QueryBudgetExceeded, budget_message
 
 # Get the directory where the script is located
 BASE_DIR = Path(__file__).parent
@@ -21,6 +37,28 @@ BASE_DIR = Path(__file__).parent
 # Application version
 APP_VERSION = "1.0.2"
 
+# Maximum number of study events accepted by /api/progress/batch
+MAX_PROGRESS_BATCH = 500
+
+# Spaced repetition (SM-2) scheduling parameters
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+LAPSE_EASE_PENALTY = 0.32  # SM-2 ease change for a "learning" (quality 2) answer
+RELEARN_DELAY_SECONDS = 10 * 60  # Cards marked "learning" come back after 10 minutes
+MAX_QUEUE_SIZE = 100
+
+# Card listing page sizes for /api/cards
+DEFAULT_CARDS_PAGE = 20
+MAX_CARDS_PAGE = 200
+
+# Deck produced by data_processor.py
+DECK_FILE = BASE_DIR / 'flashcards.json'
+
+# Full-text card search (SQLite FTS5)
+DEFAULT_SEARCH_RESULTS = 20
+MAX_SEARCH_RESULTS = 100
+UMLAUT_TRANSLITERATIONS = {'ä': 'ae', 'ö': 'oe', 'ü': 'ue'}
+
 # Configuration
 app = Flask(__name__)
 
@@ -41,11 +79,66 @@ else:
 # Use an absolute path for the database to avoid ambiguity
 DATABASE_URL = os.environ.get('DATABASE_URL', f'sqlite:///{BASE_DIR.joinpath("flashcards.db")}')
 
+# SQLite engine profiles, chosen with DB_PROFILE (defaults to FLASK_ENV).
+# WAL lets readers and a writer work at the same time; the busy timeout makes
+# writers wait for the lock instead of failing with "database is locked".
+SQLITE_PROFILES = {
+    'development': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout_ms': 5000,
+        'cache_size_kib': 16 * 1024,
+        'mmap_size': 0,
+        'pool_size': 5,
+        'max_overflow': 5,
+    },
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout_ms': 15000,
+        'cache_size_kib': 64 * 1024,
+        'mmap_size': 256 * 1024 * 1024,
+        'pool_size': 10,
+        'max_overflow': 20,
+    },
+}
+
+DB_PROFILE = os.environ.get('DB_PROFILE', FLASK_ENV)
+if DB_PROFILE not in SQLITE_PROFILES:
+    print(f"⚠️  Unknown DB_PROFILE '{DB_PROFILE}', using development settings")
+    DB_PROFILE = 'development'
+SQLITE_PROFILE = SQLITE_PROFILES[DB_PROFILE]
+
+def sqlite_engine_options(database_url, profile):
+    """SQLAlchemy engine options for a SQLite database under the given profile."""
+    if not database_url.startswith('sqlite'):
+        return {}
+    
+    options = {
+        'connect_args': {
+            'timeout': profile['busy_timeout_ms'] / 1000,
+            'check_same_thread': False,
+        },
+    }
+    # In-memory databases use a single shared connection and can't be pooled
+    if ':memory:' not in database_url and database_url not in ('sqlite://', 'sqlite:///'):
+        options['pool_size'] = profile['pool_size']
+        options['max_overflow'] = profile['max_overflow']
+    return options
+
 app.config['SECRET_KEY'] = SECRET_KEY
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_engine_options(DATABASE_URL, SQLITE_PROFILE)
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=30)
 
+# Lifetime of the signed identity claims kept in the session cookie.
+# Within it, authenticated requests skip the User lookup; 0 disables the fast path.
+AUTH_CLAIMS_TTL = int(os.environ.get('AUTH_CLAIMS_TTL', 300))
+
+# Usernames allowed to use the admin API, comma-separated
+ADMIN_USERNAMES = {name.strip() for name in os.environ.get('ADMIN_USERNAMES', '').split(',') if name.strip()}
+
 # Session configuration for better persistence
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
@@ -62,6 +155,73 @@ else:
 db = SQLAlchemy(app)
 CORS(app, supports_credentials=True)
 
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply the SQLite profile to every new connection."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_PROFILE['journal_mode']}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_PROFILE['synchronous']}")
+    cursor.execute(f"PRAGMA busy_timeout={int(SQLITE_PROFILE['busy_timeout_ms'])}")
+    # Negative cache_size is in KiB rather than pages
+    cursor.execute(f"PRAGMA cache_size=-{int(SQLITE_PROFILE['cache_size_kib'])}")
+    cursor.execute(f"PRAGMA mmap_size={int(SQLITE_PROFILE['mmap_size'])}")
+    cursor.close()
+
+# Per-route request and SQL metrics for this process, served at /metrics
+metrics = MetricsRegistry()
+
+# Slow-request log and sampled cProfile dumps (see profiling.py)
+profiler = RequestProfiler()
+
+with app.app_context():
+    if db.engine.dialect.name == 'sqlite':
+        event.listen(db.engine, 'connect', apply_sqlite_pragmas)
+    metrics.instrument_engine(db.engine)
+
+def check_database_settings():
+    """Report the database settings actually in effect on a live connection."""
+    settings = {'profile': DB_PROFILE, 'dialect': db.engine.dialect.name}
+    if db.engine.dialect.name == 'sqlite':
+        with db.engine.connect() as connection:
+            for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size'):
+                settings[pragma] = connection.exec_driver_sql(f'PRAGMA {pragma}').scalar()
+    pool = db.engine.pool
+    settings['pool'] = type(pool).__name__
+    if hasattr(pool, 'size'):
+        settings['pool_size'] = pool.size()
+    return settings
+
+def print_database_settings():
+    """Print the database settings in effect, warning where they differ from the profile."""
+    with app.app_context():
+        settings = check_database_settings()
+    
+    print(f"🗄️  Database profile: {settings['profile']} ({settings['dialect']}, {settings['pool']})")
+    if settings['dialect'] != 'sqlite':
+        return settings
+    
+    synchronous_names = {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'}
+    expected = {
+        'journal_mode': SQLITE_PROFILE['journal_mode'].lower(),
+        'synchronous': SQLITE_PROFILE['synchronous'].upper(),
+        'busy_timeout': SQLITE_PROFILE['busy_timeout_ms'],
+    }
+    actual = {
+        'journal_mode': str(settings['journal_mode']).lower(),
+        'synchronous': synchronous_names.get(settings['synchronous'], settings['synchronous']),
+        'busy_timeout': settings['busy_timeout'],
+    }
+    for name, value in actual.items():
+        marker = '✅' if value == expected[name] else '⚠️ '
+        print(f"   {marker} {name} = {value}")
+    print(f"   cache_size = {settings['cache_size']}, mmap_size = {settings['mmap_size']}")
+    return settings
+
+# Fingerprinted, precompressed front-end files (see static_assets.py)
+static_assets = StaticAssets()
+
+# Audio and image files, with a cached stat table
+media_files = MediaFiles()
+
 # Database Models
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -70,10 +230,20 @@ class User(db.Model):
     password_hash = db.Column(db.String(128), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime, default=datetime.utcnow)
+    auth_epoch = db.Column(db.Integer, default=0, nullable=False)  # Bumped to revoke issued claims
+    change_version = db.Column(db.Integer, default=0, nullable=False)  # Bumped on every progress, favorite or study-session write
+    
+    # Relationships; handlers query these tables directly, so loading a collection is a bug
+    progress = db.relationship('UserProgress', backref='user', lazy='raise_on_sql', cascade='all, delete-orphan')
+    favorites = db.relationship('UserFavorite', backref='user', lazy='raise_on_sql', cascade='all, delete-orphan')
     
-    # Relationships
-    progress = db.relationship('UserProgress', backref='user', lazy=True, cascade='all, delete-orphan')
-    favorites = db.relationship('UserFavorite', backref='user', lazy=True, cascade='all, delete-orphan')
+    # Login matches the lowercased email (see migrations/0001_hot_path_indexes.py);
+    # the admin listing pages through created_at and last_login (0004)
+    __table_args__ = (
+        db.Index('ix_user_email_lower', func.lower(email)),
+        db.Index('ix_user_created_at', 'created_at', 'id'),
+        db.Index('ix_user_last_login', 'last_login', 'id'),
+    )
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -111,21 +281,55 @@ class UserProgress(db.Model):
     study_streak = db.Column(db.Integer, default=0)
     difficulty_rating = db.Column(db.Float, default=0.5)  # 0.0 = easy, 1.0 = hard
     
-    # Unique constraint
-    __table_args__ = (db.UniqueConstraint('user_id', 'card_id', name='_user_card_progress'),)
+    # Spaced repetition schedule (SM-2)
+    due_at = db.Column(db.Integer)  # Unix timestamp (UTC) when the card is next due
+    interval_days = db.Column(db.Float, default=0.0)
+    ease = db.Column(db.Float, default=DEFAULT_EASE)
+    
+    # User.change_version of the last write, for delta sync
+    version = db.Column(db.Integer, default=0, nullable=False)
+    
+    # Unique constraint, due-queue, recent-activity and delta-sync indexes
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'card_id', name='_user_card_progress'),
+        db.Index('ix_user_progress_user_due', 'user_id', 'due_at'),
+        db.Index('ix_user_progress_user_last_seen', 'user_id', 'last_seen'),
+        db.Index('ix_user_progress_user_version', 'user_id', 'version'),
+    )
     
     def to_dict(self):
+        return UserProgress.row_to_dict(self)
+    
+    @staticmethod
+    def columns():
+        """The columns row_to_dict() needs, for selects that skip the ORM."""
+        return (
+            UserProgress.card_id, UserProgress.known_count, UserProgress.learning_count,
+            UserProgress.total_attempts, UserProgress.correct_attempts, UserProgress.first_seen,
+            UserProgress.last_seen, UserProgress.study_streak, UserProgress.difficulty_rating,
+            UserProgress.due_at, UserProgress.interval_days, UserProgress.ease
+        )
+    
+    @staticmethod
+    def row_to_dict(row):
+        """Build the API shape from a model or a projected row.
+        
+        Datetimes are left as-is for json_response() to encode.
+        """
         return {
-            'card_id': self.card_id,
-            'known_count': self.known_count,
-            'learning_count': self.learning_count,
-            'total_attempts': self.total_attempts,
-            'correct_attempts': self.correct_attempts,
-            'accuracy': self.correct_attempts / max(self.total_attempts, 1),
-            'first_seen': self.first_seen.isoformat(),
-            'last_seen': self.last_seen.isoformat(),
-            'study_streak': self.study_streak,
-            'difficulty_rating': self.difficulty_rating
+            'card_id': row.card_id,
+            'known_count': row.known_count,
+            'learning_count': row.learning_count,
+            'total_attempts': row.total_attempts,
+            'correct_attempts': row.correct_attempts,
+            'accuracy': row.correct_attempts / max(row.total_attempts, 1),
+            'first_seen': row.first_seen,
+            'last_seen': row.last_seen,
+            'study_streak': row.study_streak,
+            'difficulty_rating': row.difficulty_rating,
+            'due_at': datetime.utcfromtimestamp(row.due_at) if row.due_at is not None else None,
+            'interval_days': row.interval_days,
+            'ease': row.ease
         }
 
 class UserFavorite(db.Model):
@@ -133,10 +337,20 @@ class UserFavorite(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     card_id = db.Column(db.String(50), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    version = db.Column(db.Integer, default=0, nullable=False)  # User.change_version when added
     
     # Unique constraint
     __table_args__ = (db.UniqueConstraint('user_id', 'card_id', name='_user_card_favorite'),)
 
+class UserFavoriteTombstone(db.Model):
+    """Marks a removed favorite so delta sync can tell clients to drop it."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    card_id = db.Column(db.String(50), nullable=False)
+    version = db.Column(db.Integer, nullable=False)  # User.change_version when removed
+    
+    __table_args__ = (db.UniqueConstraint('user_id', 'card_id', name='_user_card_favorite_tombstone'),)
+
 class UserSession(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -146,28 +360,301 @@ class UserSession(db.Model):
     cards_known = db.Column(db.Integer, default=0)
     cards_learning = db.Column(db.Integer, default=0)
     total_time_seconds = db.Column(db.Integer, default=0)
+    
+    __table_args__ = (db.Index('ix_user_session_user_start', 'user_id', 'session_start'),)
+
+class Card(db.Model):
+    """A flashcard from the deck, loaded from flashcards.json."""
+    id = db.Column(db.String(50), primary_key=True)
+    position = db.Column(db.Integer, nullable=False, unique=True)  # Deck order, used as the page cursor
+    level = db.Column(db.String(20), default='')
+    primary_text = db.Column(db.String(200), nullable=False)
+    secondary_text = db.Column(db.String(200))
+    audio_url = db.Column(db.String(300))
+    image_url = db.Column(db.String(300))
+    translation = db.Column(db.String(200))
+    example = db.Column(db.Text)
+    notes = db.Column(db.String(200))
+    
+    __table_args__ = (db.Index('ix_card_level_position', 'level', 'position'),)
+    
+    @staticmethod
+    def row_from_json(data, position):
+        """Map a flashcards.json entry to Card column values."""
+        front = data.get('front', {})
+        back = data.get('back', {})
+        return {
+            'id': data['id'],
+            'position': position,
+            'level': data.get('level', ''),
+            'primary_text': front.get('primaryText', ''),
+            'secondary_text': front.get('secondaryText'),
+            'audio_url': front.get('audioUrl'),
+            'image_url': front.get('imageUrl'),
+            'translation': back.get('translation'),
+            'example': back.get('example'),
+            'notes': back.get('notes')
+        }
+    
+    def to_dict(self, is_favourite=False):
+        """Serialize in the same shape as a flashcards.json entry."""
+        return {
+            'id': self.id,
+            'front': {
+                'primaryText': self.primary_text,
+                'secondaryText': self.secondary_text,
+                'audioUrl': self.audio_url,
+                'imageUrl': self.image_url
+            },
+            'back': {
+                'translation': self.translation,
+                'example': self.example,
+                'notes': self.notes
+            },
+            'isFavourite': is_favourite,
+            'level': self.level
+        }
+
+class UserStats(db.Model):
+    """Per-user rollup of the figures served by /api/stats, kept current on every write."""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    total_cards_studied = db.Column(db.Integer, default=0, nullable=False)
+    known_cards = db.Column(db.Integer, default=0, nullable=False)
+    learning_cards = db.Column(db.Integer, default=0, nullable=False)
+    accuracy_sum = db.Column(db.Float, default=0.0, nullable=False)  # Sum of per-card accuracy
+    study_streak = db.Column(db.Integer)  # NULL = needs recomputing after a streak reset
+    total_sessions = db.Column(db.Integer, default=0, nullable=False)
+    total_study_time_seconds = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'total_cards_studied': self.total_cards_studied,
+            'known_cards': self.known_cards,
+            'learning_cards': self.learning_cards,
+            'total_sessions': self.total_sessions,
+            'total_study_time_seconds': self.total_study_time_seconds,
+            'average_accuracy': self.accuracy_sum / max(self.total_cards_studied, 1),
+            'study_streak': self.study_streak or 0
+        }
 
 # Helper Functions
+
+# Who the request is for, as far as most API handlers need to know
+Identity = namedtuple('Identity', 'id username')
+
+# Latest auth epoch seen per user id; claims with an older epoch are revoked
+revocation_epochs = {}
+
 def get_current_user():
-    """Get the current logged-in user."""
+    """Get the current logged-in user (one database lookup per request)."""
     if 'user_id' not in session:
         return None
-    return User.query.get(session['user_id'])
+    if 'current_user' not in g:
+        user = db.session.get(User, session['user_id'])
+        if user and session.get('auth_epoch', 0) < (user.auth_epoch or 0):
+            # Signed in before a "log out on all devices"
+            session.clear()
+            user = None
+        g.current_user = user
+    return g.current_user
+
+def issue_identity_claims(user):
+    """Store short-lived identity claims for the user in the signed session cookie."""
+    epoch = user.auth_epoch or 0
+    revocation_epochs[user.id] = max(revocation_epochs.get(user.id, 0), epoch)
+    session['auth_epoch'] = epoch
+    if AUTH_CLAIMS_TTL > 0:
+        session['claims'] = {
+            'uid': user.id,
+            'username': user.username,
+            'epoch': epoch,
+            'exp': int(time.time()) + AUTH_CLAIMS_TTL
+        }
+    return Identity(user.id, user.username)
+
+def get_current_identity():
+    """Get the current user's id and username, avoiding the User table when possible.
+    
+    Valid, unrevoked claims in the session are trusted as-is; otherwise the
+    user is loaded from the database and fresh claims are issued.
+    """
+    if 'identity' in g:
+        return g.identity
+    
+    identity = None
+    claims = session.get('claims')
+    if (
+        AUTH_CLAIMS_TTL > 0
+        and claims
+        and claims.get('uid') == session.get('user_id')
+        and claims.get('exp', 0) > time.time()
+        and claims.get('epoch', 0) >= revocation_epochs.get(claims['uid'], 0)
+    ):
+        identity = Identity(claims['uid'], claims['username'])
+    else:
+        user = get_current_user()
+        if user:
+            identity = issue_identity_claims(user)
+        else:
+            session.pop('claims', None)
+    
+    g.identity = identity
+    return identity
+
+def revoke_user_sessions(user):
+    """Invalidate all identity claims issued to a user, on every device."""
+    user.auth_epoch = (user.auth_epoch or 0) + 1
+    revocation_epochs[user.id] = user.auth_epoch
 
 def require_auth():
     """Decorator to require authentication."""
     def decorator(f):
         def wrapper(*args, **kwargs):
-            if not get_current_user():
+            with metrics.phase('auth'):
+                identity = get_current_identity()
+            if not identity:
                 return jsonify({'error': 'Authentication required'}), 401
             return f(*args, **kwargs)
         wrapper.__name__ = f.__name__
         return wrapper
     return decorator
 
+def require_admin():
+    """Decorator to require a user listed in ADMIN_USERNAMES."""
+    def decorator(f):
+        def wrapper(*args, **kwargs):
+            with metrics.phase('auth'):
+                identity = get_current_identity()
+            if not identity:
+                return jsonify({'error': 'Authentication required'}), 401
+            if identity.username not in ADMIN_USERNAMES:
+                return jsonify({'error': 'Admin access required'}), 403
+            return f(*args, **kwargs)
+        wrapper.__name__ = f.__name__
+        return wrapper
+    return decorator
+
+def user_etag(user_id, resource, version):
+    """Weak ETag for a per-user resource at a given change version."""
+    if request.query_string:
+        # Different query strings (e.g. ?since=N) are different representations
+        resource += '-' + hashlib.sha1(request.query_string).hexdigest()[:8]
+    return f'W/"{resource}-{user_id}-{version}"'
+
+def conditional_user_get(resource):
+    """Decorator tagging a per-user GET response with an ETag from the user's change version.
+    
+    A matching If-None-Match gets a 304 after a single version lookup. The
+    current version is left in g.change_version for the view.
+    """
+    def decorator(f):
+        def wrapper(*args, **kwargs):
+            user = get_current_identity()
+            g.change_version = current_change_version(user.id)
+            etag = user_etag(user.id, resource, g.change_version)
+            
+            if etag_matches(request.headers.get('If-None-Match'), etag):
+                response = app.response_class(status=304)
+            else:
+                response = app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            
+            response.headers['ETag'] = etag
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.vary.add('Cookie')
+            return response
+        wrapper.__name__ = f.__name__
+        return wrapper
+    return decorator
+
+def query_budget_mode():
+    """'raise' under tests, 'log' in debug mode and 'off' otherwise, unless QUERY_BUDGET_MODE is set."""
+    if QUERY_BUDGET_MODE in BUDGET_MODES:
+        return QUERY_BUDGET_MODE
+    if app.testing:
+        return 'raise'
+    return 'log' if app.debug else 'off'
+
+def query_budget(limit):
+    """Decorator declaring the most SQL statements one request to the route may run.
+    
+    Budgets cover the worst path, including the auth lookup when the session
+    claims have expired. A callable limit is evaluated after the view runs,
+    for routes whose work grows with the request.
+    """
+    def decorator(f):
+        def wrapper(*args, **kwargs):
+            response = f(*args, **kwargs)
+            mode = query_budget_mode()
+            if mode != 'off':
+                budget = limit() if callable(limit) else limit
+                count, _ = metrics.request_sql()
+                if count > budget:
+                    statements = [statement for statement, _ in metrics.request_statements()]
+                    message = budget_message(f'{request.method} {request.path}', budget, count,
+                                             statements, metrics.request_stacks())
+                    if mode == 'raise':
+                        raise QueryBudgetExceeded(message)
+                    print(f"⚠️  Query budget exceeded: {message}")
+            return response
+        wrapper.__name__ = f.__name__
+        wrapper.query_budget = limit
+        return wrapper
+    return decorator
+
+def json_response(data, status=200):
+    """Compact JSON response, gzipped when large and the client accepts it."""
+    with metrics.phase('serialize'):
+        body, encoding = encode_body(data, request.headers.get('Accept-Encoding', ''))
+    response = app.response_class(body, status=status, mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+def select_progress(*criteria, order_by=None, limit=None):
+    """Progress rows as API dicts, selected column by column without loading ORM objects."""
+    stmt = select(*UserProgress.columns()).where(*criteria)
+    if order_by is not None:
+        stmt = stmt.order_by(order_by)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return [UserProgress.row_to_dict(row) for row in db.session.execute(stmt)]
+
+@app.before_request
+def start_request_metrics():
+    metrics.begin_request(capture_stacks=query_budget_mode() != 'off')
+    g.profile = profiler.start()
+
+@app.after_request
+def record_request_metrics(response):
+    # File responses carry it too, for their 'io' phase
+    if request.path.startswith('/api/') or 'io' in metrics.request_phases():
+        response.headers['Server-Timing'] = metrics.server_timing()
+    
+    # Label by URL rule rather than path so card IDs don't explode the series
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    elapsed = metrics.end_request(route, request.method, response.status_code, response.content_length or 0)
+    profiler.finish(g.pop('profile', None), request.method, request.full_path.rstrip('?'), route,
+                    response.status_code, elapsed, metrics.request_phases(), metrics.request_statements())
+    return response
+
+@app.teardown_request
+def stop_unfinished_profile(exc):
+    # after_request is skipped if the response itself failed
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.disable()
+
 # API Routes
+#
+# Each route declares a query budget: the most SQL statements one request may
+# run on its worst path. Going over fails the tests and is logged in debug mode.
 
 @app.route('/api/register', methods=['POST'])
+@query_budget(4)
 def register():
     """Register a new user."""
     try:
@@ -201,6 +688,7 @@ def register():
         # Log the user in
         session['user_id'] = user.id
         session.permanent = True
+        issue_identity_claims(user)
         
         return jsonify({
             'success': True,
@@ -213,6 +701,7 @@ def register():
         return jsonify({'error': f'Registration failed: {str(e)}'}), 500
 
 @app.route('/api/login', methods=['POST'])
+@query_budget(3)
 def login():
     """Login a user."""
     try:
@@ -228,7 +717,7 @@ def login():
         
         # Find user by username or email
         user = User.query.filter(
-            (User.username == username) | (User.email == username.lower())
+            (User.username == username) | (func.lower(User.email) == username.lower())
         ).first()
         
         if not user:
@@ -248,6 +737,7 @@ def login():
         # Create session
         session['user_id'] = user.id
         session.permanent = True
+        issue_identity_claims(user)
         
         return jsonify({
             'success': True,
@@ -259,12 +749,21 @@ def login():
         return jsonify({'error': f'Login failed: {str(e)}'}), 500
 
 @app.route('/api/logout', methods=['POST'])
+@query_budget(2)
 def logout():
-    """Logout the current user."""
+    """Logout the current user, optionally on all devices."""
+    data = request.get_json(silent=True) or {}
+    if data.get('all_devices'):
+        user = get_current_user()
+        if user:
+            revoke_user_sessions(user)
+            db.session.commit()
+    
     session.clear()
     return jsonify({'success': True, 'message': 'Logged out successfully'})
 
 @app.route('/api/user', methods=['GET'])
+@query_budget(1)
 @require_auth()
 def get_user():
     """Get current user info."""
@@ -272,24 +771,297 @@ def get_user():
     return jsonify({'user': user.to_dict()})
 
 @app.route('/api/progress', methods=['GET'])
+@query_budget(5)
 @require_auth()
+@conditional_user_get('progress')
 def get_progress():
-    """Get user's learning progress."""
-    user = get_current_user()
-    progress_records = UserProgress.query.filter_by(user_id=user.id).all()
+    """Get user's learning progress.
+    
+    With ?since=N only progress rows and favorites changed after change
+    version N are returned, plus the favorites removed since then.
+    """
+    user = get_current_identity()
+    version = g.change_version
+    since = request.args.get('since', type=int)
+    
+    # A client ahead of the server (e.g. after a database reset) needs everything
+    if since is None or since > version:
+        progress = {record['card_id']: record for record in select_progress(UserProgress.user_id == user.id)}
+        return json_response({'progress': progress, 'version': version, 'full': True})
+    
+    changed = select_progress(UserProgress.user_id == user.id, UserProgress.version > since)
+    added = db.session.query(UserFavorite.card_id).filter(
+        UserFavorite.user_id == user.id,
+        UserFavorite.version > since
+    )
+    removed = db.session.query(UserFavoriteTombstone.card_id).filter(
+        UserFavoriteTombstone.user_id == user.id,
+        UserFavoriteTombstone.version > since
+    )
+    
+    return json_response({
+        'progress': {record['card_id']: record for record in changed},
+        'favorites': {
+            'added': [card_id for (card_id,) in added],
+            'removed': [card_id for (card_id,) in removed]
+        },
+        'version': version,
+        'since': since,
+        'full': False
+    })
+
+def to_unix_timestamp(value):
+    """Convert a naive UTC datetime to an integer Unix timestamp."""
+    return int(value.replace(tzinfo=timezone.utc).timestamp())
+
+def load_cards(deck_file=DECK_FILE):
+    """Replace the Card table with the deck in flashcards.json. Returns the number of cards loaded."""
+    with open(deck_file, 'r', encoding='utf-8') as f:
+        deck = json.load(f)
+    
+    Card.query.delete()
+    db.session.execute(
+        Card.__table__.insert(),
+        [Card.row_from_json(card, position) for position, card in enumerate(deck, start=1)]
+    )
+    rebuild_card_search_index()
+    db.session.commit()
+    return len(deck)
+
+def fold_search_text(value):
+    """Fold German text for searching: lowercase and ß -> ss.
+    
+    The FTS5 tokenizer strips the remaining diacritics (ü -> u). Words with
+    umlauts also get their ae/oe/ue spelling so "muell" finds "Müll".
+    """
+    folded = (value or '').lower().replace('ß', 'ss')
+    transliterated = folded
+    for umlaut, replacement in UMLAUT_TRANSLITERATIONS.items():
+        transliterated = transliterated.replace(umlaut, replacement)
+    if transliterated != folded:
+        folded = f'{folded} {transliterated}'
+    return folded
+
+def rebuild_card_search_index():
+    """(Re)build the card_search FTS5 table from the Card table.
+    
+    Returns False when FTS5 is unavailable (e.g. not SQLite); search then
+    falls back to LIKE queries.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    try:
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS card_search USING fts5("
+            "card_id UNINDEXED, primary_text, translation, example, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        ))
+    except OperationalError as e:
+        print(f"⚠️  Card search index unavailable: {e}")
+        db.session.rollback()
+        return False
+    
+    db.session.execute(text("DELETE FROM card_search"))
+    rows = db.session.query(Card.id, Card.primary_text, Card.translation, Card.example)
+    db.session.execute(
+        text("INSERT INTO card_search (card_id, primary_text, translation, example) "
+             "VALUES (:card_id, :primary_text, :translation, :example)"),
+        [
+            {
+                'card_id': card_id,
+                'primary_text': fold_search_text(primary_text),
+                'translation': fold_search_text(translation),
+                'example': fold_search_text(example),
+            }
+            for card_id, primary_text, translation, example in rows
+        ]
+    )
+    return True
+
+def card_search_index_ready():
+    """Check whether the card_search FTS5 table exists and has rows."""
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    try:
+        return db.session.execute(text("SELECT 1 FROM card_search LIMIT 1")).first() is not None
+    except OperationalError:
+        db.session.rollback()
+        return False
+
+def search_cards(query, limit=DEFAULT_SEARCH_RESULTS):
+    """Search cards by German word, translation or example, with prefix matching."""
+    terms = re.findall(r'\w+', (query or '').lower().replace('ß', 'ss'))
+    if not terms:
+        return []
     
-    progress = {}
-    for record in progress_records:
-        progress[record.card_id] = record.to_dict()
+    if card_search_index_ready():
+        # Quote every term so user input can't inject FTS5 syntax
+        match = ' '.join(f'"{term}"*' for term in terms)
+        card_ids = [
+            card_id for (card_id,) in db.session.execute(
+                text("SELECT card_id FROM card_search WHERE card_search MATCH :match "
+                     "ORDER BY bm25(card_search, 0.0, 10.0, 5.0, 1.0) LIMIT :limit"),
+                {'match': match, 'limit': limit}
+            )
+        ]
+        cards = {card.id: card for card in Card.query.filter(Card.id.in_(card_ids))}
+        return [cards[card_id] for card_id in card_ids if card_id in cards]
     
-    return jsonify({'progress': progress})
+    # Fallback without FTS5: every term must appear in one of the fields
+    conditions = [
+        or_(
+            Card.primary_text.ilike(f'%{term}%'),
+            Card.translation.ilike(f'%{term}%'),
+            Card.example.ilike(f'%{term}%')
+        )
+        for term in terms
+    ]
+    return Card.query.filter(*conditions).order_by(Card.position).limit(limit).all()
+
+def parse_event_timestamp(ts):
+    """Parse a client event timestamp (epoch milliseconds or ISO string)."""
+    if ts is None:
+        return datetime.utcnow()
+    if isinstance(ts, bool):
+        raise ValueError(f'Invalid timestamp: {ts!r}')
+    if isinstance(ts, (int, float)):
+        return datetime.utcfromtimestamp(ts / 1000.0)
+    if isinstance(ts, str):
+        parsed = datetime.fromisoformat(ts.replace('Z', '+00:00'))
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+    raise ValueError(f'Invalid timestamp: {ts!r}')
+
+def _upsert_dialect_insert():
+    """Return the dialect-specific insert() that supports ON CONFLICT."""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        return sqlite_insert
+    if dialect == 'postgresql':
+        return postgresql_insert
+    raise RuntimeError(f'Progress upserts are not supported on {dialect}')
+
+def next_change_version(user_id):
+    """Atomically bump and return the user's change version."""
+    table = User.__table__
+    return db.session.execute(
+        update(table).where(table.c.id == user_id)
+        .values(change_version=table.c.change_version + 1)
+        .returning(table.c.change_version)
+    ).scalar_one()
+
+def current_change_version(user_id):
+    """The user's latest change version."""
+    return db.session.query(User.change_version).filter(User.id == user_id).scalar() or 0
+
+def build_progress_upsert(user_id, card_id, action, now=None, version=0):
+    """Build one INSERT ... ON CONFLICT DO UPDATE applying a study action ('known', 'learning', 'attempt').
+    
+    The SM-2 schedule is updated in the same statement: a "known" answer
+    grows the interval (1 day, 6 days, then interval * ease), a "learning"
+    answer resets it, lowers the ease and brings the card back shortly.
+    """
+    now = now or datetime.utcnow()
+    now_ts = to_unix_timestamp(now)
+    table = UserProgress.__table__
+    known = action == 'known'
+    learning = action == 'learning'
+    
+    # Values for a card seen for the first time
+    initial_difficulty = 0.5
+    if known:
+        initial_difficulty -= 0.1
+    elif learning:
+        initial_difficulty += 0.1
+    
+    insert_values = {
+        'user_id': user_id,
+        'card_id': card_id,
+        'known_count': int(known),
+        'learning_count': int(learning),
+        'total_attempts': 1,
+        'correct_attempts': int(known),
+        'first_seen': now,
+        'last_seen': now,
+        'last_known': now if known else None,
+        'last_learning': now if learning else None,
+        'study_streak': int(known),
+        'difficulty_rating': initial_difficulty,
+        'version': version,
+        'ease': DEFAULT_EASE,
+        'interval_days': 0.0,
+        'due_at': now_ts,
+    }
+    if known:
+        insert_values['interval_days'] = 1.0
+        insert_values['due_at'] = now_ts + 86400
+    elif learning:
+        insert_values['ease'] = max(MIN_EASE, DEFAULT_EASE - LAPSE_EASE_PENALTY)
+        insert_values['due_at'] = now_ts + RELEARN_DELAY_SECONDS
+    
+    # Counter updates for an existing card, evaluated inside the database
+    update_values = {
+        'version': version,
+        'last_seen': now,
+        'total_attempts': table.c.total_attempts + 1,
+    }
+    
+    if known:
+        lowered = table.c.difficulty_rating - 0.1
+        # study_streak is the SM-2 repetition count before this answer
+        next_interval = case(
+            (table.c.study_streak == 0, 1.0),
+            (table.c.study_streak == 1, 6.0),
+            else_=table.c.interval_days * table.c.ease
+        )
+        update_values.update({
+            'known_count': table.c.known_count + 1,
+            'correct_attempts': table.c.correct_attempts + 1,
+            'last_known': now,
+            'study_streak': table.c.study_streak + 1,
+            # Decrease difficulty if consistently correct
+            'difficulty_rating': case((lowered < 0.0, 0.0), else_=lowered),
+            'interval_days': next_interval,
+            'due_at': now_ts + cast(next_interval * 86400, db.Integer),
+        })
+    elif learning:
+        raised = table.c.difficulty_rating + 0.1
+        reduced_ease = table.c.ease - LAPSE_EASE_PENALTY
+        update_values.update({
+            'learning_count': table.c.learning_count + 1,
+            'last_learning': now,
+            'study_streak': 0,
+            # Increase difficulty if struggling
+            'difficulty_rating': case((raised > 1.0, 1.0), else_=raised),
+            'ease': case((reduced_ease < MIN_EASE, MIN_EASE), else_=reduced_ease),
+            'interval_days': 0.0,
+            'due_at': now_ts + RELEARN_DELAY_SECONDS,
+        })
+    
+    insert = _upsert_dialect_insert()
+    return insert(UserProgress).values(**insert_values).on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.card_id],
+        set_=update_values
+    ).returning(UserProgress)
+
+def record_progress(user_id, card_id, action, now=None, version=None):
+    """Atomically apply a study action and return the updated UserProgress row."""
+    if version is None:
+        version = next_change_version(user_id)
+    statement = build_progress_upsert(user_id, card_id, action, now, version)
+    return db.session.scalars(
+        statement,
+        execution_options={'populate_existing': True}
+    ).one()
 
 @app.route('/api/progress', methods=['POST'])
+@query_budget(8)
 @require_auth()
 def save_progress():
     """Save user's learning progress."""
     try:
-        user = get_current_user()
+        user = get_current_identity()
         data = request.get_json()
         
         if not data or 'card_id' not in data:
@@ -298,72 +1070,359 @@ def save_progress():
         card_id = data['card_id']
         action = data.get('action')  # 'known', 'learning', 'attempt'
         
-        # Find or create progress record
-        progress = UserProgress.query.filter_by(
-            user_id=user.id, 
-            card_id=card_id
-        ).first()
+        # A lapse only invalidates the rollup's streak if this card may have held it
+        previous_streak = current_streaks(user.id, [card_id]).get(card_id, 0) if action == 'learning' else 0
         
-        if not progress:
-            progress = UserProgress(user_id=user.id, card_id=card_id)
-            db.session.add(progress)
+        # Insert or update the progress record in a single statement
+        progress = record_progress(user.id, card_id, action)
+        apply_stats_delta(user.id, **progress_stats_delta(progress, action, previous_streak))
         
-        # Update progress based on action
-        progress.last_seen = datetime.utcnow()
-        progress.total_attempts += 1
+        # Serialize before commit; committing expires the record and would reload it
+        result = progress.to_dict()
+        db.session.commit()
         
-        if action == 'known':
-            progress.known_count += 1
-            progress.correct_attempts += 1
-            progress.last_known = datetime.utcnow()
-            progress.study_streak += 1
-            # Decrease difficulty if consistently correct
-            progress.difficulty_rating = max(0.0, progress.difficulty_rating - 0.1)
-            
-        elif action == 'learning':
-            progress.learning_count += 1
-            progress.last_learning = datetime.utcnow()
-            progress.study_streak = 0
-            # Increase difficulty if struggling
-            progress.difficulty_rating = min(1.0, progress.difficulty_rating + 0.1)
+        return json_response({
+            'success': True,
+            'progress': result
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to save progress: {str(e)}'}), 500
+
+@app.route('/api/progress/batch', methods=['POST'])
+@query_budget(lambda: 7 + g.get('batch_size', 0))
+@require_auth()
+def save_progress_batch():
+    """Apply an ordered list of study events in a single transaction."""
+    try:
+        user = get_current_identity()
+        data = request.get_json()
+        
+        events = data.get('events') if isinstance(data, dict) else None
+        if not isinstance(events, list) or not events:
+            return jsonify({'error': 'A non-empty list of events is required'}), 400
+        
+        if len(events) > MAX_PROGRESS_BATCH:
+            return jsonify({'error': f'At most {MAX_PROGRESS_BATCH} events per batch'}), 400
+        
+        # Validate everything up front so a bad event doesn't leave a partial batch
+        parsed_events = []
+        for index, event in enumerate(events):
+            if not isinstance(event, dict) or not event.get('card_id'):
+                return jsonify({'error': f'Event {index}: card ID is required'}), 400
+            try:
+                event_time = parse_event_timestamp(event.get('ts'))
+            except (ValueError, TypeError, OverflowError, OSError):
+                return jsonify({'error': f'Event {index}: invalid timestamp'}), 400
+            parsed_events.append((str(event['card_id']), event.get('action'), event_time))
+        g.batch_size = len(parsed_events)
+        
+        # Each event is one atomic upsert; the whole batch shares one commit
+        records = {}
+        version = next_change_version(user.id)
+        totals = {'cards': 0, 'known': 0, 'learning': 0, 'accuracy': 0.0}
+        streak = None
+        streak_lost = None
+        streaks = current_streaks(user.id, {card_id for card_id, action, _ in parsed_events if action == 'learning'})
+        for card_id, action, event_time in parsed_events:
+            progress = record_progress(user.id, card_id, action, event_time, version)
+            # Serialize now; after commit every record would be reloaded one query at a time
+            records[card_id] = progress.to_dict()
             
-        elif action == 'attempt':
-            # Just tracking an attempt without specific outcome
-            pass
+            delta = progress_stats_delta(progress, action, streaks.get(card_id, 0))
+            streaks[card_id] = progress.study_streak
+            for key in totals:
+                totals[key] += delta[key]
+            if delta['streak'] is not None:
+                streak = max(streak or 0, delta['streak'])
+            if delta['streak_lost'] is not None:
+                streak_lost = max(streak_lost or 0, delta['streak_lost'])
+        
+        apply_stats_delta(user.id, streak=streak, streak_lost=streak_lost, **totals)
         
         db.session.commit()
         
-        return jsonify({
+        return json_response({
             'success': True,
-            'progress': progress.to_dict()
+            'applied': len(parsed_events),
+            'progress': records
         })
         
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': f'Failed to save progress: {str(e)}'}), 500
+        return jsonify({'error': f'Failed to save progress batch: {str(e)}'}), 500
+
+def compute_user_stats(user_id):
+    """Compute the /api/stats figures from scratch with aggregate queries."""
+    progress = db.session.query(
+        func.count(UserProgress.id),
+        func.sum(case((UserProgress.known_count > 0, 1), else_=0)),
+        func.sum(case((UserProgress.learning_count > 0, 1), else_=0)),
+        func.sum(
+            func.coalesce(UserProgress.correct_attempts, 0) * 1.0
+            / case((UserProgress.total_attempts > 0, UserProgress.total_attempts), else_=1)
+        ),
+        func.max(UserProgress.study_streak)
+    ).filter(UserProgress.user_id == user_id).one()
+    
+    sessions = db.session.query(
+        func.count(UserSession.id),
+        func.sum(func.coalesce(UserSession.total_time_seconds, 0))
+    ).filter(UserSession.user_id == user_id).one()
+    
+    return {
+        'total_cards_studied': progress[0] or 0,
+        'known_cards': progress[1] or 0,
+        'learning_cards': progress[2] or 0,
+        'accuracy_sum': float(progress[3] or 0.0),
+        'study_streak': progress[4] or 0,
+        'total_sessions': sessions[0] or 0,
+        'total_study_time_seconds': sessions[1] or 0,
+    }
+
+def refresh_user_stats(user_id):
+    """Rebuild a user's UserStats rollup from the source tables and return it."""
+    values = compute_user_stats(user_id)
+    values['updated_at'] = datetime.utcnow()
+    insert = _upsert_dialect_insert()
+    db.session.execute(
+        insert(UserStats).values(user_id=user_id, **values).on_conflict_do_update(
+            index_elements=[UserStats.__table__.c.user_id],
+            set_=values
+        )
+    )
+    return db.session.get(UserStats, user_id, populate_existing=True)
+
+def apply_stats_delta(user_id, cards=0, known=0, learning=0, accuracy=0.0,
+                      streak=None, streak_lost=None, sessions=0, study_time=0):
+    """Apply incremental changes to a user's UserStats rollup.
+    
+    Falls back to a full refresh when the user has no rollup row yet, which
+    also covers accounts created before the rollup existed. Must be called
+    after the source rows for this change have been written.
+    
+    streak_lost is the longest streak a lapse just reset. The stored
+    maximum is only cleared for recomputing if that card could have held it.
+    """
+    table = UserStats.__table__
+    values = {
+        'total_cards_studied': table.c.total_cards_studied + cards,
+        'known_cards': table.c.known_cards + known,
+        'learning_cards': table.c.learning_cards + learning,
+        'accuracy_sum': table.c.accuracy_sum + accuracy,
+        'total_sessions': table.c.total_sessions + sessions,
+        'total_study_time_seconds': table.c.total_study_time_seconds + study_time,
+        'updated_at': datetime.utcnow(),
+    }
+    current = table.c.study_streak
+    if streak is not None:
+        current = case((table.c.study_streak < streak, streak), else_=table.c.study_streak)
+    if streak_lost is not None:
+        # The reset card may have held the longest streak; recompute on next read
+        current = case((table.c.study_streak <= streak_lost, None), else_=current)
+    if streak is not None or streak_lost is not None:
+        values['study_streak'] = current
+    
+    result = db.session.execute(update(table).where(table.c.user_id == user_id).values(**values))
+    if result.rowcount == 0:
+        refresh_user_stats(user_id)
+
+def current_streaks(user_id, card_ids):
+    """Study streaks of the given cards before this request changes them, for cards already seen."""
+    if not card_ids:
+        return {}
+    return dict(db.session.execute(
+        select(UserProgress.card_id, UserProgress.study_streak)
+        .where(UserProgress.user_id == user_id, UserProgress.card_id.in_(list(card_ids)))
+    ).all())
+
+def progress_stats_delta(progress, action, previous_streak=0):
+    """Work out how one applied study action changes the user's rollup figures."""
+    total = progress.total_attempts
+    correct = progress.correct_attempts
+    previous_total = total - 1
+    previous_correct = correct - (1 if action == 'known' else 0)
+    is_new_card = previous_total == 0
+    
+    accuracy = correct / max(total, 1)
+    if not is_new_card:
+        accuracy -= previous_correct / max(previous_total, 1)
+    
+    return {
+        'cards': int(is_new_card),
+        'known': int(action == 'known' and progress.known_count == 1),
+        'learning': int(action == 'learning' and progress.learning_count == 1),
+        'accuracy': accuracy,
+        'streak': progress.study_streak if action == 'known' else None,
+        'streak_lost': previous_streak if action == 'learning' and previous_streak else None,
+    }
+
+def unseen_cards_query(user_id):
+    """Cards the user has no progress for, as an anti-join on the (user_id, card_id) index."""
+    return Card.query.outerjoin(
+        UserProgress,
+        and_(UserProgress.card_id == Card.id, UserProgress.user_id == user_id)
+    ).filter(UserProgress.id.is_(None))
+
+def find_new_card_ids(user_id, limit):
+    """Return up to `limit` deck cards the user has never studied, in deck order."""
+    return [
+        card_id for (card_id,) in unseen_cards_query(user_id)
+        .with_entities(Card.id).order_by(Card.position).limit(limit)
+    ]
+
+@app.route('/api/queue/next', methods=['GET'])
+@query_budget(3)
+@require_auth()
+def get_next_cards():
+    """Get the next cards to study: due reviews first, then new cards."""
+    user = get_current_identity()
+    
+    n = request.args.get('n', 20, type=int)
+    n = max(1, min(n, MAX_QUEUE_SIZE))
+    now_ts = to_unix_timestamp(datetime.utcnow())
+    
+    # Range scan over ix_user_progress_user_due
+    due_records = select_progress(
+        UserProgress.user_id == user.id,
+        UserProgress.due_at <= now_ts,
+        order_by=UserProgress.due_at,
+        limit=n
+    )
+    
+    queue = [
+        {'card_id': record['card_id'], 'type': 'review', 'progress': record}
+        for record in due_records
+    ]
+    
+    if len(queue) < n:
+        queue.extend(
+            {'card_id': card_id, 'type': 'new', 'progress': None}
+            for card_id in find_new_card_ids(user.id, n - len(queue))
+        )
+    
+    return json_response({'queue': queue})
+
+@app.route('/api/cards', methods=['GET'])
+@query_budget(4)
+def get_cards():
+    """Get a page of cards, optionally filtered by level, favorites and study status.
+    
+    Status is per user: "new" cards have no progress, "known" cards were
+    answered correctly last time and "learning" cards were not. Pages are
+    keyed on deck position; pass the returned next_after_id to continue.
+    """
+    level = request.args.get('level')
+    status = request.args.get('status')
+    favorites_only = request.args.get('favorites_only', '').lower() in ('1', 'true', 'yes')
+    after_id = request.args.get('after_id')
+    limit = request.args.get('limit', DEFAULT_CARDS_PAGE, type=int)
+    limit = max(1, min(limit, MAX_CARDS_PAGE))
+    
+    if status not in (None, 'known', 'learning', 'new'):
+        return jsonify({'error': 'Status must be one of: known, learning, new'}), 400
+    
+    user = None
+    if status or favorites_only or 'user_id' in session:
+        user = get_current_identity()
+        if not user and (status or favorites_only):
+            return jsonify({'error': 'Authentication required'}), 401
+    
+    if status == 'new':
+        query = unseen_cards_query(user.id)
+    elif status in ('known', 'learning'):
+        query = Card.query.join(
+            UserProgress,
+            and_(UserProgress.card_id == Card.id, UserProgress.user_id == user.id)
+        )
+        if status == 'known':
+            query = query.filter(UserProgress.study_streak > 0)
+        else:
+            query = query.filter(UserProgress.study_streak == 0)
+    else:
+        query = Card.query
+    
+    if favorites_only:
+        query = query.join(
+            UserFavorite,
+            and_(UserFavorite.card_id == Card.id, UserFavorite.user_id == user.id)
+        )
+    
+    if level and level != 'all':
+        query = query.filter(Card.level == level)
+    
+    if after_id:
+        after_card = db.session.get(Card, after_id)
+        if not after_card:
+            return jsonify({'error': 'Unknown after_id'}), 400
+        query = query.filter(Card.position > after_card.position)
+    
+    # Fetch one extra row to know whether another page exists
+    cards = query.order_by(Card.position).limit(limit + 1).all()
+    has_more = len(cards) > limit
+    cards = cards[:limit]
+    
+    favorite_ids = set()
+    if user and cards:
+        if favorites_only:
+            favorite_ids = {card.id for card in cards}
+        else:
+            favorite_ids = {
+                card_id for (card_id,) in db.session.query(UserFavorite.card_id).filter(
+                    UserFavorite.user_id == user.id,
+                    UserFavorite.card_id.in_([card.id for card in cards])
+                )
+            }
+    
+    return json_response({
+        'cards': [card.to_dict(card.id in favorite_ids) for card in cards],
+        'next_after_id': cards[-1].id if has_more else None,
+        'has_more': has_more
+    })
+
+@app.route('/api/cards/search', methods=['GET'])
+@query_budget(3)
+def search_cards_endpoint():
+    """Search the deck; ?q= matches word prefixes, ignoring umlauts and ß."""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Search query is required'}), 400
+    
+    limit = request.args.get('limit', DEFAULT_SEARCH_RESULTS, type=int)
+    limit = max(1, min(limit, MAX_SEARCH_RESULTS))
+    
+    return json_response({
+        'query': query,
+        'cards': [card.to_dict() for card in search_cards(query, limit)]
+    })
 
 @app.route('/api/favorites', methods=['GET'])
+@query_budget(3)
 @require_auth()
+@conditional_user_get('favorites')
 def get_favorites():
     """Get user's favorite cards."""
-    user = get_current_user()
-    favorites = UserFavorite.query.filter_by(user_id=user.id).all()
-    
-    favorite_cards = [fav.card_id for fav in favorites]
-    return jsonify({'favorites': favorite_cards})
+    user = get_current_identity()
+    favorite_cards = db.session.scalars(
+        select(UserFavorite.card_id).where(UserFavorite.user_id == user.id)
+    ).all()
+    return json_response({'favorites': favorite_cards})
 
 @app.route('/api/favorites', methods=['POST'])
+@query_budget(5)
 @require_auth()
 def toggle_favorite():
     """Toggle a card as favorite."""
     try:
-        user = get_current_user()
+        user = get_current_identity()
         data = request.get_json()
         
         if not data or 'card_id' not in data:
             return jsonify({'error': 'Card ID is required'}), 400
         
         card_id = data['card_id']
+        version = next_change_version(user.id)
         
         # Check if already favorite
         favorite = UserFavorite.query.filter_by(
@@ -371,14 +1430,29 @@ def toggle_favorite():
             card_id=card_id
         ).first()
         
+        tombstone_table = UserFavoriteTombstone.__table__
         if favorite:
-            # Remove from favorites
+            # Remove from favorites, leaving a tombstone for delta sync
             db.session.delete(favorite)
+            insert = _upsert_dialect_insert()
+            db.session.execute(
+                insert(tombstone_table).values(user_id=user.id, card_id=card_id, version=version)
+                .on_conflict_do_update(
+                    index_elements=[tombstone_table.c.user_id, tombstone_table.c.card_id],
+                    set_={'version': version}
+                )
+            )
             is_favorite = False
         else:
             # Add to favorites
-            favorite = UserFavorite(user_id=user.id, card_id=card_id)
+            favorite = UserFavorite(user_id=user.id, card_id=card_id, version=version)
             db.session.add(favorite)
+            db.session.execute(
+                tombstone_table.delete().where(
+                    tombstone_table.c.user_id == user.id,
+                    tombstone_table.c.card_id == card_id
+                )
+            )
             is_favorite = True
         
         db.session.commit()
@@ -394,15 +1468,19 @@ def toggle_favorite():
         return jsonify({'error': f'Failed to toggle favorite: {str(e)}'}), 500
 
 @app.route('/api/session/start', methods=['POST'])
+@query_budget(8)
 @require_auth()
 def start_session():
     """Start a new study session."""
     try:
-        user = get_current_user()
+        user = get_current_identity()
         
         # Create new session
         session_record = UserSession(user_id=user.id)
         db.session.add(session_record)
+        db.session.flush()
+        apply_stats_delta(user.id, sessions=1)
+        next_change_version(user.id)
         db.session.commit()
         
         return jsonify({
@@ -415,11 +1493,12 @@ def start_session():
         return jsonify({'error': f'Failed to start session: {str(e)}'}), 500
 
 @app.route('/api/session/end', methods=['POST'])
+@query_budget(9)
 @require_auth()
 def end_session():
     """End the current study session."""
     try:
-        user = get_current_user()
+        user = get_current_identity()
         data = request.get_json()
         
         session_id = data.get('session_id')
@@ -436,11 +1515,15 @@ def end_session():
             return jsonify({'error': 'Session not found'}), 404
         
         # Update session with end data
+        previous_time = session_record.total_time_seconds or 0
         session_record.session_end = datetime.utcnow()
         session_record.cards_studied = data.get('cards_studied', 0)
         session_record.cards_known = data.get('cards_known', 0)
         session_record.cards_learning = data.get('cards_learning', 0)
         session_record.total_time_seconds = data.get('total_time_seconds', 0)
+        db.session.flush()
+        apply_stats_delta(user.id, study_time=(session_record.total_time_seconds or 0) - previous_time)
+        next_change_version(user.id)
         
         db.session.commit()
         
@@ -451,41 +1534,37 @@ def end_session():
         return jsonify({'error': f'Failed to end session: {str(e)}'}), 500
 
 @app.route('/api/stats', methods=['GET'])
+@query_budget(8)
 @require_auth()
+@conditional_user_get('stats')
 def get_stats():
     """Get user's learning statistics."""
-    user = get_current_user()
-    
-    # Get progress stats
-    progress_records = UserProgress.query.filter_by(user_id=user.id).all()
-    total_cards = len(progress_records)
-    known_cards = len([p for p in progress_records if p.known_count > 0])
-    learning_cards = len([p for p in progress_records if p.learning_count > 0])
+    user = get_current_identity()
     
-    # Get session stats
-    sessions = UserSession.query.filter_by(user_id=user.id).all()
-    total_sessions = len(sessions)
-    total_study_time = sum(s.total_time_seconds or 0 for s in sessions)
+    # One primary-key lookup in the common case
+    stats = db.session.get(UserStats, user.id)
+    if stats is None or stats.study_streak is None:
+        # Serialize before commit, which would expire the refreshed row
+        stats = refresh_user_stats(user.id).to_dict()
+        db.session.commit()
+    else:
+        stats = stats.to_dict()
     
     # Get recent activity
-    recent_progress = UserProgress.query.filter_by(user_id=user.id)\
-        .order_by(UserProgress.last_seen.desc()).limit(10).all()
+    recent_progress = select_progress(
+        UserProgress.user_id == user.id,
+        order_by=UserProgress.last_seen.desc(),
+        limit=10
+    )
     
-    return jsonify({
-        'stats': {
-            'total_cards_studied': total_cards,
-            'known_cards': known_cards,
-            'learning_cards': learning_cards,
-            'total_sessions': total_sessions,
-            'total_study_time_seconds': total_study_time,
-            'average_accuracy': sum(p.correct_attempts / max(p.total_attempts, 1) for p in progress_records) / max(total_cards, 1),
-            'study_streak': max((p.study_streak for p in progress_records), default=0)
-        },
-        'recent_activity': [p.to_dict() for p in recent_progress]
+    return json_response({
+        'stats': stats,
+        'recent_activity': recent_progress
     })
 
 # Debug endpoint (remove in production)
 @app.route('/api/debug/session')
+@query_budget(0)
 def debug_session():
     """Debug session information."""
     return jsonify({
@@ -498,36 +1577,171 @@ def debug_session():
         'flask_env': app.config.get('FLASK_ENV', 'not set')
     })
 
-@app.route('/api/debug/users')
-def debug_users():
-    """Debug user information."""
-    users = User.query.all()
-    return jsonify({
-        'total_users': len(users),
-        'users': [{'id': u.id, 'username': u.username, 'email': u.email} for u in users]
-    })
+def list_users_page(sort='created_at', order='desc', limit=DEFAULT_USERS_PAGE, after=None,
+                    prefix=None, active_since=None):
+    """One page of users for the admin listing, read through the (sort column, id) index.
+    
+    Sorting by last_login lists only users who have logged in. Raises
+    ValueError for a cursor this backend didn't issue.
+    """
+    column = getattr(User, sort)
+    descending = order == 'desc'
+    
+    stmt = select(
+        User.id, User.username, User.email, User.created_at, User.last_login,
+        UserStats.known_cards, UserStats.total_sessions
+    ).outerjoin(UserStats, UserStats.user_id == User.id)
+    
+    if sort == 'last_login':
+        stmt = stmt.where(User.last_login.isnot(None))
+    if after is not None:
+        value, user_id = after
+        if not isinstance(value, str) or not isinstance(user_id, int):
+            raise ValueError('Invalid cursor')
+        value = datetime.fromisoformat(value)
+        stmt = stmt.where(or_(
+            column < value if descending else column > value,
+            and_(column == value, User.id < user_id if descending else User.id > user_id)
+        ))
+    if prefix:
+        stmt = stmt.where(User.username.startswith(prefix, autoescape=True))
+    if active_since:
+        stmt = stmt.where(User.last_login >= datetime.fromisoformat(active_since))
+    
+    if descending:
+        stmt = stmt.order_by(column.desc(), User.id.desc())
+    else:
+        stmt = stmt.order_by(column.asc(), User.id.asc())
+    
+    # Fetch one extra row to know whether another page exists
+    rows = db.session.execute(stmt.limit(limit + 1)).all()
+    users = [
+        {
+            'id': row.id,
+            'username': row.username,
+            'email': row.email,
+            'created_at': row.created_at,
+            'last_login': row.last_login,
+            'total_sessions': row.total_sessions or 0,
+            'cards_learned': row.known_cards or 0
+        }
+        for row in rows[:limit]
+    ]
+    
+    next_cursor = None
+    if len(rows) > limit:
+        last = users[-1]
+        next_cursor = encode_cursor(last[sort].isoformat(), last['id'])
+    return {'users': users, 'next_cursor': next_cursor}
+
+@app.route('/api/admin/users', methods=['GET'])
+@query_budget(2)
+@require_admin()
+def list_users():
+    """Page through users for admins.
+    
+    Query parameters: sort (created_at or last_login), order (desc or asc),
+    limit, q (username prefix), active_since (ISO date) and cursor (the
+    previous page's next_cursor).
+    """
+    try:
+        return json_response(list_users_page(**parse_list_params(request.args.get)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/metrics')
+@query_budget(0)
+def metrics_endpoint():
+    """Request, response size and SQL metrics in the Prometheus text format."""
+    status = metrics_access(request.headers.get('Authorization', ''))
+    if status == 404:
+        return jsonify({'error': 'Not found'}), 404
+    if status == 401:
+        return jsonify({'error': 'Metrics token required'}), 401
+    return app.response_class(metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
 
 @app.route('/api/version')
+@query_budget(0)
 def get_version():
     """Get application version."""
     return jsonify({'version': APP_VERSION})
 
 # Static file serving
+def send_static_asset(asset):
+    """Send a built asset with its caching headers, or 304 if the client already has it."""
+    headers = {
+        'ETag': asset.etag,
+        'Cache-Control': asset.cache_control,
+        'Vary': 'Accept-Encoding'
+    }
+    if etag_matches(request.headers.get('If-None-Match'), asset.etag):
+        return '', 304, headers
+    
+    with metrics.phase('io'):
+        response = send_file(asset.path, mimetype=asset.content_type, conditional=False, etag=False)
+    response.headers.update(headers)
+    if asset.encoding:
+        response.headers['Content-Encoding'] = asset.encoding
+    return response
+
+@app.route('/word_audio/<path:filename>')
+@app.route('/word_images/<path:filename>')
+@query_budget(0)
+def serve_media(filename):
+    """Serve audio and image files with byte-range support for seeking."""
+    entry = media_files.lookup(request.path)
+    if not entry:
+        abort(404)
+    
+    # Werkzeug answers Range, If-Range and If-None-Match; full bodies go
+    # through wsgi.file_wrapper, which production servers map to sendfile
+    with metrics.phase('io'):
+        response = send_file(
+            entry.path,
+            mimetype=entry.content_type,
+            conditional=True,
+            etag=entry.etag.strip('"'),
+            last_modified=entry.mtime
+        )
+    response.headers['Cache-Control'] = MEDIA_CACHE_CONTROL
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
 @app.route('/')
+@query_budget(0)
 def index():
     """Serve the main application."""
-    return send_from_directory(BASE_DIR, 'index.html')
+    asset = static_assets.resolve('index.html', request.headers.get('Accept-Encoding', ''))
+    if asset:
+        return send_static_asset(asset)
+    with metrics.phase('io'):
+        return send_from_directory(BASE_DIR, 'index.html')
 
 @app.route('/<path:filename>')
+@query_budget(0)
 def serve_static(filename):
-    """Serve static files."""
-    return send_from_directory(BASE_DIR, filename)
+    """Serve static files, preferring the built assets when available."""
+    asset = static_assets.resolve(filename, request.headers.get('Accept-Encoding', ''))
+    if asset:
+        return send_static_asset(asset)
+    with metrics.phase('io'):
+        return send_from_directory(BASE_DIR, filename)
 
 # Initialize database
 def init_db():
     """Initialize the database."""
     with app.app_context():
         db.create_all()
+        run_migrations(db.engine)
+        
+        # Load the deck on first run
+        if not db.session.query(Card.id).first():
+            card_count = load_cards()
+            print(f"✅ Loaded {card_count} cards from {DECK_FILE.name}")
+        elif db.engine.dialect.name == 'sqlite' and not card_search_index_ready():
+            rebuild_card_search_index()
+            db.session.commit()
+            print("✅ Built card search index")
         
         # Create built-in account if it doesn't exist
         builtin_username = 'user'
@@ -551,6 +1765,7 @@ def main():
     try:
         # Initialize database
         init_db()
+        print_database_settings()
         
         # Configuration
         port = int(os.environ.get('PORT', 5000))
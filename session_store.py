@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Session storage for the app.py user manager.
+Sessions map a token to a username with an expiry time. Lookups go straight to the token, expired sessions are removed by a
+background sweeper through an expiry index, and the SQLite store keeps
+sessions across restarts and shares them between worker processes.
+Anonymous sessions are kept separately (see anonymous_sessions.py).
+"""
+
+import hashlib
+import heapq
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+# 'sqlite' keeps sessions in users/_sessions.sqlite3; 'memory' loses them on restart
+SESSION_STORE = os.environ.get('SESSION_STORE', 'sqlite').strip().lower()
+SESSION_STORES = ('sqlite', 'memory')
+
+# Seconds between sweeps for expired sessions (0 disables the sweeper)
+SESSION_SWEEP_SECONDS = float(os.environ.get('SESSION_SWEEP_SECONDS', 300))
+
+SESSION_DB_FILE = '_sessions.sqlite3'
+
+# A stored session; times are Unix seconds
+Session = namedtuple('Session', 'username created_at expires_at')
+
+
+def _token_key(token: str) -> str:
+    """Stored key for a token, so the session file never holds usable tokens."""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class SessionStore(ABC):
+    """Interface for session storage. Implementations must be thread-safe."""
+
+    @abstractmethod
+    def get(self, token: str, now: Optional[int] = None) -> Optional[Session]:
+        """The live session for a token, or None if it is unknown or has expired."""
+
+    @abstractmethod
+    def put(self, token: str, username: str, expires_at: int):
+        """Store a session, replacing any with the same token."""
+
+    @abstractmethod
+    def delete(self, token: str) -> Optional[Session]:
+        """Remove a session, returning it if it existed."""
+
+    @abstractmethod
+    def sweep(self, now: Optional[int] = None) -> int:
+        """Remove every expired session; returns how many were removed."""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of stored sessions, including expired ones not yet swept."""
+
+    def close(self):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Sessions in a dict, with a heap of expiry times for sweeping. Lost on restart."""
+
+    def __init__(self):
+        self._sessions: Dict[str, Session] = {}
+        self._expiry = []  # (expires_at, key); entries for replaced sessions are skipped
+        self._lock = threading.Lock()
+
+    def get(self, token, now=None):
+        key = _token_key(token)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                return None
+            if session.expires_at <= (now or int(time.time())):
+                del self._sessions[key]
+                return None
+            return session
+
+    def put(self, token, username, expires_at):
+        key = _token_key(token)
+        with self._lock:
+            self._sessions[key] = Session(username, int(time.time()), int(expires_at))
+            heapq.heappush(self._expiry, (int(expires_at), key))
+
+    def delete(self, token):
+        with self._lock:
+            return self._sessions.pop(_token_key(token), None)
+
+    def sweep(self, now=None):
+        now = now or int(time.time())
+        removed = 0
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                expires_at, key = heapq.heappop(self._expiry)
+                session = self._sessions.get(key)
+                if session is not None and session.expires_at == expires_at:
+                    del self._sessions[key]
+                    removed += 1
+        return removed
+
+    def count(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a SQLite file with an index on expiry time, shared by every process using it."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                token TEXT PRIMARY KEY,
+                username TEXT NOT NULL,
+                created_at INTEGER NOT NULL,
+                expires_at INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at);
+            """
+        )
+
+    def get(self, token, now=None):
+        key = _token_key(token)
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT username, created_at, expires_at FROM sessions WHERE token = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[2] <= (now or int(time.time())):
+                self._conn.execute('DELETE FROM sessions WHERE token = ?', (key,))
+                return None
+        return Session(*row)
+
+    def put(self, token, username, expires_at):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO sessions (token, username, created_at, expires_at) VALUES (?, ?, ?, ?)',
+                (_token_key(token), username, int(time.time()), int(expires_at))
+            )
+
+    def delete(self, token):
+        with self._lock:
+            row = self._conn.execute(
+                'DELETE FROM sessions WHERE token = ? RETURNING username, created_at, expires_at',
+                (_token_key(token),)
+            ).fetchone()
+        return Session(*row) if row is not None else None
+
+    def sweep(self, now=None):
+        with self._lock:
+            cursor = self._conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (now or int(time.time()),))
+            return cursor.rowcount
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_session_store(kind: str, directory) -> SessionStore:
+    """The session store named by SESSION_STORE, keeping its file in `directory`."""
+    if kind == 'memory':
+        return MemorySessionStore()
+    if kind == 'sqlite':
+        return SQLiteSessionStore(Path(directory) / SESSION_DB_FILE)
+    raise ValueError(f"SESSION_STORE must be one of: {', '.join(SESSION_STORES)}")
+
+
+class SessionSweeper:
+    """Background thread removing expired sessions from stores every `interval` seconds.
+
+    Each store only needs a sweep() method returning how many sessions it removed.
+    """
+
+    def __init__(self, stores: Iterable, interval: float = SESSION_SWEEP_SECONDS):
+        self.stores = list(stores)
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='session-sweeper', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            for store in self.stores:
+                try:
+                    removed = store.sweep()
+                    if removed:
+                        print(f"🧹 Removed {removed} expired sessions")
+                except Exception as e:
+                    print(f"❌ Error sweeping sessions: {e}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Static asset build step for the Language Flash Cards application.
+Writes fingerprinted, precompressed copies of the front-end files and
+picks the best variant for each request.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+from collections import namedtuple
+from pathlib import Path
+from typing import Dict, Optional
+
+try:
+    import brotli
+except ImportError:  # Brotli variants are optional
+    brotli = None
+
+BASE_DIR = Path(__file__).parent
+BUILD_DIR = BASE_DIR / 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# Fingerprinted assets, in dependency order (referenced files first)
+ASSETS = ['flashcards.json', 'styles.css', 'progress_manager.js', 'auth_server.js', 'app.js']
+
+# Pages that keep their name but get references rewritten
+PAGES = ['index.html']
+
+# Files smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# Preferred order when the client accepts several encodings
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+AssetVariant = namedtuple('AssetVariant', 'path content_type encoding etag cache_control size')
+
+
+def _fingerprint(content: bytes) -> str:
+    """Short content hash used in file names and ETags."""
+    return hashlib.sha256(content).hexdigest()[:12]
+
+
+def _rewrite_references(content: bytes, renames: Dict[str, str]) -> bytes:
+    """Point quoted references like './app.js?v=3' at the fingerprinted names."""
+    text = content.decode('utf-8')
+    for original, hashed in renames.items():
+        pattern = r'(["\'(])(\./)?' + re.escape(original) + r'(\?[^"\')]*)?(?=["\')])'
+        text = re.sub(pattern, lambda m: f'{m.group(1)}{m.group(2) or ""}{hashed}', text)
+    return text.encode('utf-8')
+
+
+def _write_variants(build_dir: Path, name: str, content: bytes) -> list:
+    """Write a file plus its gzip/brotli variants; returns the encodings written."""
+    (build_dir / name).write_bytes(content)
+    encodings = []
+
+    if len(content) >= MIN_COMPRESS_SIZE:
+        if brotli is not None:
+            (build_dir / (name + '.br')).write_bytes(brotli.compress(content, quality=11))
+            encodings.append('br')
+        (build_dir / (name + '.gz')).write_bytes(gzip.compress(content, compresslevel=9, mtime=0))
+        encodings.append('gzip')
+
+    return encodings
+
+
+def build_assets(source_dir: Path = BASE_DIR, build_dir: Path = BUILD_DIR) -> Dict:
+    """Build fingerprinted, precompressed assets and write the manifest."""
+    source_dir = Path(source_dir)
+    build_dir = Path(build_dir)
+    if build_dir.exists():
+        shutil.rmtree(build_dir)
+    build_dir.mkdir(parents=True)
+
+    renames = {}
+    files = {}
+
+    for name in ASSETS:
+        source = source_dir / name
+        if not source.exists():
+            print(f"⚠️  Skipping missing asset: {name}")
+            continue
+
+        content = _rewrite_references(source.read_bytes(), renames)
+        digest = _fingerprint(content)
+        stem, suffix = os.path.splitext(name)
+        hashed_name = f"{stem}.{digest}{suffix}"
+
+        encodings = _write_variants(build_dir, hashed_name, content)
+        renames[name] = hashed_name
+        files[hashed_name] = {'etag': digest, 'encodings': encodings, 'immutable': True}
+        print(f"✅ {name} -> {hashed_name} ({', '.join(encodings) or 'uncompressed'})")
+
+    for name in PAGES:
+        source = source_dir / name
+        if not source.exists():
+            print(f"⚠️  Skipping missing page: {name}")
+            continue
+
+        content = _rewrite_references(source.read_bytes(), renames)
+        encodings = _write_variants(build_dir, name, content)
+        files[name] = {'etag': _fingerprint(content), 'encodings': encodings, 'immutable': False}
+        print(f"✅ {name} ({', '.join(encodings) or 'uncompressed'})")
+
+    manifest = {'assets': renames, 'files': files}
+    with open(build_dir / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Parse an Accept-Encoding header into {coding: q}."""
+    accepted = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == opaque:
+            return True
+    return False
+
+
+class StaticAssets:
+    """Resolves requests against the build manifest, if one has been built."""
+
+    def __init__(self, build_dir: Path = BUILD_DIR):
+        self.build_dir = Path(build_dir)
+        self._manifest = None
+        self._manifest_mtime = None
+
+    def _load_manifest(self) -> Optional[Dict]:
+        """Load the manifest, reloading it after a rebuild."""
+        manifest_path = self.build_dir / MANIFEST_NAME
+        try:
+            mtime = manifest_path.stat().st_mtime_ns
+        except OSError:
+            self._manifest = None
+            return None
+
+        if mtime != self._manifest_mtime:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                self._manifest = json.load(f)
+            self._manifest_mtime = mtime
+        return self._manifest
+
+    def resolve(self, filename: str, accept_encoding: str = '') -> Optional[AssetVariant]:
+        """Pick the file to send for a request path, or None if it isn't a built asset."""
+        manifest = self._load_manifest()
+        if not manifest:
+            return None
+
+        name = filename.lstrip('/') or 'index.html'
+        if name.startswith('./'):
+            name = name[2:]
+
+        # Requests for the original name get the current build, but must revalidate
+        immutable_request = name in manifest['files']
+        name = manifest['assets'].get(name, name)
+        entry = manifest['files'].get(name)
+        if not entry:
+            return None
+
+        cache_control = IMMUTABLE_CACHE_CONTROL if (entry['immutable'] and immutable_request) \
+            else REVALIDATE_CACHE_CONTROL
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+        accepted = parse_accept_encoding(accept_encoding)
+        for encoding, suffix in ENCODING_SUFFIXES.items():
+            if encoding in entry['encodings'] and accepted.get(encoding, 0) > 0:
+                path = self.build_dir / (name + suffix)
+                return AssetVariant(path, content_type, encoding, f'"{entry["etag"]}-{encoding}"',
+                                    cache_control, path.stat().st_size)
+
+        path = self.build_dir / name
+        return AssetVariant(path, content_type, None, f'"{entry["etag"]}"', cache_control, path.stat().st_size)
+
+
+def main():
+    """Build the static assets into dist/."""
+    print("📦 Building static assets...")
+    manifest = build_assets()
+    print(f"\n✅ Built {len(manifest['files'])} files into {BUILD_DIR}")
+    if brotli is None:
+        print("💡 Install 'brotli' to also write .br variants")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,945 @@
+#!/usr/bin/env python3
+"""
+Tests for the Language Flash Cards servers.
+Covers the Flask API in server.py (against a throwaway SQLite database),
+the JSON file server in app.py with its UserManager, user cache, journal
+and session stores, the load test and the dataset generator.
+"""
+
+import gzip
+import http.client
+import json
+import os
+import re
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+# Point the app at a temporary database before server.py is imported
+_TEST_DB_DIR = tempfile.mkdtemp(prefix='flashcards-test-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_TEST_DB_DIR, 'test.db')}")
+METRICS_TOKEN = os.environ.setdefault('METRICS_TOKEN', 'test-metrics-token')
+METRICS_HEADERS = {'Authorization': f'Bearer {METRICS_TOKEN}'}
+
+import pytest
+from sqlalchemy import create_engine, event, func, inspect, text
+
+import app as app_module
+import generate_dataset
+import load_test
+import metrics as metrics_module
+import server
+import serialization
+from profiling import RequestProfiler
+from query_budget import QueryBudgetExceeded, assert_max_queries
+from anonymous_sessions import AnonymousSessionStore
+from session_store import SESSION_DB_FILE, MemorySessionStore
+from static_assets import StaticAssets, build_assets
+from migrations import run_migrations
+from user_catalog import decode_cursor, encode_cursor
+from user_manager import UserManager
+from server import (
+    app, db, init_db, check_database_settings, compute_user_stats,
+    User, UserProgress, UserSession, UserStats
+)
+
+
+@pytest.fixture
+def client():
+    """A test client with a fresh database and a logged-in user."""
+    with app.app_context():
+        db.drop_all()
+    server.revocation_epochs.clear()
+    init_db()
+    app.config['TESTING'] = True
+    client = app.test_client()
+    response = client.post('/api/login', json={'username': 'user', 'password': 'password123'})
+    assert response.status_code == 200
+    return client
+
+
+def test_save_progress_creates_record(client):
+    response = client.post('/api/progress', json={'card_id': 'card_1', 'action': 'known'})
+    assert response.status_code == 200
+    progress = response.get_json()['progress']
+    assert progress['known_count'] == 1
+    assert progress['total_attempts'] == 1
+    assert progress['study_streak'] == 1
+    assert progress['difficulty_rating'] == pytest.approx(0.4)
+
+
+def test_progress_batch_applies_events_in_order(client):
+    events = [
+        {'card_id': 'card_1', 'action': 'known', 'ts': 1700000000000},
+        {'card_id': 'card_2', 'action': 'learning', 'ts': 1700000001000},
+        {'card_id': 'card_1', 'action': 'learning', 'ts': 1700000002000},
+        {'card_id': 'card_1', 'action': 'known', 'ts': '2023-11-14T22:13:23Z'},
+    ]
+    response = client.post('/api/progress/batch', json={'events': events})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['applied'] == 4
+
+    card_1 = data['progress']['card_1']
+    assert card_1['total_attempts'] == 3
+    assert card_1['known_count'] == 2
+    assert card_1['learning_count'] == 1
+    assert card_1['study_streak'] == 1
+    assert card_1['difficulty_rating'] == pytest.approx(0.4)
+    assert card_1['last_seen'].startswith('2023-11-14T22:13:23')
+    assert data['progress']['card_2']['difficulty_rating'] == pytest.approx(0.6)
+
+
+def test_progress_batch_rejects_invalid_events_atomically(client):
+    events = [
+        {'card_id': 'card_1', 'action': 'known'},
+        {'action': 'known'},
+    ]
+    response = client.post('/api/progress/batch', json={'events': events})
+    assert response.status_code == 400
+    with app.app_context():
+        assert UserProgress.query.count() == 0
+
+
+def test_save_progress_clamps_difficulty_in_database(client):
+    for _ in range(7):
+        response = client.post('/api/progress', json={'card_id': 'card_1', 'action': 'known'})
+        assert response.status_code == 200
+    progress = response.get_json()['progress']
+    assert progress['known_count'] == 7
+    assert progress['total_attempts'] == 7
+    assert progress['study_streak'] == 7
+    assert progress['difficulty_rating'] == pytest.approx(0.0)
+
+    response = client.post('/api/progress', json={'card_id': 'card_1', 'action': 'learning'})
+    progress = response.get_json()['progress']
+    assert progress['study_streak'] == 0
+    assert progress['learning_count'] == 1
+    assert progress['difficulty_rating'] == pytest.approx(0.1)
+    with app.app_context():
+        assert UserProgress.query.count() == 1
+
+
+def test_known_answers_follow_sm2_intervals(client):
+    intervals = []
+    for _ in range(3):
+        response = client.post('/api/progress', json={'card_id': 'card_1', 'action': 'known'})
+        intervals.append(response.get_json()['progress']['interval_days'])
+    assert intervals == [pytest.approx(1.0), pytest.approx(6.0), pytest.approx(15.0)]
+
+    response = client.post('/api/progress', json={'card_id': 'card_1', 'action': 'learning'})
+    progress = response.get_json()['progress']
+    assert progress['interval_days'] == pytest.approx(0.0)
+    assert progress['ease'] == pytest.approx(2.18)
+
+
+def test_queue_returns_due_reviews_before_new_cards(client):
+    events = [
+        {'card_id': 'card_1', 'action': 'learning', 'ts': 1600000000000},
+        {'card_id': 'card_2', 'action': 'known'},
+        {'card_id': 'card_3', 'action': 'learning', 'ts': 1500000000000},
+    ]
+    assert client.post('/api/progress/batch', json={'events': events}).status_code == 200
+
+    response = client.get('/api/queue/next?n=5')
+    assert response.status_code == 200
+    queue = response.get_json()['queue']
+    assert [item['type'] for item in queue] == ['review', 'review', 'new', 'new', 'new']
+    assert [item['card_id'] for item in queue[:2]] == ['card_3', 'card_1']
+    assert 'card_2' not in [item['card_id'] for item in queue]
+    assert len({item['card_id'] for item in queue}) == 5
+
+
+def test_stats_rollup_matches_aggregate_fallback(client):
+    client.post('/api/progress', json={'card_id': 'card_1', 'action': 'known'})
+    client.post('/api/progress', json={'card_id': 'card_1', 'action': 'known'})
+    client.post('/api/progress', json={'card_id': 'card_2', 'action': 'learning'})
+    client.post('/api/progress/batch', json={'events': [
+        {'card_id': 'card_2', 'action': 'known'},
+        {'card_id': 'card_3', 'action': 'attempt'},
+    ]})
+    session_id = client.post('/api/session/start').get_json()['session_id']
+    client.post('/api/session/end', json={'session_id': session_id, 'total_time_seconds': 90})
+
+    stats = client.get('/api/stats').get_json()['stats']
+    assert stats['total_cards_studied'] == 3
+    assert stats['known_cards'] == 2
+    assert stats['learning_cards'] == 1
+    assert stats['total_sessions'] == 1
+    assert stats['total_study_time_seconds'] == 90
+    assert stats['study_streak'] == 2
+    assert stats['average_accuracy'] == pytest.approx((1.0 + 0.5 + 0.0) / 3)
+
+    with app.app_context():
+        user_id = User.query.filter_by(username='user').one().id
+        expected = compute_user_stats(user_id)
+        rollup = db.session.get(UserStats, user_id)
+        assert rollup.known_cards == expected['known_cards']
+        assert rollup.accuracy_sum == pytest.approx(expected['accuracy_sum'])
+
+
+def test_learning_only_invalidates_streak_held_by_the_reset_card(client):
+    client.post('/api/progress', json={'card_id': 'card_1', 'action': 'known'})
+    client.post('/api/progress', json={'card_id': 'card_1', 'action': 'known'})
+    client.post('/api/progress', json={'card_id': 'card_2', 'action': 'known'})
+
+    def rollup_streak():
+        with app.app_context():
+            user_id = User.query.filter_by(username='user').one().id
+            return db.session.get(UserStats, user_id).study_streak
+
+    client.post('/api/progress', json={'card_id': 'card_2', 'action': 'learning'})
+    client.post('/api/progress/batch', json={'events': [{'card_id': 'card_3', 'action': 'learning'}]})
+    assert rollup_streak() == 2
+
+    client.post('/api/progress/batch', json={'events': [
+        {'card_id': 'card_1', 'action': 'learning'},
+        {'card_id': 'card_1', 'action': 'known'},
+    ]})
+    assert rollup_streak() is None
+    assert client.get('/api/stats').get_json()['stats']['study_streak'] == 1
+
+
+def test_stats_rebuilds_missing_rollup(client):
+    client.post('/api/progress', json={'card_id': 'card_1', 'action': 'known'})
+    with app.app_context():
+        UserStats.query.delete()
+        db.session.commit()
+
+    stats = client.get('/api/stats').get_json()['stats']
+    assert stats['total_cards_studied'] == 1
+    assert stats['known_cards'] == 1
+
+
+def test_cards_keyset_pagination_and_level_filter(client):
+    first = client.get('/api/cards?limit=3').get_json()
+    assert [card['id'] for card in first['cards']] == ['card_1', 'card_2', 'card_3']
+    assert first['has_more'] is True
+
+    second = client.get(f"/api/cards?limit=3&after_id={first['next_after_id']}").get_json()
+    assert [card['id'] for card in second['cards']] == ['card_4', 'card_5', 'card_6']
+
+    a2 = client.get('/api/cards?level=A2&limit=50').get_json()['cards']
+    assert a2 and all(card['level'] == 'A2' for card in a2)
+    assert set(a2[0]) == {'id', 'front', 'back', 'isFavourite', 'level'}
+
+
+def test_cards_status_and_favorite_filters(client):
+    client.post('/api/progress/batch', json={'events': [
+        {'card_id': 'card_1', 'action': 'known'},
+        {'card_id': 'card_2', 'action': 'learning'},
+    ]})
+    client.post('/api/favorites', json={'card_id': 'card_2'})
+
+    known = client.get('/api/cards?status=known').get_json()['cards']
+    assert [card['id'] for card in known] == ['card_1']
+
+    learning = client.get('/api/cards?status=learning').get_json()['cards']
+    assert [card['id'] for card in learning] == ['card_2']
+    assert learning[0]['isFavourite'] is True
+
+    new = client.get('/api/cards?status=new&limit=2').get_json()['cards']
+    assert [card['id'] for card in new] == ['card_3', 'card_4']
+
+    favorites = client.get('/api/cards?favorites_only=true').get_json()['cards']
+    assert [card['id'] for card in favorites] == ['card_2']
+
+    assert client.get('/api/cards?status=bogus').status_code == 400
+
+
+def test_card_search_folds_german_diacritics(client):
+    for query in ('strasse', 'Straße', 'STRASSE'):
+        cards = client.get('/api/cards/search', query_string={'q': query}).get_json()['cards']
+        assert cards and cards[0]['front']['primaryText'] == 'Straße'
+
+    for query in ('muell', 'mull', 'Müll'):
+        cards = client.get('/api/cards/search', query_string={'q': query}).get_json()['cards']
+        assert any('Müll' in card['front']['primaryText'] for card in cards)
+
+
+def test_card_search_prefix_and_bad_input(client):
+    cards = client.get('/api/cards/search?q=hausauf').get_json()['cards']
+    assert any(card['front']['primaryText'] == 'Hausaufgaben' for card in cards)
+
+    response = client.get('/api/cards/search', query_string={'q': 'abc"*) OR'})
+    assert response.status_code == 200
+    assert client.get('/api/cards/search?q=').status_code == 400
+
+
+@pytest.fixture
+def built_assets(tmp_path, monkeypatch):
+    """Build the static assets into a temporary directory and serve from it."""
+    manifest = build_assets(build_dir=tmp_path / 'dist')
+    monkeypatch.setattr(server, 'static_assets', StaticAssets(tmp_path / 'dist'))
+    return manifest
+
+
+def test_static_assets_are_precompressed_and_immutable(client, built_assets):
+    hashed_name = built_assets['assets']['flashcards.json']
+    response = client.get(f'/{hashed_name}', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+    revalidate = client.get(f'/{hashed_name}', headers={
+        'Accept-Encoding': 'gzip',
+        'If-None-Match': response.headers['ETag']
+    })
+    assert revalidate.status_code == 304
+    assert revalidate.data == b''
+
+
+def test_index_references_fingerprinted_assets(client, built_assets):
+    response = client.get('/')
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert built_assets['assets']['app.js'].encode() in response.data
+
+
+def test_media_supports_byte_ranges(client):
+    path = '/word_audio/Abend_voice.mp3'
+    full = client.get(path)
+    assert full.status_code == 200
+    assert full.headers['Accept-Ranges'] == 'bytes'
+    etag = full.headers['ETag']
+
+    partial = client.get(path, headers={'Range': 'bytes=10-19'})
+    assert partial.status_code == 206
+    assert partial.data == full.data[10:20]
+    assert partial.headers['Content-Range'] == f'bytes 10-19/{len(full.data)}'
+
+    stale = client.get(path, headers={'Range': 'bytes=10-19', 'If-Range': '"outdated"'})
+    assert stale.status_code == 200
+    assert client.get(path, headers={'If-None-Match': etag}).status_code == 304
+    assert client.get(path, headers={'Range': f'bytes={len(full.data)}-'}).status_code == 416
+    assert client.get('/word_audio/missing_voice.mp3').status_code == 404
+
+
+def test_authenticated_requests_skip_user_lookup(client):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        assert client.get('/api/favorites').status_code == 200
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    assert statements
+    # Only the ETag version check may touch the user table; the row itself is never loaded
+    user_queries = [statement for statement in statements if re.search(r'FROM user\b', statement)]
+    assert all('password_hash' not in statement for statement in user_queries)
+    assert len(user_queries) <= 1
+
+
+def test_logout_on_all_devices_revokes_other_sessions(client):
+    other = app.test_client()
+    assert other.post('/api/login', json={'username': 'user', 'password': 'password123'}).status_code == 200
+    assert other.get('/api/favorites').status_code == 200
+
+    assert client.post('/api/logout', json={'all_devices': True}).status_code == 200
+    assert other.get('/api/favorites').status_code == 401
+    assert other.get('/api/user').status_code == 401
+
+
+def test_sqlite_profile_is_applied_to_connections(client):
+    with app.app_context():
+        settings = check_database_settings()
+    assert settings['journal_mode'] == 'wal'
+    assert settings['synchronous'] == 1  # NORMAL
+    assert settings['busy_timeout'] == server.SQLITE_PROFILE['busy_timeout_ms']
+
+
+def query_plan(query):
+    """EXPLAIN QUERY PLAN details for an ORM query."""
+    sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    return [row[3] for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+
+
+@pytest.mark.parametrize('build_query, index_name', [
+    (lambda: UserProgress.query.filter_by(user_id=1).order_by(UserProgress.last_seen.desc()).limit(10),
+     'ix_user_progress_user_last_seen'),
+    (lambda: UserProgress.query.filter(UserProgress.user_id == 1, UserProgress.due_at <= 0)
+     .order_by(UserProgress.due_at).limit(20),
+     'ix_user_progress_user_due'),
+    (lambda: UserSession.query.filter_by(user_id=1), 'ix_user_session_user_start'),
+    (lambda: User.query.filter((User.username == 'user') | (func.lower(User.email) == 'user')),
+     'ix_user_email_lower'),
+    (lambda: User.query.filter(User.created_at < server.datetime(2030, 1, 1))
+     .order_by(User.created_at.desc(), User.id.desc()).limit(50),
+     'ix_user_created_at'),
+])
+def test_hot_queries_use_indexes(client, build_query, index_name):
+    with app.app_context():
+        plan = query_plan(build_query())
+    assert any(index_name in step for step in plan), plan
+    assert not any(step.startswith('SCAN') or 'TEMP B-TREE' in step for step in plan), plan
+
+
+def test_migrations_upgrade_a_legacy_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as connection:
+        connection.execute(text(
+            'CREATE TABLE "user" (id INTEGER PRIMARY KEY, username VARCHAR(80), email VARCHAR(120), '
+            'created_at DATETIME, last_login DATETIME)'
+        ))
+        connection.execute(text(
+            'CREATE TABLE user_progress (id INTEGER PRIMARY KEY, user_id INTEGER, card_id VARCHAR(50), '
+            "last_seen DATETIME)"
+        ))
+        connection.execute(text(
+            'CREATE TABLE user_session (id INTEGER PRIMARY KEY, user_id INTEGER, session_start DATETIME)'
+        ))
+        connection.execute(text(
+            'CREATE TABLE user_favorite (id INTEGER PRIMARY KEY, user_id INTEGER, card_id VARCHAR(50))'
+        ))
+        connection.execute(text(
+            "INSERT INTO user_progress (user_id, card_id, last_seen) VALUES (1, 'card_1', '2024-01-01 00:00:00')"
+        ))
+
+    assert run_migrations(engine) == [
+        '0001_hot_path_indexes', '0002_scheduler_and_auth_columns', '0003_change_versions',
+        '0004_user_listing_indexes'
+    ]
+    assert run_migrations(engine) == []
+
+    inspector = inspect(engine)
+    assert {'due_at', 'interval_days', 'ease'} <= {c['name'] for c in inspector.get_columns('user_progress')}
+    with engine.connect() as connection:
+        indexes = {row[0] for row in connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+        assert {'ix_user_email_lower', 'ix_user_progress_user_last_seen', 'ix_user_progress_user_due',
+                'ix_user_created_at', 'ix_user_last_login'} <= indexes
+        due_at, ease = connection.execute(text('SELECT due_at, ease FROM user_progress')).one()
+    assert due_at == 1704067200
+    assert ease == pytest.approx(2.5)
+
+
+def test_progress_delta_sync_since_version(client):
+    client.post('/api/progress', json={'card_id': 'card_1', 'action': 'known'})
+    client.post('/api/favorites', json={'card_id': 'card_9'})
+    baseline = client.get('/api/progress').get_json()
+    assert baseline['full'] is True
+    assert set(baseline['progress']) == {'card_1'}
+
+    client.post('/api/progress/batch', json={'events': [
+        {'card_id': 'card_2', 'action': 'learning'},
+        {'card_id': 'card_3', 'action': 'known'},
+    ]})
+    client.post('/api/favorites', json={'card_id': 'card_9'})
+    client.post('/api/favorites', json={'card_id': 'card_5'})
+
+    delta = client.get(f"/api/progress?since={baseline['version']}").get_json()
+    assert delta['full'] is False
+    assert set(delta['progress']) == {'card_2', 'card_3'}
+    assert delta['favorites'] == {'added': ['card_5'], 'removed': ['card_9']}
+    assert delta['version'] == baseline['version'] + 3
+
+    empty = client.get(f"/api/progress?since={delta['version']}").get_json()
+    assert empty['progress'] == {}
+    assert empty['favorites'] == {'added': [], 'removed': []}
+
+
+def test_unchanged_user_data_returns_304(client):
+    first = client.get('/api/progress')
+    etag = first.headers['ETag']
+    assert etag.startswith('W/')
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        cached = client.get('/api/progress', headers={'If-None-Match': etag})
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    assert cached.status_code == 304
+    assert cached.data == b''
+    assert len(statements) == 1
+    assert 'user_progress' not in statements[0]
+
+    client.post('/api/progress', json={'card_id': 'card_1', 'action': 'known'})
+    changed = client.get('/api/progress', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+    stats_etag = client.get('/api/stats').headers['ETag']
+    assert client.get('/api/stats', headers={'If-None-Match': stats_etag}).status_code == 304
+    session_id = client.post('/api/session/start').get_json()['session_id']
+    assert client.get('/api/stats', headers={'If-None-Match': stats_etag}).status_code == 200
+
+    favorites_etag = client.get('/api/favorites').headers['ETag']
+    client.post('/api/session/end', json={'session_id': session_id, 'total_time_seconds': 30})
+    assert client.get('/api/favorites', headers={'If-None-Match': favorites_etag}).status_code == 200
+
+
+def test_large_json_responses_are_compact_and_gzipped(client, monkeypatch):
+    client.post('/api/progress/batch', json={'events': [
+        {'card_id': f'card_{i}', 'action': 'known'} for i in range(1, 41)
+    ]})
+
+    plain = client.get('/api/progress')
+    assert 'Content-Encoding' not in plain.headers
+    assert b'\n' not in plain.data and b'": ' not in plain.data
+    record = plain.get_json()['progress']['card_1']
+    assert record['known_count'] == 1
+    assert re.fullmatch(r'\d{4}-\d\d-\d\dT[\d:.]+', record['first_seen'])
+
+    compressed = client.get('/api/progress', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert len(compressed.data) < len(plain.data)
+    assert json.loads(gzip.decompress(compressed.data)) == plain.get_json()
+
+    # The stdlib fallback produces the same document as orjson
+    monkeypatch.setattr(serialization, 'orjson', None)
+    assert client.get('/api/progress').get_json() == plain.get_json()
+
+
+def metric_value(client, series):
+    """Current value of one metrics series, or 0 if it hasn't been reported yet."""
+    for line in client.get('/metrics', headers=METRICS_HEADERS).get_data(as_text=True).splitlines():
+        if line.startswith(series + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0
+
+
+def test_metrics_report_routes_statuses_and_queries(client, monkeypatch):
+    progress_ok = 'flashcards_http_requests_total{route="/api/progress",method="GET",status="200"}'
+    search_bad = 'flashcards_http_requests_total{route="/api/cards/search",method="GET",status="400"}'
+    cards_latency = 'flashcards_http_request_duration_seconds_bucket{route="/api/cards",method="GET",le="+Inf"}'
+    cards_size = 'flashcards_http_response_size_bytes_sum{route="/api/cards",method="GET"}'
+    progress_queries = 'flashcards_db_queries_total{route="/api/progress",method="GET"}'
+    before = {series: metric_value(client, series)
+              for series in (progress_ok, search_bad, cards_latency, cards_size, progress_queries)}
+
+    client.get('/api/progress')
+    client.get('/api/cards?limit=5')
+    client.get('/api/cards/search')
+
+    response = client.get('/metrics', headers=METRICS_HEADERS)
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    monkeypatch.setattr(metrics_module, 'METRICS_TOKEN', '')
+    assert client.get('/metrics', headers=METRICS_HEADERS).status_code == 404
+    monkeypatch.undo()
+    assert metric_value(client, progress_ok) == before[progress_ok] + 1
+    assert metric_value(client, search_bad) == before[search_bad] + 1
+    assert metric_value(client, cards_latency) == before[cards_latency] + 1
+    assert metric_value(client, cards_size) > before[cards_size]
+    assert metric_value(client, progress_queries) >= before[progress_queries] + 2
+
+
+def test_server_timing_and_slow_request_log(client, tmp_path, monkeypatch):
+    log_path = tmp_path / 'slow.log'
+    monkeypatch.setattr(server, 'profiler', RequestProfiler(
+        slow_ms=0.001, log_path=str(log_path), sample_rate=1, profile_dir=str(tmp_path / 'profiles')
+    ))
+
+    response = client.post('/api/progress', json={'card_id': 'card_1', 'action': 'known'})
+    assert response.status_code == 200
+    timing = dict(part.split(';dur=') for part in response.headers['Server-Timing'].split(', '))
+    assert {'auth', 'db', 'serialize', 'total'} <= set(timing)
+    assert float(timing['total']) >= float(timing['db'])
+
+    entry = json.loads(log_path.read_text().splitlines()[-1])
+    assert entry['route'] == '/api/progress' and entry['method'] == 'POST'
+    assert any('user_progress' in query['sql'] for query in entry['queries'])
+    assert entry['profile'] and os.path.exists(entry['profile'])
+
+    media = client.get('/word_audio/Abend_voice.mp3')
+    assert media.status_code == 200
+    assert 'io' in dict(part.split(';dur=') for part in media.headers['Server-Timing'].split(', '))
+
+
+def test_load_test_reports_percentiles_per_endpoint(client, monkeypatch):
+    monkeypatch.setattr(server, 'profiler', RequestProfiler(slow_ms=0, sample_rate=0))
+    options = load_test.parse_args(['--users', '3', '--rounds', '1', '--marks', '3', '--favorites', '1'])
+
+    report = load_test.run_load_test(options, app=app)
+
+    assert report['errors'] == 0
+    assert report['requests'] == 3 * 10
+    marks = report['endpoints']['POST /api/progress']
+    assert marks['count'] == 9
+    assert marks['p50_ms'] <= marks['p95_ms'] <= marks['p99_ms'] <= marks['max_ms']
+    with app.app_context():
+        assert db.session.query(func.count(UserSession.id)).scalar() == 3
+
+
+def test_load_test_drives_the_json_file_server(monkeypatch):
+    import app as file_app
+    monkeypatch.setattr(file_app, 'profiler', RequestProfiler(slow_ms=0, sample_rate=0))
+    options = load_test.parse_args(['--target', 'app', '--users', '2', '--rounds', '1', '--marks', '2'])
+
+    report = load_test.run_load_test(options)
+
+    assert report['errors'] == 0
+    assert set(report['endpoints']) >= {'POST /api/login', 'POST /api/progress', 'GET /api/user/stats'}
+    assert load_test.compare_to_baseline(report, report, 0.2) == []
+
+
+def test_generated_dataset_is_consistent_with_the_live_schema(client, tmp_path):
+    options = generate_dataset.parse_args(['--users', '40', '--seed', '3', '--json-dir', str(tmp_path),
+                                           '--database', app.config['SQLALCHEMY_DATABASE_URI']])
+
+    counts = generate_dataset.generate_dataset(options)
+
+    assert counts['user'] == counts['user_stats'] == counts['json_files'] == 40
+    assert counts['user_progress'] >= 40 * generate_dataset.MIN_CARDS
+    with app.app_context():
+        assert db.session.query(func.count(UserProgress.id)).scalar() == counts['user_progress']
+        heaviest = db.session.query(UserStats).order_by(UserStats.total_cards_studied.desc()).first()
+        rollup = heaviest.to_dict()
+        expected = compute_user_stats(heaviest.user_id)
+        assert rollup['total_cards_studied'] == expected['total_cards_studied']
+        assert rollup['known_cards'] == expected['known_cards']
+        assert rollup['total_sessions'] == expected['total_sessions']
+        assert abs(heaviest.accuracy_sum - expected['accuracy_sum']) < 1e-6
+        username = db.session.get(User, heaviest.user_id).username
+
+    other = app.test_client()
+    assert other.post('/api/login', json={'username': username, 'password': 'password123'}).status_code == 200
+    queue = other.get('/api/queue/next?n=5').get_json()['queue']
+    assert queue and all(item['type'] in ('review', 'new') for item in queue)
+
+    manager = UserManager(str(tmp_path))
+    assert manager.login_user(username, 'password123')['success']
+    progress = manager.get_user_progress(username)
+    assert len(progress['known_cards']) + len(progress['learning_cards']) == rollup['total_cards_studied']
+
+
+def test_every_route_declares_a_query_budget(client):
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint != 'static':
+            assert hasattr(app.view_functions[rule.endpoint], 'query_budget'), rule.rule
+
+    # One upsert per event plus the version bump and the first stats rollup
+    events = [{'card_id': f'card_{i}', 'action': 'known'} for i in range(20)]
+    with app.app_context(), assert_max_queries(db.engine, 6 + len(events)):
+        assert client.post('/api/progress/batch', json={'events': events}).status_code == 200
+
+
+def test_query_budget_raises_in_tests_and_logs_in_debug(client, monkeypatch, capsys):
+    def two_queries():
+        db.session.execute(text('SELECT 1'))
+        db.session.execute(text('SELECT 2'))
+        return 'ok'
+
+    view = server.query_budget(1)(two_queries)
+    with app.test_request_context('/api/example'):
+        server.start_request_metrics()
+        with pytest.raises(QueryBudgetExceeded) as excinfo:
+            view()
+    message = str(excinfo.value)
+    assert 'ran 2 SQL statements, over its budget of 1' in message
+    assert 'SELECT 2' in message
+    assert 'test_server.py' in message and 'in two_queries' in message
+
+    monkeypatch.setattr(server, 'QUERY_BUDGET_MODE', 'log')
+    with app.test_request_context('/api/example'):
+        server.start_request_metrics()
+        assert view() == 'ok'
+    assert 'Query budget exceeded' in capsys.readouterr().out
+
+
+def test_admin_user_listing_pages_by_keyset(client, monkeypatch):
+    assert client.get('/api/admin/users').status_code == 403
+    monkeypatch.setattr(server, 'ADMIN_USERNAMES', {'user'})
+
+    with app.app_context():
+        base = server.datetime(2025, 1, 1)
+        for i in range(5):
+            account = User(username=f'learner{i}', email=f'learner{i}@example.com',
+                           created_at=base + server.timedelta(days=i), last_login=base)
+            account.set_password('password123')
+            db.session.add(account)
+        db.session.commit()
+
+    seen, cursor = [], None
+    while True:
+        query = '/api/admin/users?q=learner&limit=2' + (f'&cursor={cursor}' if cursor else '')
+        page = client.get(query).get_json()
+        seen += [user['username'] for user in page['users']]
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    assert seen == [f'learner{i}' for i in reversed(range(5))]
+
+    oldest = client.get('/api/admin/users?order=asc&limit=1&q=learner').get_json()['users']
+    assert oldest[0]['username'] == 'learner0'
+    assert client.get('/api/admin/users?sort=email').status_code == 400
+    assert client.get('/api/admin/users?cursor=nonsense').status_code == 400
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor([1], [2]))
+
+
+def test_user_manager_lists_users_from_the_catalog(tmp_path):
+    manager = UserManager(str(tmp_path))
+    for name in ('alice', 'bob', 'carol'):
+        assert manager.register_user(name, 'password123')['success']
+    manager.login_user('bob', 'password123')
+
+    reads = []
+    manager.io_timer = lambda: reads.append(1) or nullcontext()
+    first = manager.list_users(limit=2)
+    second = manager.list_users(limit=2, after=decode_cursor(first['next_cursor']))
+    assert [u['username'] for u in first['users'] + second['users']] == ['carol', 'bob', 'alice']
+    assert second['next_cursor'] is None
+    assert [u['username'] for u in manager.list_users(sort='last_login')['users']] == ['bob']
+    assert reads == []
+
+    # A catalog out of step with the user files is rebuilt on startup
+    manager.catalog.remove('alice')
+    reopened = UserManager(str(tmp_path))
+    assert reopened.catalog.count() == 3
+
+
+def test_user_journal_replays_compacts_and_survives_crashes(tmp_path):
+    manager = UserManager(str(tmp_path), flush_delay=0)
+    assert manager.register_user('journaler', 'password123')['success']
+    snapshot = tmp_path / 'journaler.json'
+    journal = tmp_path / 'journaler.journal'
+    snapshot_bytes = snapshot.read_bytes()
+
+    assert manager.login_user('journaler', 'password123')['success']
+    for i in range(3):
+        assert manager.save_user_progress('journaler', {'known_cards': [f'card_{n}' for n in range(i + 1)]})
+    assert snapshot.read_bytes() == snapshot_bytes  # Writes only append to the journal
+    progress = manager.get_user_progress('journaler')
+    assert progress['total_sessions'] == 3 and progress['known_cards'] == ['card_0', 'card_1', 'card_2']
+
+    # A record torn by a crash mid-append is ignored, and later appends still land
+    with open(journal, 'ab') as f:
+        f.write(b'{"op":"progress","at":"2025-')
+    assert manager.get_user_progress('journaler')['total_sessions'] == 3
+    assert manager.save_user_progress('journaler', {'learning_cards': ['card_9']})
+    assert manager.get_user_progress('journaler')['total_sessions'] == 4
+
+    # Crash after the new snapshot is in place but before the journal is reset:
+    # the folded records must not be applied twice
+    old_journal = journal.read_bytes()
+    assert manager.compact_user('journaler')
+    journal.write_bytes(old_journal)
+    reopened = UserManager(str(tmp_path))
+    assert reopened.get_user_progress('journaler')['total_sessions'] == 4
+
+    assert reopened.compact_user('journaler')
+    assert reopened.compact_user('journaler') is False  # Nothing left to fold
+    assert json.loads(snapshot.read_text())['progress']['learning_cards'] == ['card_9']
+    statistics = reopened.get_user_statistics('journaler')
+    assert statistics['progress_summary'] == {
+        'total_known': 3, 'total_learning': 1, 'streak_days': 1, 'total_sessions': 4
+    }
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_progress_journal_records_only_the_change(tmp_path):
+    manager = UserManager(str(tmp_path), flush_delay=0)
+    manager.journal_fsync = False
+    assert manager.register_user('veteran', 'password123')['success']
+    journal = tmp_path / 'veteran.journal'
+    known = [f'card_{n}' for n in range(3000)]
+    assert manager.save_user_progress('veteran', {'known_cards': known, 'learning_cards': ['card_9000']})
+
+    size = journal.stat().st_size
+    known = known[1:] + ['card_3000']
+    assert manager.save_user_progress('veteran', {'known_cards': known, 'learning_cards': ['card_9000'],
+                                                  'preferences': {'theme': 'light'}})
+    assert journal.stat().st_size - size < 300
+    record = json.loads(journal.read_bytes().splitlines()[-1])
+    assert record['known_cards'] == {'add': ['card_3000'], 'remove': ['card_0']}
+    assert 'learning_cards' not in record and record['set'] == {'preferences': {'theme': 'light'}}
+
+    live = manager.get_user_statistics('veteran')
+    replayed = UserManager(str(tmp_path))
+    assert replayed.get_user_progress('veteran') == manager.get_user_progress('veteran')
+    assert replayed.get_user_statistics('veteran') == live
+    assert live['progress_summary']['total_known'] == 3000
+
+    # Journals written before deltas still replay
+    with open(journal, 'ab') as f:
+        f.write(json.dumps({'op': 'progress', 'at': '2025-01-02T10:00:00', 'data': {'known_cards': ['card_1']}}).encode() + b'\n')
+    assert UserManager(str(tmp_path)).get_user_progress('veteran')['known_cards'] == ['card_1']
+
+
+def test_user_cache_serves_steady_traffic_from_memory_and_writes_behind(tmp_path):
+    manager = UserManager(str(tmp_path), cache_size=2, flush_delay=60)
+    for name in ('alice', 'bob', 'carol'):
+        assert manager.register_user(name, 'password123')['success']
+    assert manager.login_user('alice', 'password123')['success']
+
+    file_access = []
+    manager.io_timer = lambda: file_access.append(1) or nullcontext()
+    for i in range(5):
+        assert manager.save_user_progress('alice', {'known_cards': [f'card_{n}' for n in range(i + 1)]})
+        assert manager.get_user_progress('alice')['total_sessions'] == i + 1
+        assert manager.get_user_statistics('alice')['progress_summary']['total_known'] == i + 1
+    assert file_access == []
+    assert manager.cache_stats()['dirty'] == 1
+
+    # Changes are only on disk once flushed; evicting alice flushes them
+    other = UserManager(str(tmp_path), flush_delay=0)
+    assert other.get_user_progress('alice')['total_sessions'] == 0
+    manager.get_user_progress('bob')
+    manager.get_user_progress('carol')
+    stats = manager.cache_stats()
+    assert stats['evictions'] == 1 and stats['flushes'] == 1 and stats['entries'] == 2
+    assert other.get_user_progress('alice')['total_sessions'] == 5
+
+    # Another process writing the same user's files invalidates the cached copy
+    assert other.save_user_progress('bob', {'learning_cards': ['card_7']})
+    assert manager.get_user_progress('bob')['learning_cards'] == ['card_7']
+
+    assert manager.save_user_progress('carol', {'known_cards': ['card_1']})
+    manager.close()
+    assert other.get_user_progress('carol')['known_cards'] == ['card_1']
+    assert 'flashcards_user_cache_hits_total' in app_module.metrics.render()
+
+
+def test_concurrent_writes_to_one_user_are_serialized(tmp_path):
+    manager = UserManager(str(tmp_path), flush_delay=0)
+    assert manager.register_user('racer', 'password123')['success']
+
+    def save(worker):
+        return [manager.save_user_progress('racer', {'learning_cards': [f'card_{worker}_{i}']}) for i in range(10)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        saved = [ok for results in pool.map(save, range(8)) for ok in results]
+        registrations = list(pool.map(lambda _: manager.register_user('dupe', 'password123'), range(4)))
+    manager.close()
+
+    assert len(saved) == 80 and all(saved)
+    assert UserManager(str(tmp_path)).get_user_progress('racer')['total_sessions'] == 80
+    assert sum(result['success'] for result in registrations) == 1
+
+
+def test_concurrent_misses_on_a_small_cache_do_not_deadlock(tmp_path):
+    manager = UserManager(str(tmp_path), cache_size=2, flush_delay=0)
+    names = [f'busy{n}' for n in range(8)]
+    for name in names:
+        assert manager.register_user(name, 'password123')['success']
+
+    def save(worker):
+        for i in range(30):
+            name = names[(worker * 3 + i) % len(names)]
+            assert manager.save_user_progress(name, {'learning_cards': [f'card_{worker}_{i}']})
+            assert manager.get_user_statistics(names[(worker + i) % len(names)]) is not None
+
+    threads = [threading.Thread(target=save, args=(n,), daemon=True) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=60)
+    assert not any(thread.is_alive() for thread in threads)
+    manager.close()
+
+    assert manager.cache_stats()['entries'] <= 2 + len(threads)
+    reopened = UserManager(str(tmp_path))
+    assert sum(reopened.get_user_progress(name)['total_sessions'] for name in names) == 8 * 30
+
+
+def test_pooled_server_keeps_serving_while_a_client_stalls(monkeypatch):
+    monkeypatch.setattr(app_module, 'profiler', RequestProfiler(slow_ms=0, sample_rate=0))
+    httpd = app_module.create_server(('127.0.0.1', 0), workers=2)
+    assert isinstance(httpd, app_module.PooledHTTPServer)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    host, port = httpd.server_address[:2]
+    try:
+        with socket.create_connection((host, port), timeout=5) as stalled:
+            stalled.sendall(b'GET /metrics HTT')  # Half a request line, then nothing
+            connection = http.client.HTTPConnection(host, port, timeout=5)
+            connection.request('GET', '/metrics', headers=METRICS_HEADERS)
+            response = connection.getresponse()
+            assert response.status == 200 and response.read()
+            connection.close()
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_sessions_survive_restarts_and_expired_ones_are_swept(tmp_path):
+    manager = UserManager(str(tmp_path), flush_delay=0)
+    assert manager.register_user('sticky', 'password123')['success']
+    token = manager.login_user('sticky', 'password123')['token']
+    manager.close()
+
+    # A restarted server, or another worker process, sees the same sessions
+    restarted = UserManager(str(tmp_path))
+    assert restarted.validate_session(token) == 'sticky'
+    for path in tmp_path.glob(SESSION_DB_FILE + '*'):
+        assert token.encode() not in path.read_bytes()  # Only token hashes are stored
+
+    store = restarted.session_store
+    store.put('abandoned', 'sticky', time.time() - 1)
+    assert store.count() == 2
+    assert store.sweep() == 1 and store.count() == 1
+
+    assert restarted.logout_user(token)['success']
+    assert UserManager(str(tmp_path)).validate_session(token) is None
+    assert store.count() == 0
+
+    memory = MemorySessionStore()
+    memory.put('a', 'alice', 100)
+    memory.put('b', 'bob', 200)
+    memory.put('a', 'alice', 300)  # Renewed, so its first expiry no longer applies
+    assert memory.sweep(now=250) == 1
+    assert memory.get('a', now=250).username == 'alice' and memory.get('b', now=250) is None
+
+
+def test_anonymous_sessions_are_compact_and_bounded(tmp_path):
+    manager = UserManager(str(tmp_path), flush_delay=0)
+    assert manager.register_user('convert', 'password123')['success']
+    anonymous = manager.create_anonymous_session()['token']
+    assert manager.validate_session(anonymous) is None
+    assert manager.save_anonymous_progress(anonymous, {
+        'known_cards': ['card_1', 'card_2'], 'learning_cards': ['card_3'], 'preferences': {'theme': 'light'}
+    })
+    progress = manager.get_anonymous_progress(anonymous)
+    assert progress['known_cards'] == ['card_1', 'card_2'] and progress['learning_cards'] == ['card_3']
+    assert progress['preferences']['theme'] == 'light' and progress['preferences']['cards_per_session'] == 20
+    # Card IDs outside the deck are refused, not interned or silently dropped
+    with pytest.raises(ValueError):
+        manager.save_anonymous_progress(anonymous, {'known_cards': ['card_1', 'x' * 1000]})
+    assert manager.get_anonymous_progress(anonymous)['known_cards'] == ['card_1', 'card_2']
+    assert manager.transfer_anonymous_progress(anonymous, 'convert')
+    assert sorted(manager.get_user_progress('convert')['known_cards']) == ['card_1', 'card_2']
+    assert manager.get_anonymous_progress(anonymous) is None
+
+    # Unused sessions expire
+    store = AnonymousSessionStore(memory_budget=1024 * 1024, ttl=60)
+    store.create('anon_idle', now=1000)
+    store.create('anon_busy', now=1000)
+    assert store.progress('anon_busy', now=1050) is not None
+    assert store.progress('anon_idle', now=1061) is None
+    assert store.sweep(now=1111) == 1 and len(store) == 0
+
+    # A million visitors later, memory is where it was after the first few thousand
+    budget = 2 * 1024 * 1024
+    store = AnonymousSessionStore(memory_budget=budget)
+    for i in range(50_000):
+        store.create(f'anon_{i:043d}', now=1_700_000_000)
+    size, blocks = len(store), sys.getallocatedblocks()
+    for i in range(50_000, 1_000_000):
+        store.create(f'anon_{i:043d}', now=1_700_000_000)
+    assert len(store) == size and store.stats()['bytes'] <= budget
+    assert store.stats()['evictions'] == 1_000_000 - size
+    assert abs(sys.getallocatedblocks() - blocks) < 1000
+    assert store.progress(f'anon_{999_999:043d}', now=1_700_000_000) is not None
+    assert store.progress(f'anon_{0:043d}', now=1_700_000_000) is None
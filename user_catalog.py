@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Admin user listing for the Language Flash Cards servers.
+Pages are keyset-paginated with an opaque cursor, so a page costs the
+same however many users there are. For app.py the listing is served
+from a small SQLite catalog kept next to the user files instead of
+opening every users/*.json.
+"""
+
+import base64
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Columns the listing can be sorted by, newest first unless order=asc
+LIST_SORTS = ('created_at', 'last_login')
+LIST_ORDERS = ('desc', 'asc')
+
+DEFAULT_USERS_PAGE = 50
+MAX_USERS_PAGE = 200
+
+CATALOG_FILE = '_catalog.sqlite3'
+
+
+def encode_cursor(value, key) -> str:
+    """Opaque cursor for the row a page ended on: its sort value and tie-breaking key."""
+    raw = json.dumps([value, key], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple:
+    """(sort value, key) from encode_cursor(); raises ValueError for anything else.
+
+    Sort values are ISO timestamps and keys are usernames or user IDs, so
+    nothing else can reach a query as a parameter.
+    """
+    try:
+        value, key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(value, str) or isinstance(key, bool) or not isinstance(key, (str, int)):
+        raise ValueError('Invalid cursor')
+    return value, key
+
+
+def parse_list_params(get: Callable[[str], Optional[str]]) -> Dict:
+    """Validate listing query parameters, read with get(name).
+
+    Returns keyword arguments for the backends' list functions; raises
+    ValueError with a message suitable for a 400 response.
+    """
+    sort = get('sort') or 'created_at'
+    if sort not in LIST_SORTS:
+        raise ValueError(f"Sort must be one of: {', '.join(LIST_SORTS)}")
+    order = (get('order') or 'desc').lower()
+    if order not in LIST_ORDERS:
+        raise ValueError('Order must be asc or desc')
+    try:
+        limit = int(get('limit') or DEFAULT_USERS_PAGE)
+    except ValueError:
+        raise ValueError('Limit must be a number')
+    cursor = get('cursor')
+    active_since = (get('active_since') or '').strip() or None
+    if active_since:
+        try:
+            active_since = datetime.fromisoformat(active_since).isoformat()
+        except ValueError:
+            raise ValueError('active_since must be an ISO 8601 date or time')
+    return {
+        'sort': sort,
+        'order': order,
+        'limit': max(1, min(limit, MAX_USERS_PAGE)),
+        'after': decode_cursor(cursor) if cursor else None,
+        'prefix': (get('q') or '').strip() or None,
+        'active_since': active_since,
+    }
+
+
+class UserCatalog:
+    """Indexed summary of the users/*.json files: one row per user."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                username TEXT PRIMARY KEY,
+                created_at TEXT NOT NULL,
+                last_login TEXT,
+                total_sessions INTEGER NOT NULL DEFAULT 0,
+                cards_learned INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS ix_users_created_at ON users (created_at, username);
+            CREATE INDEX IF NOT EXISTS ix_users_last_login ON users (last_login, username);
+            """
+        )
+
+    @staticmethod
+    def _row(user_data: Dict) -> Tuple:
+        progress = user_data.get('progress', {})
+        return (
+            user_data['username'],
+            user_data.get('created_at') or '',
+            user_data.get('last_login'),
+            progress.get('total_sessions', 0),
+            len(progress.get('known_cards', [])),
+        )
+
+    def update(self, user_data: Dict):
+        """Insert or refresh a user's row from their user document."""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO users (username, created_at, last_login, total_sessions, cards_learned) '
+                'VALUES (?, ?, ?, ?, ?)',
+                self._row(user_data)
+            )
+
+    def remove(self, username: str):
+        with self._lock:
+            self._conn.execute('DELETE FROM users WHERE username = ?', (username,))
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+    def rebuild(self, documents: Iterable[Dict]):
+        """Replace the catalog with rows for the given user documents."""
+        rows = [self._row(user_data) for user_data in documents]
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.execute('DELETE FROM users')
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO users (username, created_at, last_login, total_sessions, cards_learned) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    rows
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def page(self, sort: str = 'created_at', order: str = 'desc', limit: int = DEFAULT_USERS_PAGE,
+             after: Optional[Tuple] = None, prefix: Optional[str] = None,
+             active_since: Optional[str] = None) -> Dict:
+        """One page of users in (sort, username) order, read through the sort index.
+
+        Sorting by last_login lists only users who have logged in.
+        """
+        if sort not in LIST_SORTS or order not in LIST_ORDERS:
+            raise ValueError('Unsupported sort')
+        comparison = '<' if order == 'desc' else '>'
+        direction = order.upper()
+
+        conditions, params = [], []
+        if sort == 'last_login':
+            conditions.append('last_login IS NOT NULL')
+        if after is not None:
+            conditions.append(f'({sort}, username) {comparison} (?, ?)')
+            params.extend(after)
+        if prefix:
+            conditions.append("username >= ? AND username < ?")
+            params.extend([prefix, prefix + '\uffff'])
+        if active_since:
+            conditions.append('last_login >= ?')
+            params.append(active_since)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT username, created_at, last_login, total_sessions, cards_learned FROM users {where} '
+                f'ORDER BY {sort} {direction}, username {direction} LIMIT ?',
+                params + [limit + 1]
+            ).fetchall()
+
+        users: List[Dict] = [
+            {
+                'username': username,
+                'created_at': created_at,
+                'last_login': last_login,
+                'total_sessions': total_sessions,
+                'cards_learned': cards_learned,
+            }
+            for username, created_at, last_login, total_sessions, cards_learned in rows[:limit]
+        ]
+        next_cursor = None
+        if len(rows) > limit:
+            last = users[-1]
+            next_cursor = encode_cursor(last[sort], last['username'])
+        return {'users': users, 'next_cursor': next_cursor}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
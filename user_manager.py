@@ -2,24 +2,126 @@
 """
 User management system for Language Flash Cards application.
 Handles user registration, login, and progress persistence.
+
+Each user is stored as a compact snapshot (users/<name>.json) plus an
+append-only journal of changes (users/<name>.journal). Writes append a
+small delta record; a background thread folds the journal back into the
+snapshot once it grows past JOURNAL_COMPACT_BYTES.
+
+Parsed user documents are kept in a bounded LRU cache. Changes are
+applied to the cached document at once and appended to the journal
+shortly afterwards (write-behind), coalescing bursts of saves.
+
+Sessions live in a pluggable store (see session_store.py), by default a
+SQLite file next to the user files, so they survive restarts. Anonymous
+sessions are kept in memory in a bounded store (see anonymous_sessions.py).
 """
 
+import atexit
+import copy
 import json
 import os
 import hashlib
+import queue
 import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
 from pathlib import Path
 from datetime import datetime, timedelta
-from typing import Dict, Optional, List
+from typing import Dict, Optional
+
+from anonymous_sessions import AnonymousSessionStore
+from session_store import SESSION_STORE, SESSION_SWEEP_SECONDS, SessionStore, SessionSweeper, open_session_store
+from user_catalog import CATALOG_FILE, DEFAULT_USERS_PAGE, UserCatalog
+
+# Journals larger than this are folded into the user's snapshot
+JOURNAL_COMPACT_BYTES = int(os.environ.get('JOURNAL_COMPACT_BYTES', 64 * 1024))
+
+# Snapshot key recording which journal bytes the snapshot already contains
+JOURNAL_STATE_KEY = "journal_state"
+
+# Progress lists journaled as the card IDs added and removed
+CARD_LISTS = ("known_cards", "learning_cards")
+
+# Parsed user documents kept in memory
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 256))
+
+# Seconds a change may wait in memory before it is appended to the journal (0 writes through)
+USER_CACHE_FLUSH_SECONDS = float(os.environ.get('USER_CACHE_FLUSH_SECONDS', 1.0))
+
+# Login session lifetime
+USER_SESSION_DAYS = 30
+
+
+def _fsync_directory(directory: Path):
+    """Make a rename inside the directory durable (not supported on Windows)."""
+    try:
+        fd = os.open(str(directory), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class _CachedUser:
+    """A parsed user document, the file state it was read from and its unflushed changes."""
+    
+    __slots__ = ("data", "validator", "pending")
+    
+    def __init__(self, data: Dict, validator: tuple):
+        self.data = data
+        self.validator = validator
+        self.pending = []
 
 
 class UserManager:
-    def __init__(self, users_dir: str = "users"):
+    def __init__(self, users_dir: str = "users", cache_size: int = USER_CACHE_SIZE,
+                 flush_delay: float = USER_CACHE_FLUSH_SECONDS, session_store: SessionStore = None,
+                 anonymous_store: AnonymousSessionStore = None):
         """Initialize the user manager."""
         self.users_dir = Path(users_dir)
         self.users_dir.mkdir(exist_ok=True)
-        self.sessions = {}  # In-memory session storage
-        self.anonymous_sessions = {}  # Store anonymous user sessions
+        
+        # Login and anonymous sessions, swept for expired ones in the background
+        self.session_store = session_store or open_session_store(SESSION_STORE, self.users_dir)
+        self.anonymous_store = anonymous_store or AnonymousSessionStore()
+        self._session_sweeper = None
+        if SESSION_SWEEP_SECONDS > 0:
+            self._session_sweeper = SessionSweeper(
+                [self.session_store, self.anonymous_store], SESSION_SWEEP_SECONDS
+            ).start()
+        self.io_timer = nullcontext  # Context manager factory wrapped around user file access
+        self.journal_fsync = True  # fsync every journal append, not just snapshots
+        
+        # One lock per user serializes appends with compaction of that user's files
+        self._user_locks = {}
+        self._user_locks_lock = threading.Lock()
+        self._compact_queue = queue.Queue()
+        self._compact_pending = set()
+        self._compactor = None
+        
+        # LRU cache of parsed user documents, with write-behind of their changes
+        self.cache_size = cache_size
+        self.flush_delay = flush_delay
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._flush_timer = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
+        self.cache_flushes = 0
+        atexit.register(self.flush)
+        
+        # Indexed user summaries for list_users(); rebuilt if the user files changed behind our back
+        self.catalog = UserCatalog(self.users_dir / CATALOG_FILE)
+        if self.catalog.count() != sum(1 for _ in self.users_dir.glob("*.json")):
+            self.rebuild_catalog()
         
     def _hash_password(self, password: str, salt: str = None) -> tuple:
         """Hash a password with salt."""
@@ -39,6 +141,339 @@ class UserManager:
         safe_username = "".join(c for c in username if c.isalnum() or c in "-_")
         return self.users_dir / f"{safe_username}.json"
     
+    def _get_journal_path(self, username: str) -> Path:
+        """Get the path of a user's change journal."""
+        return self._get_user_file_path(username).with_suffix(".journal")
+    
+    def _user_lock(self, username: str) -> threading.RLock:
+        """The lock guarding one user's snapshot and journal."""
+        with self._user_locks_lock:
+            lock = self._user_locks.get(username)
+            if lock is None:
+                lock = self._user_locks[username] = threading.RLock()
+            return lock
+    
+    def _write_snapshot(self, user_file: Path, user_data: Dict):
+        """Atomically replace a user's snapshot: write a temp file, fsync, rename over."""
+        tmp_file = user_file.with_name(user_file.name + ".tmp")
+        with self.io_timer():
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(user_data, f, ensure_ascii=False, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, user_file)
+            _fsync_directory(user_file.parent)
+    
+    def _read_journal(self, journal_file: Path):
+        """Read a journal; returns (journal id, [(end offset, record)]).
+        
+        A torn last line from a crash mid-append, or any line that isn't
+        valid JSON, is skipped.
+        """
+        try:
+            with self.io_timer(), open(journal_file, 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return None, []
+        
+        journal_id = None
+        records = []
+        offset = 0
+        for line in raw.splitlines(keepends=True):
+            offset += len(line)
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "journal" in record:
+                journal_id = record["journal"]
+            else:
+                records.append((offset, record))
+        return journal_id, records
+    
+    def _load_user_data(self, username: str) -> Optional[Dict]:
+        """Load a user's document: the snapshot with the journal replayed on top."""
+        user_file = self._get_user_file_path(username)
+        
+        # Read both files under the lock so a compaction can't land in between
+        with self._user_lock(username):
+            try:
+                with self.io_timer(), open(user_file, 'r', encoding='utf-8') as f:
+                    user_data = json.load(f)
+            except FileNotFoundError:
+                return None
+            journal_id, records = self._read_journal(self._get_journal_path(username))
+        
+        # Skip the journal bytes this snapshot was compacted from
+        state = user_data.pop(JOURNAL_STATE_KEY, None) or {}
+        folded = state.get("offset", 0) if journal_id is not None and journal_id == state.get("id") else 0
+        for end_offset, record in records:
+            if end_offset > folded:
+                self._apply_record(user_data, record)
+        return user_data
+    
+    @staticmethod
+    def _journal_header() -> bytes:
+        return json.dumps({"journal": secrets.token_hex(8)}).encode('utf-8') + b"\n"
+    
+    def _append_records(self, username: str, records: list):
+        """Durably append change records to a user's journal in one write."""
+        journal_file = self._get_journal_path(username)
+        lines = b"".join(
+            json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b"\n"
+            for record in records
+        )
+        
+        with self._user_lock(username):
+            with self.io_timer(), open(journal_file, 'a+b') as f:
+                size = f.seek(0, os.SEEK_END)
+                if size == 0:
+                    f.write(self._journal_header())
+                else:
+                    # Terminate a line torn by an earlier crash so it can't swallow these records
+                    f.seek(size - 1)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")
+                f.write(lines)
+                f.flush()
+                if self.journal_fsync:
+                    os.fsync(f.fileno())
+                size = f.tell()
+        
+        if size > JOURNAL_COMPACT_BYTES:
+            self._schedule_compaction(username)
+    
+    def _file_validator(self, username: str) -> Optional[tuple]:
+        """mtime and size of a user's snapshot and journal, or None if the user doesn't exist."""
+        try:
+            snapshot = self._get_user_file_path(username).stat()
+        except FileNotFoundError:
+            return None
+        try:
+            journal = self._get_journal_path(username).stat()
+            journal_state = (journal.st_mtime_ns, journal.st_size)
+        except FileNotFoundError:
+            journal_state = None
+        return snapshot.st_mtime_ns, snapshot.st_size, journal_state
+    
+    def _get_user_data(self, username: str) -> Optional[Dict]:
+        """The cached document for a user, loaded from disk on a miss or if the files changed.
+        
+        The document is shared; callers must hold the user's lock while using it
+        and copy anything they hand out.
+        """
+        with self._user_lock(username):
+            validator = self._file_validator(username)
+            with self._cache_lock:
+                entry = self._cache.get(username)
+                if entry is not None:
+                    self._cache.move_to_end(username)
+            
+            if entry is not None and entry.validator == validator:
+                with self._cache_lock:
+                    self.cache_hits += 1
+                return entry.data
+            
+            with self._cache_lock:
+                self.cache_misses += 1
+            user_data = self._load_user_data(username) if validator is not None else None
+            if user_data is None:
+                if entry is not None and not entry.pending:
+                    with self._cache_lock:
+                        self._cache.pop(username, None)
+                return None
+            
+            fresh = _CachedUser(user_data, validator)
+            if entry is not None:
+                # The files changed underneath us; keep our unflushed changes on top
+                fresh.pending = entry.pending
+                for record in fresh.pending:
+                    self._apply_record(user_data, record)
+            with self._cache_lock:
+                self._cache[username] = fresh
+                self._cache.move_to_end(username)
+        
+        self._evict_overflow()
+        return user_data
+    
+    def _evict_overflow(self):
+        """Drop least recently used documents beyond cache_size, flushing them first.
+        
+        Callers already hold their own user's lock, so other users' locks are
+        only tried, never waited for: waiting could deadlock two threads that
+        each evict the other's user. Users busy in another thread are skipped
+        and evicted by a later miss.
+        """
+        with self._cache_lock:
+            excess = len(self._cache) - self.cache_size
+            candidates = list(self._cache) if excess > 0 else []
+        for username in candidates:
+            if excess <= 0:
+                return
+            lock = self._user_lock(username)
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                self._flush_user(username)
+                with self._cache_lock:
+                    if self._cache.pop(username, None) is not None:
+                        self.cache_evictions += 1
+                        excess -= 1
+            finally:
+                lock.release()
+    
+    def _record_change(self, username: str, user_data: Dict, record: Dict):
+        """Apply a change record to a user's cached document and queue it for the journal."""
+        with self._user_lock(username):
+            self._apply_record(user_data, record)
+            with self._cache_lock:
+                entry = self._cache.get(username)
+            if entry is None or entry.data is not user_data:
+                # Not cached (e.g. a zero-size cache): write through
+                self._append_records(username, [record])
+            else:
+                entry.pending.append(record)
+                if self.flush_delay <= 0:
+                    self._flush_user(username)
+                else:
+                    self._schedule_flush()
+            self.catalog.update(user_data)
+    
+    def _flush_user(self, username: str):
+        """Append a cached user's unflushed changes to their journal."""
+        with self._user_lock(username):
+            with self._cache_lock:
+                entry = self._cache.get(username)
+            if entry is None or not entry.pending:
+                return
+            self._append_records(username, entry.pending)
+            entry.pending = []
+            entry.validator = self._file_validator(username)
+            with self._cache_lock:
+                self.cache_flushes += 1
+    
+    def _schedule_flush(self):
+        """Flush dirty documents flush_delay seconds after the first unflushed change."""
+        with self._cache_lock:
+            if self._flush_timer is not None:
+                return
+            self._flush_timer = threading.Timer(self.flush_delay, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+    
+    def flush(self):
+        """Write every cached user's unflushed changes to their journals."""
+        with self._cache_lock:
+            timer, self._flush_timer = self._flush_timer, None
+            dirty = [username for username, entry in self._cache.items() if entry.pending]
+        if timer is not None:
+            timer.cancel()
+        for username in dirty:
+            try:
+                self._flush_user(username)
+            except Exception as e:
+                print(f"❌ Error flushing changes for user {username}: {e}")
+    
+    def cache_stats(self) -> Dict:
+        """Document cache counters: hits, misses, evictions, flushes and current size."""
+        with self._cache_lock:
+            entries = len(self._cache)
+            dirty = sum(1 for entry in self._cache.values() if entry.pending)
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "evictions": self.cache_evictions,
+            "flushes": self.cache_flushes,
+            "entries": entries,
+            "dirty": dirty
+        }
+    
+    def _apply_record(self, user_data: Dict, record: Dict):
+        """Replay one journal record onto a user document."""
+        at = datetime.fromisoformat(record["at"])
+        if record["op"] == "login":
+            user_data["last_login"] = record["at"]
+            self._update_streak(user_data, at.date())
+        elif record["op"] == "progress" and "data" in record:
+            # Older journals hold the whole saved progress
+            self._merge_progress(user_data, record["data"], at.date())
+        elif record["op"] == "progress":
+            self._apply_progress_delta(user_data, record, at.date())
+    
+    def compact_user(self, username: str) -> bool:
+        """Fold a user's journal into their snapshot and start a fresh journal."""
+        user_file = self._get_user_file_path(username)
+        journal_file = self._get_journal_path(username)
+        
+        with self._user_lock(username):
+            self._flush_user(username)
+            journal_id, records = self._read_journal(journal_file)
+            if not records:
+                return False
+            user_data = self._load_user_data(username)
+            if user_data is None:
+                return False
+            
+            # If we crash after the rename below, the snapshot still knows
+            # which journal bytes it holds and replay skips them
+            user_data[JOURNAL_STATE_KEY] = {"id": journal_id, "offset": records[-1][0]}
+            self._write_snapshot(user_file, user_data)
+            
+            tmp_file = journal_file.with_name(journal_file.name + ".tmp")
+            with self.io_timer():
+                with open(tmp_file, 'wb') as f:
+                    f.write(self._journal_header())
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_file, journal_file)
+                _fsync_directory(journal_file.parent)
+            
+            # Same document, new files: keep the cached copy valid
+            with self._cache_lock:
+                entry = self._cache.get(username)
+            if entry is not None:
+                entry.validator = self._file_validator(username)
+        
+        print(f"✅ Compacted journal for user: {username} ({len(records)} changes)")
+        return True
+    
+    def _schedule_compaction(self, username: str):
+        """Queue a user's journal for compaction on the background thread."""
+        with self._user_locks_lock:
+            if username in self._compact_pending:
+                return
+            self._compact_pending.add(username)
+            if self._compactor is None:
+                self._compactor = threading.Thread(target=self._compaction_worker, name="journal-compactor", daemon=True)
+                self._compactor.start()
+        self._compact_queue.put(username)
+    
+    def _compaction_worker(self):
+        while True:
+            username = self._compact_queue.get()
+            if username is None:
+                return
+            with self._user_locks_lock:
+                self._compact_pending.discard(username)
+            try:
+                self.compact_user(username)
+            except Exception as e:
+                print(f"❌ Journal compaction failed for {username}: {e}")
+    
+    def close(self):
+        """Flush cached changes, finish any queued compactions and stop the background threads."""
+        self.flush()
+        with self._user_locks_lock:
+            compactor, self._compactor = self._compactor, None
+            sweeper, self._session_sweeper = self._session_sweeper, None
+        if compactor is not None:
+            self._compact_queue.put(None)
+            compactor.join()
+        if sweeper is not None:
+            sweeper.stop()
+    
     def _create_default_user_data(self, username: str, email: str = None) -> Dict:
         """Create default user data structure."""
         return {
@@ -125,8 +560,12 @@ class UserManager:
             user_file.parent.mkdir(parents=True, exist_ok=True)
             print(f"✅ [DEBUG] Directory ensured to exist")
             
-            with open(user_file, 'w', encoding='utf-8') as f:
-                json.dump(user_data, f, indent=2, ensure_ascii=False)
+            # Check again under the user's lock so concurrent registrations can't both win
+            with self._user_lock(username):
+                if user_file.exists():
+                    print(f"❌ [DEBUG] User file was created concurrently!")
+                    return {"success": False, "error": "Username already exists"}
+                self._write_snapshot(user_file, user_data)
             
             print(f"✅ [DEBUG] User data written to file")
             
@@ -138,6 +577,7 @@ class UserManager:
                 print(f"❌ [DEBUG] File verification FAILED: file does not exist after writing!")
                 return {"success": False, "error": "Failed to create user file"}
             
+            self.catalog.update(user_data)
             print(f"✅ User registered: {username}")
             return {"success": True, "message": "User registered successfully"}
             
@@ -153,38 +593,28 @@ class UserManager:
     def login_user(self, username: str, password: str) -> Dict:
         """Login a user and return session token."""
         try:
-            user_file = self._get_user_file_path(username)
-            
-            if not user_file.exists():
-                return {"success": False, "error": "Invalid username or password"}
-            
             # Load user data
-            with open(user_file, 'r', encoding='utf-8') as f:
-                user_data = json.load(f)
-            
-            # Verify password
-            password_hash, _ = self._hash_password(password, user_data["salt"])
-            if password_hash != user_data["password_hash"]:
+            with self._user_lock(username):
+                user_data = self._get_user_data(username)
+                if user_data is None:
+                    return {"success": False, "error": "Invalid username or password"}
+                salt, expected_hash = user_data["salt"], user_data["password_hash"]
+            
+            # Verify password (slow on purpose, so outside the user's lock)
+            password_hash, _ = self._hash_password(password, salt)
+            if password_hash != expected_hash:
                 return {"success": False, "error": "Invalid username or password"}
             
             # Create session
             session_token = secrets.token_urlsafe(32)
-            session_data = {
-                "username": username,
-                "created_at": datetime.now().isoformat(),
-                "expires_at": (datetime.now() + timedelta(days=30)).isoformat()
-            }
-            self.sessions[session_token] = session_data
+            expires_at = time.time() + timedelta(days=USER_SESSION_DAYS).total_seconds()
+            self.session_store.put(session_token, username, expires_at)
             
-            # Update last login
-            user_data["last_login"] = datetime.now().isoformat()
-            
-            # Update streak
-            self._update_streak(user_data)
-            
-            # Save updated user data
-            with open(user_file, 'w', encoding='utf-8') as f:
-                json.dump(user_data, f, indent=2, ensure_ascii=False)
+            # Update last login and streak
+            with self._user_lock(username):
+                user_data = self._get_user_data(username)
+                self._record_change(username, user_data, {"op": "login", "at": datetime.now().isoformat()})
+                progress = copy.deepcopy(user_data["progress"])
             
             print(f"✅ User logged in: {username}")
             return {
@@ -192,8 +622,8 @@ class UserManager:
                 "token": session_token,
                 "user": {
                     "username": username,
-                    "progress": user_data["progress"],
-                    "preferences": user_data["progress"]["preferences"]
+                    "progress": progress,
+                    "preferences": progress["preferences"]
                 }
             }
             
@@ -201,9 +631,9 @@ class UserManager:
             print(f"❌ Login error: {e}")
             return {"success": False, "error": f"Login failed: {str(e)}"}
     
-    def _update_streak(self, user_data: Dict):
+    def _update_streak(self, user_data: Dict, today=None):
         """Update user's daily streak."""
-        today = datetime.now().date()
+        today = today or datetime.now().date()
         last_session = user_data["progress"].get("last_session_date")
         
         if last_session:
@@ -229,31 +659,10 @@ class UserManager:
             # Generate anonymous session token
             session_token = "anon_" + secrets.token_urlsafe(32)
             
-            # Create default progress structure for anonymous users
-            anonymous_progress = {
-                "known_cards": [],
-                "learning_cards": [],
-                "total_sessions": 1,
-                "total_cards_learned": 0,
-                "streak_days": 1,
-                "last_session_date": datetime.now().date().isoformat(),
-                "preferences": {
-                    "theme": "dark",
-                    "auto_play_audio": True,
-                    "show_pronunciation": True,
-                    "cards_per_session": 20,
-                    "last_card_index": 0
-                }
-            }
+            # Store the anonymous session with default progress
+            anonymous_progress = self.anonymous_store.create(session_token)
             
-            # Store the anonymous session
-            self.anonymous_sessions[session_token] = {
-                "created_at": datetime.now().isoformat(),
-                "expires_at": (datetime.now() + timedelta(days=7)).isoformat(),  # Anonymous sessions last 7 days
-                "progress": anonymous_progress
-            }
-            
-            print(f"✅ Anonymous session created: {session_token[:15]}...")
+            print(f"✅ Anonymous session created")
             return {
                 "success": True,
                 "token": session_token,
@@ -266,59 +675,35 @@ class UserManager:
     
     def validate_session(self, session_token: str) -> Optional[str]:
         """Validate session token and return username if valid."""
-        print(f"🔍 [SESSION DEBUG] Validating token: {session_token[:20]}...")
-        print(f"🔍 [SESSION DEBUG] Active sessions: {len(self.sessions)}")
-        print(f"🔍 [SESSION DEBUG] Session tokens: {[token[:20] + '...' for token in self.sessions.keys()]}")
-        
         # Check if this is an anonymous session
-        if session_token.startswith("anon_") and session_token in self.anonymous_sessions:
-            print(f"🔍 [SESSION DEBUG] Anonymous session found")
-            anon_session = self.anonymous_sessions[session_token]
-            
-            # Check if anonymous session is expired
-            expires_at = datetime.fromisoformat(anon_session["expires_at"])
-            if datetime.now() > expires_at:
-                print(f"❌ [SESSION DEBUG] Anonymous session expired, removing")
-                del self.anonymous_sessions[session_token]
-                return None
-                
-            print(f"✅ [SESSION DEBUG] Valid anonymous session")
+        if session_token.startswith("anon_") and self.anonymous_store.exists(session_token):
             return None  # Return None for anonymous users, but the session is valid
         
-        # Regular user session validation
-        if session_token not in self.sessions:
-            print(f"❌ [SESSION DEBUG] Token not found in active sessions")
-            return None
-        
-        session = self.sessions[session_token]
-        expires_at = datetime.fromisoformat(session["expires_at"])
-        now = datetime.now()
-        
-        print(f"🔍 [SESSION DEBUG] Session expires at: {expires_at}")
-        print(f"🔍 [SESSION DEBUG] Current time: {now}")
-        print(f"🔍 [SESSION DEBUG] Time until expiry: {expires_at - now}")
-        
-        if now > expires_at:
-            print(f"❌ [SESSION DEBUG] Session expired, removing from memory")
-            del self.sessions[session_token]
-            return None
-        
-        username = session["username"]
-        print(f"✅ [SESSION DEBUG] Valid session for user: {username}")
-        return username
+        session = self.session_store.get(session_token)
+        return session.username if session is not None else None
     
     def get_anonymous_progress(self, session_token: str) -> Optional[Dict]:
         """Get progress for an anonymous user."""
-        if not session_token.startswith("anon_") or session_token not in self.anonymous_sessions:
+        if not session_token.startswith("anon_"):
             return None
             
-        return self.anonymous_sessions[session_token].get("progress", {})
+        return self.anonymous_store.progress(session_token)
+    
+    def save_anonymous_progress(self, session_token: str, progress_data: Dict) -> bool:
+        """Merge progress into an anonymous session.
+        
+        Raises ValueError if the progress names cards that aren't in the deck.
+        """
+        if not session_token.startswith("anon_"):
+            return False
+        
+        return self.anonymous_store.update(session_token, progress_data)
     
     def logout_user(self, session_token: str) -> Dict:
         """Logout a user by invalidating their session."""
-        if session_token in self.sessions:
-            username = self.sessions[session_token]["username"]
-            del self.sessions[session_token]
+        session = self.session_store.delete(session_token)
+        if session is not None:
+            username = session.username
             print(f"✅ User logged out: {username}")
             return {"success": True, "message": "Logged out successfully"}
         
@@ -327,89 +712,105 @@ class UserManager:
     def get_user_progress(self, username: str) -> Optional[Dict]:
         """Get user progress data."""
         try:
-            user_file = self._get_user_file_path(username)
-            if not user_file.exists():
-                return None
-            
-            with open(user_file, 'r', encoding='utf-8') as f:
-                user_data = json.load(f)
-            
-            return user_data["progress"]
+            with self._user_lock(username):
+                user_data = self._get_user_data(username)
+                if user_data is None:
+                    return None
+                
+                return copy.deepcopy(user_data["progress"])
             
         except Exception as e:
             print(f"❌ Error loading user progress: {e}")
             return None
     
+    def _merge_progress(self, user_data: Dict, progress_data: Dict, today=None):
+        """Merge saved progress into a user document and update its statistics."""
+        old_known_count = len(user_data["progress"]["known_cards"])
+        user_data["progress"].update(progress_data)
+        reviewed = len(progress_data.get("known_cards", [])) + len(progress_data.get("learning_cards", []))
+        self._count_progress_save(user_data, old_known_count, reviewed, today)
+    
+    @staticmethod
+    def _progress_delta(progress: Dict, progress_data: Dict) -> Dict:
+        """The change saving progress_data makes to progress, for a journal record.
+        
+        Card lists become the IDs added and removed, and other fields are
+        only included if their value changed, so a record's size follows
+        the change rather than the user's history.
+        """
+        delta = {}
+        for key in CARD_LISTS:
+            if key not in progress_data:
+                continue
+            old, new = progress.get(key, []), progress_data[key]
+            old_ids, new_ids = set(old), set(new)
+            added = [card_id for card_id in new if card_id not in old_ids]
+            removed = [card_id for card_id in old if card_id not in new_ids]
+            if added or removed:
+                delta[key] = {"add": added, "remove": removed}
+        changed = {key: value for key, value in progress_data.items()
+                   if key not in CARD_LISTS and progress.get(key) != value}
+        if changed:
+            delta["set"] = changed
+        delta["reviewed"] = len(progress_data.get("known_cards", [])) + len(progress_data.get("learning_cards", []))
+        return delta
+    
+    def _apply_progress_delta(self, user_data: Dict, record: Dict, today=None):
+        """Apply a progress record from _progress_delta() and update statistics."""
+        progress = user_data["progress"]
+        old_known_count = len(progress["known_cards"])
+        for key in CARD_LISTS:
+            change = record.get(key)
+            if change:
+                removed = set(change["remove"])
+                progress[key] = [card_id for card_id in progress.get(key, []) if card_id not in removed] + change["add"]
+        progress.update(copy.deepcopy(record.get("set", {})))
+        self._count_progress_save(user_data, old_known_count, record.get("reviewed", 0), today)
+    
+    def _count_progress_save(self, user_data: Dict, old_known_count: int, reviewed: int, today=None):
+        """Update statistics and counters for one progress save."""
+        today = (today or datetime.now().date()).isoformat()
+        new_known_count = len(user_data["progress"]["known_cards"])
+        
+        # Update statistics
+        sessions_by_date = user_data["statistics"]["sessions_by_date"]
+        if today not in sessions_by_date:
+            sessions_by_date[today] = {
+                "sessions": 0,
+                "new_cards_learned": 0,
+                "cards_reviewed": 0
+            }
+        
+        session_data = sessions_by_date[today]
+        session_data["sessions"] += 1
+        session_data["new_cards_learned"] += max(0, new_known_count - old_known_count)
+        session_data["cards_reviewed"] += reviewed
+        
+        # Update total counters
+        user_data["progress"]["total_sessions"] += 1
+        user_data["progress"]["total_cards_learned"] = new_known_count
+    
     def save_user_progress(self, username: str, progress_data: Dict) -> bool:
-        """Save user progress data."""
+        """Save user progress data as one journal record holding only what changed."""
         print(f"🔍 [DEBUG] Starting progress save for user: '{username}'")
         print(f"🔍 [DEBUG] Progress data keys: {list(progress_data.keys())}")
         
         try:
-            user_file = self._get_user_file_path(username)
-            print(f"🔍 [DEBUG] User file path: {user_file}")
-            print(f"🔍 [DEBUG] User file exists: {user_file.exists()}")
-            
-            if not user_file.exists():
-                print(f"❌ [DEBUG] User file does not exist!")
-                return False
-            
-            print(f"🔍 [DEBUG] Loading existing user data...")
-            with open(user_file, 'r', encoding='utf-8') as f:
-                user_data = json.load(f)
-            
-            print(f"✅ [DEBUG] Existing user data loaded")
-            print(f"🔍 [DEBUG] Current known cards: {len(user_data['progress']['known_cards'])}")
-            print(f"🔍 [DEBUG] Current learning cards: {len(user_data['progress']['learning_cards'])}")
-            
-            # Update progress
-            old_known_count = len(user_data["progress"]["known_cards"])
-            print(f"🔍 [DEBUG] Updating progress data...")
-            user_data["progress"].update(progress_data)
-            new_known_count = len(user_data["progress"]["known_cards"])
+            with self._user_lock(username):
+                user_data = self._get_user_data(username)
+                if user_data is None:
+                    print(f"❌ [DEBUG] User file does not exist!")
+                    return False
+                
+                old_known_count = len(user_data["progress"]["known_cards"])
+                record = {"op": "progress", "at": datetime.now().isoformat()}
+                record.update(self._progress_delta(user_data["progress"], progress_data))
+                self._record_change(username, user_data, record)
+                new_known_count = len(user_data["progress"]["known_cards"])
+                total_sessions = user_data["progress"]["total_sessions"]
             
             print(f"🔍 [DEBUG] Known cards: {old_known_count} -> {new_known_count}")
-            print(f"🔍 [DEBUG] Learning cards: {len(user_data['progress']['learning_cards'])}")
-            
-            # Update statistics
-            today = datetime.now().date().isoformat()
-            print(f"🔍 [DEBUG] Updating statistics for date: {today}")
-            
-            if today not in user_data["statistics"]["sessions_by_date"]:
-                user_data["statistics"]["sessions_by_date"][today] = {
-                    "sessions": 0,
-                    "new_cards_learned": 0,
-                    "cards_reviewed": 0
-                }
-                print(f"✅ [DEBUG] Created new session entry for today")
-            
-            session_data = user_data["statistics"]["sessions_by_date"][today]
-            session_data["sessions"] += 1
-            session_data["new_cards_learned"] += max(0, new_known_count - old_known_count)
-            session_data["cards_reviewed"] += len(progress_data.get("known_cards", [])) + len(progress_data.get("learning_cards", []))
-            
-            print(f"🔍 [DEBUG] Session stats updated: sessions={session_data['sessions']}, new_learned={session_data['new_cards_learned']}")
-            
-            # Update total counters
-            user_data["progress"]["total_sessions"] += 1
-            user_data["progress"]["total_cards_learned"] = len(user_data["progress"]["known_cards"])
-            
-            print(f"🔍 [DEBUG] Total sessions: {user_data['progress']['total_sessions']}")
-            print(f"🔍 [DEBUG] Total cards learned: {user_data['progress']['total_cards_learned']}")
-            
-            # Save updated data
-            print(f"🔍 [DEBUG] Saving updated data to file...")
-            with open(user_file, 'w', encoding='utf-8') as f:
-                json.dump(user_data, f, indent=2, ensure_ascii=False)
-            
-            # Verify save
-            if user_file.exists():
-                file_size = user_file.stat().st_size
-                print(f"✅ [DEBUG] File save verification: size={file_size} bytes")
-            else:
-                print(f"❌ [DEBUG] File save verification FAILED!")
-                return False
-            
+            print(f"🔍 [DEBUG] Total sessions: {total_sessions}")
             print(f"✅ Progress saved for user: {username}")
             return True
             
@@ -425,20 +826,18 @@ class UserManager:
     def get_user_statistics(self, username: str) -> Optional[Dict]:
         """Get user statistics."""
         try:
-            user_file = self._get_user_file_path(username)
-            if not user_file.exists():
-                return None
-            
-            with open(user_file, 'r', encoding='utf-8') as f:
-                user_data = json.load(f)
-            
-            stats = user_data["statistics"].copy()
-            stats["progress_summary"] = {
-                "total_known": len(user_data["progress"]["known_cards"]),
-                "total_learning": len(user_data["progress"]["learning_cards"]),
-                "streak_days": user_data["progress"]["streak_days"],
-                "total_sessions": user_data["progress"]["total_sessions"]
-            }
+            with self._user_lock(username):
+                user_data = self._get_user_data(username)
+                if user_data is None:
+                    return None
+                
+                stats = copy.deepcopy(user_data["statistics"])
+                stats["progress_summary"] = {
+                    "total_known": len(user_data["progress"]["known_cards"]),
+                    "total_learning": len(user_data["progress"]["learning_cards"]),
+                    "streak_days": user_data["progress"]["streak_days"],
+                    "total_sessions": user_data["progress"]["total_sessions"]
+                }
             
             return stats
             
@@ -446,78 +845,82 @@ class UserManager:
             print(f"❌ Error loading user statistics: {e}")
             return None
     
-    def list_users(self) -> List[Dict]:
-        """List all users (admin function)."""
-        users = []
+    def list_users(self, sort: str = "created_at", order: str = "desc", limit: int = DEFAULT_USERS_PAGE,
+                   after: tuple = None, prefix: str = None, active_since: str = None) -> Dict:
+        """List users a page at a time (admin function).
+        
+        Served from the catalog index; pass the returned next_cursor, decoded,
+        as `after` to get the following page.
+        """
+        return self.catalog.page(sort, order, limit, after, prefix, active_since)
+    
+    def rebuild_catalog(self):
+        """Rebuild the user catalog by reading every user file."""
+        documents = []
         for user_file in self.users_dir.glob("*.json"):
             try:
-                with open(user_file, 'r', encoding='utf-8') as f:
-                    user_data = json.load(f)
-                
-                users.append({
-                    "username": user_data["username"],
-                    "created_at": user_data["created_at"],
-                    "last_login": user_data.get("last_login"),
-                    "total_sessions": user_data["progress"]["total_sessions"],
-                    "cards_learned": len(user_data["progress"]["known_cards"])
-                })
+                user_data = self._load_user_data(user_file.stem)
+                if user_data is not None:
+                    documents.append(user_data)
             except Exception as e:
                 print(f"❌ Error reading user file {user_file}: {e}")
         
-        return sorted(users, key=lambda x: x["created_at"], reverse=True)
+        self.catalog.rebuild(documents)
+        print(f"✅ User catalog rebuilt: {len(documents)} users")
     
     def transfer_anonymous_progress(self, anonymous_token: str, username: str) -> bool:
         """Transfer anonymous progress to a user account."""
         print(f"🔍 [DEBUG] Starting transfer of anonymous progress to user: {username}")
         
         # Check if anonymous session exists
-        if not anonymous_token.startswith("anon_") or anonymous_token not in self.anonymous_sessions:
+        anonymous_progress = self.get_anonymous_progress(anonymous_token)
+        if anonymous_progress is None:
             print(f"❌ [DEBUG] Invalid anonymous session token")
             return False
         
         try:
-            # Get anonymous progress
-            anonymous_progress = self.anonymous_sessions[anonymous_token].get("progress", {})
-            print(f"🔍 [DEBUG] Anonymous progress retrieved:")
-            print(f"🔍 [DEBUG] - Known cards: {len(anonymous_progress.get('known_cards', []))}")
-            print(f"🔍 [DEBUG] - Learning cards: {len(anonymous_progress.get('learning_cards', []))}")
-            
-            # Get user progress
-            user_progress = self.get_user_progress(username)
-            if not user_progress:
-                print(f"❌ [DEBUG] User progress not found")
-                return False
-            
-            print(f"🔍 [DEBUG] Current user progress:")
-            print(f"🔍 [DEBUG] - Known cards: {len(user_progress.get('known_cards', []))}")
-            print(f"🔍 [DEBUG] - Learning cards: {len(user_progress.get('learning_cards', []))}")
-            
-            # Merge known and learning cards
-            user_progress["known_cards"] = list(set(user_progress.get("known_cards", []) + anonymous_progress.get("known_cards", [])))
-            user_progress["learning_cards"] = list(set(user_progress.get("learning_cards", []) + anonymous_progress.get("learning_cards", [])))
-            
-            # Merge preferences if they don't exist
-            user_prefs = user_progress.get("preferences", {})
-            anon_prefs = anonymous_progress.get("preferences", {})
-            
-            for key, value in anon_prefs.items():
-                if key not in user_prefs:
-                    user_prefs[key] = value
-            
-            user_progress["preferences"] = user_prefs
-            
-            # Save the merged progress
-            success = self.save_user_progress(username, user_progress)
-            
-            if success:
-                print(f"✅ [DEBUG] Anonymous progress transferred to user account")
-                # Delete anonymous session after transfer
-                del self.anonymous_sessions[anonymous_token]
-                return True
-            else:
-                print(f"❌ [DEBUG] Failed to save merged progress")
-                return False
+            # Hold the user's lock so no other save lands between reading and writing their progress
+            with self._user_lock(username):
+                print(f"🔍 [DEBUG] Anonymous progress retrieved:")
+                print(f"🔍 [DEBUG] - Known cards: {len(anonymous_progress.get('known_cards', []))}")
+                print(f"🔍 [DEBUG] - Learning cards: {len(anonymous_progress.get('learning_cards', []))}")
+                
+                # Get user progress
+                user_progress = self.get_user_progress(username)
+                if not user_progress:
+                    print(f"❌ [DEBUG] User progress not found")
+                    return False
+                
+                print(f"🔍 [DEBUG] Current user progress:")
+                print(f"🔍 [DEBUG] - Known cards: {len(user_progress.get('known_cards', []))}")
+                print(f"🔍 [DEBUG] - Learning cards: {len(user_progress.get('learning_cards', []))}")
+                
+                # Merge known and learning cards
+                user_progress["known_cards"] = list(set(user_progress.get("known_cards", []) + anonymous_progress.get("known_cards", [])))
+                user_progress["learning_cards"] = list(set(user_progress.get("learning_cards", []) + anonymous_progress.get("learning_cards", [])))
+                
+                # Merge preferences if they don't exist
+                user_prefs = user_progress.get("preferences", {})
+                anon_prefs = anonymous_progress.get("preferences", {})
+                
+                for key, value in anon_prefs.items():
+                    if key not in user_prefs:
+                        user_prefs[key] = value
+                
+                user_progress["preferences"] = user_prefs
+                
+                # Save the merged progress
+                success = self.save_user_progress(username, user_progress)
                 
+                if success:
+                    print(f"✅ [DEBUG] Anonymous progress transferred to user account")
+                    # Delete anonymous session after transfer
+                    self.anonymous_store.pop(anonymous_token)
+                    return True
+                else:
+                    print(f"❌ [DEBUG] Failed to save merged progress")
+                    return False
+                    
         except Exception as e:
             print(f"❌ Error transferring anonymous progress: {e}")
             return False
@@ -569,8 +972,8 @@ if __name__ == "__main__":
         
         # Test anonymous progress saving
         anon_progress = {
-            "known_cards": ["anon_card_1"],
-            "learning_cards": ["anon_card_2"]
+            "known_cards": ["card_1"],
+            "learning_cards": ["card_2"]
         }
         anon_success = user_manager.save_anonymous_progress(anon_token, anon_progress)
         print(f"Anonymous progress saved: {anon_success}")